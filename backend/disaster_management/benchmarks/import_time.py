@@ -0,0 +1,63 @@
+# benchmarks/import_time.py
+"""
+Cold-start cost of `import main`, i.e. what a fresh instance pays before it
+can run its startup hooks and accept traffic.
+
+Each run is a new interpreter. Reports the median wall time over the runs,
+the modules with the most cumulative time from one `-X importtime` run, and
+which of the heavy optional dependencies were imported at all (they should
+only load on first use now).
+
+Run from backend/disaster_management:
+    python benchmarks/import_time.py [runs]
+
+On the same machine: 993 ms before Firebase/Firestore, shapely, geopy,
+requests, flask, pytz and uvicorn were taken off the import path, ~410 ms
+after.
+"""
+import os
+import statistics
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY = ("firebase_admin", "google.cloud.firestore", "google.api_core", "grpc",
+         "shapely", "geopy", "requests", "flask", "pytz", "uvicorn")
+
+TIMED = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+LOADED = f"import sys, main; print(','.join(m for m in {HEAVY!r} if m in sys.modules))"
+
+
+def run(code: str, *flags) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, "-W", "ignore", *flags, "-c", code],
+        cwd=APP_DIR, capture_output=True, text=True, check=True,
+    )
+
+
+def top_imports(n: int = 15) -> list:
+    """(cumulative µs, module) for the slowest imports, from one -X importtime run."""
+    rows = []
+    for line in run("import main", "-X", "importtime").stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        rows.append((int(cumulative), name.rstrip()))
+    return sorted(rows, reverse=True)[:n]
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 7
+    times = [float(run(TIMED).stdout) * 1000 for _ in range(runs)]
+    print(f"import main: median {statistics.median(times):.0f} ms, "
+          f"min {min(times):.0f} ms over {runs} fresh interpreters")
+    print("\nslowest imports (cumulative ms):")
+    for cumulative, name in top_imports():
+        print(f"{cumulative / 1000:>9.1f}  {name}")
+    loaded = run(LOADED).stdout.strip()
+    print(f"\nheavy modules imported at startup: {loaded or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
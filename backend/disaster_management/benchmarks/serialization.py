@@ -0,0 +1,89 @@
+# benchmarks/serialization.py
+"""
+Per-record cost of turning Firestore documents into a list response.
+
+"before" is the old path: a model built per document in the handler, then
+FastAPI's response_model handling (dump the models, validate the dicts
+again, serialize to JSON-able Python, json.dumps). "validated" is
+utils/serialization.encode_list: one TypeAdapter pass that validates and
+encodes. "trusted" is the TRUST_FIRESTORE_DATA path, which only reshapes
+each document before orjson encodes it.
+
+Run from backend/disaster_management:
+    python benchmarks/serialization.py [records]
+"""
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydantic import TypeAdapter
+
+from schemas.messages import MessageBase
+from schemas.user import UserResponse
+from utils.serialization import encode_list, orjson
+
+
+def message_docs(n: int) -> list:
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    return [{
+        "Sender": f"+9198765{i:05d}",
+        "Type": 101,
+        "Battery": i % 100,
+        "Timestamp": start + timedelta(seconds=i),
+        "Message": "Need help, water rising near the bridge",
+        "location": {"latitude": 19.07 + i * 1e-5, "longitude": 72.87 - i * 1e-5},
+    } for i in range(n)]
+
+
+def user_docs(n: int) -> list:
+    return [{
+        "userId": f"user{i}",
+        "name": f"User {i}",
+        "dob": "1990-01-01",
+        "age": 35,
+        "gender": "Female",
+        "contactNo": f"+9198765{i:05d}",
+        "city": "Kalyan",
+        "status": "Active",
+        "bloodGroup": "O+",
+        "location": {"latitude": 19.24, "longitude": 73.13},
+    } for i in range(n)]
+
+
+def before(model, docs: list) -> bytes:
+    models = [model.model_validate(doc) for doc in docs]
+    # what FastAPI's serialize_response does with a list response_model
+    adapter = TypeAdapter(list[model])
+    content = [m.model_dump(by_alias=True) for m in models]
+    validated = adapter.validate_python(content)
+    return json.dumps(adapter.dump_python(validated, mode="json", by_alias=True)).encode()
+
+
+def per_record_us(fn, docs: list, repeat: int = 5) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(docs)
+        best = min(best, time.perf_counter() - start)
+    return best / len(docs) * 1e6
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    print(f"{n} records, orjson {'on' if orjson else 'off'}; best of 5, µs per record")
+    print(f"{'model':<12}{'before':>10}{'validated':>12}{'trusted':>10}")
+    for model, docs in ((MessageBase, message_docs(n)), (UserResponse, user_docs(n))):
+        times = [
+            per_record_us(lambda d: before(model, d), docs),
+            per_record_us(lambda d: encode_list(model, d, trusted=False), docs),
+            per_record_us(lambda d: encode_list(model, d, trusted=True), docs),
+        ]
+        print(f"{model.__name__:<12}" + "".join(f"{t:>{w}.2f}" for t, w in zip(times, (10, 12, 10))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+# benchmarks/sms_payload.py
+"""
+Compares SMS cost of the team victim list formats. bytes/victim is the
+encoded payload before base64; the fixed binary format carries only phone,
+name and age, while DL2 also carries status and coordinates.
+
+Run from backend/disaster_management:
+    python benchmarks/sms_payload.py
+"""
+import base64
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.sms_codec import (  # noqa: E402
+    encode_victim_list,
+    encode_victim_list_sms,
+    decode_victim_list_sms,
+    pack_victims_to_binary_base64,
+    sms_segment_count,
+)
+
+PREFIX = "DISASTERLINKx9050 "
+FIRST_NAMES = ["Aarav", "Saanvi", "Advik", "Ananya", "Vivaan", "Diya", "Kabir", "Isha"]
+LAST_NAMES = ["Sharma", "Patel", "Singh", "Reddy", "Kumar"]
+STATUSES = ["Active", "Needs Help", "Critical"]
+
+
+def make_victims(n: int, lat: float, lon: float) -> list:
+    rng = random.Random(n)
+    return [
+        {
+            "phone": f"+91{rng.randint(7000000000, 9999999999)}",
+            "name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            "age": rng.randint(2, 90),
+            "status": rng.choice(STATUSES),
+            "latitude": lat + rng.uniform(-0.03, 0.03),
+            "longitude": lon + rng.uniform(-0.03, 0.03),
+        }
+        for _ in range(n)
+    ]
+
+
+def legacy_json_messages(victims: list) -> list:
+    # one msg "98" SMS per victim, as assign_team used to send
+    return [
+        f'{PREFIX}{{"msg": "98", "victim": "{v["phone"]},{v["name"]},{v["age"]},{v["status"]};"}}'
+        for v in victims
+    ]
+
+
+def main():
+    lat, lon = 19.0760, 72.8777
+    print(f"{'victims':>8} {'format':<22} {'chars':>7} {'bytes/victim':>13} {'segments':>9}")
+    for n in (5, 20, 50, 100):
+        victims = make_victims(n, lat, lon)
+
+        legacy = legacy_json_messages(victims)
+        legacy_chars = sum(len(m) for m in legacy)
+        print(f"{n:>8} {'json per victim':<22} {legacy_chars:>7} {legacy_chars / n:>13.1f} "
+              f"{sum(sms_segment_count(m) for m in legacy):>9}")
+
+        packed_b64 = pack_victims_to_binary_base64(
+            [{**v, "phone": v["phone"].lstrip("+")} for v in victims]
+        )
+        packed = PREFIX + packed_b64
+        packed_bytes = len(base64.b64decode(packed_b64))
+        print(f"{n:>8} {'fixed binary (base64)':<22} {len(packed):>7} {packed_bytes / n:>13.1f} "
+              f"{sms_segment_count(packed):>9}")
+
+        raw = encode_victim_list(victims, lat, lon)
+        messages = encode_victim_list_sms(victims, lat, lon, prefix=PREFIX)
+        chars = sum(len(m) for m in messages)
+        assert len(decode_victim_list_sms(messages)) == n
+        print(f"{n:>8} {'varint delta (DL2)':<22} {chars:>7} {len(raw) / n:>13.1f} "
+              f"{sum(sms_segment_count(m) for m in messages):>9}")
+
+
+if __name__ == "__main__":
+    main()
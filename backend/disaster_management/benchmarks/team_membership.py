@@ -0,0 +1,237 @@
+# benchmarks/team_membership.py
+"""
+Round-trips, writes and latency of team create / re-staff / delete: the
+old per-rescuer update loop against the transactional version in
+services/team_membership.py.
+
+Firestore is replaced by an in-memory simulation that sleeps RTT_MS per
+RPC, so the numbers show how latency scales with team size rather than
+measuring a real project. The writes column includes the tombstone the
+transactional delete leaves for the change feed, which the old loop
+never wrote; the tombstones column counts it on its own.
+
+Run from backend/disaster_management:
+    python benchmarks/team_membership.py [rtt_ms]
+"""
+import os
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class NotFound(Exception):
+    pass
+
+
+class SimulatedFirestore:
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        self.docs = {}
+        self.rpcs = 0
+        self.writes = 0
+        self.tombstones = 0
+
+    def rpc(self):
+        self.rpcs += 1
+        time.sleep(self.rtt)
+
+    def wrote(self, path):
+        self.writes += 1
+        if path.startswith(f"{TOMBSTONES}/"):
+            self.tombstones += 1
+
+    def collection(self, name):
+        return SimCollection(self, name)
+
+    def get_all(self, refs, field_paths=None, transaction=None):
+        self.rpc()
+        return [SimSnapshot(ref.id, self.docs.get(ref.path)) for ref in refs]
+
+    def transaction(self):
+        return SimTransaction(self)
+
+
+class SimCollection:
+    def __init__(self, store, name):
+        self.store = store
+        self.name = name
+
+    def document(self, doc_id):
+        return SimDocRef(self.store, f"{self.name}/{doc_id}", doc_id)
+
+
+class SimSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self._data = data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class SimDocRef:
+    def __init__(self, store, path, doc_id):
+        self.store = store
+        self.path = path
+        self.id = doc_id
+
+    def get(self, transaction=None):
+        self.store.rpc()
+        return SimSnapshot(self.id, self.store.docs.get(self.path))
+
+    def set(self, data):
+        self.store.rpc()
+        self.store.wrote(self.path)
+        self.store.docs[self.path] = dict(data)
+
+    def update(self, fields):
+        self.store.rpc()
+        if self.path not in self.store.docs:
+            raise NotFound(self.path)
+        self.store.wrote(self.path)
+        self.store.docs[self.path].update(fields)
+
+    def delete(self):
+        self.store.rpc()
+        self.store.wrote(self.path)
+        self.store.docs.pop(self.path, None)
+
+
+class SimTransaction:
+    def __init__(self, store):
+        self.store = store
+        self._ops = []
+
+    def create(self, ref, data):
+        self._ops.append(("set", ref, data))
+
+    def set(self, ref, data):
+        self._ops.append(("set", ref, data))
+
+    def update(self, ref, fields):
+        self._ops.append(("update", ref, fields))
+
+    def delete(self, ref):
+        self._ops.append(("delete", ref, None))
+
+    def commit(self):
+        self.store.rpc()
+        docs = self.store.docs
+        for kind, ref, data in self._ops:
+            if kind == "update" and ref.path not in docs:
+                raise NotFound(ref.path)
+        for kind, ref, data in self._ops:
+            self.store.wrote(ref.path)
+            if kind == "set":
+                docs[ref.path] = dict(data)
+            elif kind == "update":
+                docs[ref.path].update(data)
+            else:
+                docs.pop(ref.path, None)
+
+
+def transactional(fn):
+    def run(transaction, *args, **kwargs):
+        transaction.store.rpc()  # BeginTransaction
+        result = fn(transaction, *args, **kwargs)
+        transaction.commit()
+        return result
+    return run
+
+
+RTT_MS = float(sys.argv[1]) if len(sys.argv) > 1 else 20.0
+store = SimulatedFirestore(RTT_MS / 1000)
+sys.modules["firebase"] = types.SimpleNamespace(db=store, firestore=types.SimpleNamespace(transactional=transactional))
+
+from config import settings  # noqa: E402
+from schemas.rescue import TeamStatus  # noqa: E402
+from services import team_membership  # noqa: E402
+
+TEAMS = settings.FIREBASE_COLLECTION_RESCUE_TEAMS
+RESCUERS = settings.FIREBASE_COLLECTION_RESCUERS
+TOMBSTONES = settings.FIREBASE_COLLECTION_TOMBSTONES
+ASSIGNED = {"status": TeamStatus.ASSIGNED.value}
+FREE = {"teamId": None, "teamName": None, "status": TeamStatus.FREE.value}
+
+
+# ---------- the per-rescuer loops the routers used before ----------
+
+def legacy_create(team_data):
+    store.collection(TEAMS).document(team_data["teamId"]).set(team_data)
+    for member_id in team_data["members"]:
+        try:
+            store.collection(RESCUERS).document(member_id).update(
+                {"teamId": team_data["teamId"], "teamName": team_data["teamName"], **ASSIGNED})
+        except Exception:
+            pass
+
+
+def legacy_update(team_id, update_data):
+    team_ref = store.collection(TEAMS).document(team_id)
+    team_ref.get()
+    team_doc = team_ref.get().to_dict()
+    new_members = set(update_data["members"])
+    for member_id in set(team_doc["members"]) - new_members:
+        try:
+            store.collection(RESCUERS).document(member_id).update(FREE)
+        except Exception:
+            pass
+    for member_id in new_members:
+        try:
+            store.collection(RESCUERS).document(member_id).update(
+                {"teamId": team_id, "teamName": team_doc["teamName"], **ASSIGNED})
+        except Exception:
+            pass
+    team_ref.update(update_data)
+
+
+def legacy_delete(team_id):
+    team_ref = store.collection(TEAMS).document(team_id)
+    team_doc = team_ref.get().to_dict()
+    for member_id in team_doc["members"]:
+        try:
+            store.collection(RESCUERS).document(member_id).update(FREE)
+        except Exception:
+            pass
+    team_ref.delete()
+
+
+# ---------- harness ----------
+
+def seed_rescuers(n):
+    store.docs = {f"{RESCUERS}/r{i}": {"id": f"r{i}", "status": "Free"} for i in range(2 * n)}
+
+
+def measure(label, n, fn):
+    store.rpcs = store.writes = store.tombstones = 0
+    start = time.perf_counter()
+    fn()
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    print(f"{n:>6} {label:<22} {store.rpcs:>6} {store.writes:>7} {store.tombstones:>10} {elapsed_ms:>10.1f}")
+
+
+def main():
+    print(f"simulated round-trip: {RTT_MS:.0f} ms")
+    print(f"{'team':>6} {'operation':<22} {'RPCs':>6} {'writes':>7} {'tombstones':>10} {'ms':>10}")
+    for n in (5, 30, 100):
+        members = [f"r{i}" for i in range(n)]
+        # re-staffing swaps out half the team
+        restaffed = members[n // 2:] + [f"r{i}" for i in range(n, n + n // 2)]
+
+        for label, create, update, delete in (
+            ("legacy", legacy_create, legacy_update, legacy_delete),
+            ("transaction", team_membership.create_team, team_membership.update_team, team_membership.delete_team),
+        ):
+            seed_rescuers(n)
+            team = {"teamId": "t1", "teamName": "Alpha", "leader": None, "members": members}
+            measure(f"create ({label})", n, lambda: create(dict(team)))
+            measure(f"re-staff ({label})", n, lambda: update("t1", {"members": restaffed}))
+            measure(f"delete ({label})", n, lambda: delete("t1"))
+        print()
+
+
+if __name__ == "__main__":
+    main()
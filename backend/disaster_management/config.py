@@ -19,6 +19,86 @@ class Settings(BaseSettings):
     FIREBASE_COLLECTION_INCIDENTS: str = "incidents"
     FIREBASE_COLLECTION_MESSAGES: str = "Messages"
     FIREBASE_COLLECTION_Admins: str = "admins"
+    FIREBASE_COLLECTION_TOMBSTONES: str = "tombstones"  # deleted documents, for GET /api/changes
+
+    # Location updates are coalesced in memory and flushed on this interval.
+    # 0 writes every update straight through.
+    LOCATION_FLUSH_INTERVAL_SECONDS: float = 2.0
+    LOCATION_BUFFER_MAX_PENDING: int = 500  # flush early once this many documents are dirty
+    LOCATION_FLUSH_MAX_ATTEMPTS: int = 5  # a failing update is retried with backoff, then dropped
+
+    # Repeated SOS from one sender within this window fold into one message
+    # and get at most one shelter reply
+    SOS_DEDUP_WINDOW_SECONDS: float = 120.0
+
+    # Country code assumed for national-format phone numbers (India)
+    DEFAULT_COUNTRY_CODE: str = "91"
+
+    # Shared state (SMS queue, OTPs, SOS dedup): "memory" for a single
+    # worker, "sqlite" to share it between uvicorn workers on one host
+    STATE_BACKEND: str = "memory"
+    STATE_SQLITE_PATH: str = "state.sqlite3"
+
+    # Blocking Firestore / HTTP calls from async handlers run on a pool of this size
+    BLOCKING_IO_THREADS: int = 32
+    # Report event-loop stalls longer than this, with the blocking stack
+    LOOP_LAG_THRESHOLD_SECONDS: float = 0.25
+    LOOP_LAG_CHECK_INTERVAL_SECONDS: float = 0.1
+
+    # List endpoints return pages of this size unless ?limit= asks otherwise
+    DEFAULT_PAGE_SIZE: int = 500
+    MAX_PAGE_SIZE: int = 1000
+    # Streamed exports read Firestore in batches of this many documents
+    STREAM_BATCH_SIZE: int = 1000
+    # List responses encode Firestore documents without validating them against the response model
+    TRUST_FIRESTORE_DATA: bool = False
+
+    # Requests reading more Firestore documents than this are logged with their op counts
+    FIRESTORE_READ_BUDGET: int = 1000
+    # Debug: add X-Firestore-Reads/-Writes/-Queries headers to every response
+    FIRESTORE_OPS_HEADERS: bool = False
+
+    # Operator endpoints under /api/admin need this token in X-Admin-Token; empty disables them
+    ADMIN_TOKEN: str = ""
+    PROFILE_MAX_SECONDS: float = 60.0
+
+    # Logging: LOG_LEVELS overrides per module, e.g. "routers.sms=DEBUG,services=WARNING"
+    LOG_LEVEL: str = "INFO"
+    LOG_LEVELS: str = ""
+    LOG_FORMAT: str = "text"  # or "json"
+    # per-record debug lines are sampled to this many per second per call site
+    LOG_SAMPLE_PER_SECOND: float = 5.0
+
+    # Victim, shelter and team positions are kept in memory for radius queries and snapshotted
+    # here, so a restart reads only what changed since the snapshot instead of every document
+    INDEX_SNAPSHOT_DIR: str = "index_snapshot"
+    INDEX_SNAPSHOT_INTERVAL_SECONDS: float = 300.0
+    INDEX_SNAPSHOT_MAX_AGE_SECONDS: float = 86400.0  # rescan a layer fully once its last full scan is this old
+    INDEX_REFRESH_SECONDS: float = 30.0  # catch up on writes made outside this process
+
+    # Phone -> user/victim/rescuer index for inbound SMS: loaded in the background at startup,
+    # caught up on this interval, and rescanned in full on the longer one (users, deletions)
+    IDENTITY_REFRESH_SECONDS: float = 30.0
+    IDENTITY_FULL_SCAN_SECONDS: float = 3600.0
+    IDENTITY_MISS_TTL_SECONDS: float = 60.0  # an unknown sender is looked up in Firestore at most this often
+
+    # Change feed (GET /api/changes): each sync round re-reads this far back, so a write whose
+    # update time was taken before it reached Firestore is still picked up by the next round
+    CHANGES_OVERLAP_SECONDS: float = 10.0
+    # tombstones are kept this long (Firestore TTL on expireAt); older tokens must resync from scratch
+    TOMBSTONE_RETENTION_SECONDS: float = 7 * 86400.0
+
+    # Load the GeoJSON boundary layers in the background at startup instead of on the first /api/map/boundaries call
+    PRELOAD_GEO_DATA: bool = True
+
+    # Server: more than one worker needs STATE_BACKEND="sqlite"; reload only applies to one
+    WORKERS: int = 1
+    RELOAD: bool = True
+
+    # OTP
+    OTP_TTL_SECONDS: float = 300.0
+    OTP_MAX_ATTEMPTS: int = 5
+    OTP_RESEND_INTERVAL_SECONDS: float = 30.0
 
     # Twilio (optional)
     FIREBASE_COLLECTION_VICTIMS: str = "victims"
@@ -1,7 +1,73 @@
-import firebase_admin
-from firebase_admin import credentials, firestore, auth
+"""
+Firebase app and Firestore client, set up on first use.
 
-cred = credentials.Certificate("serviceAccountKey.json")
-firebase_admin.initialize_app(cred)
+Importing firebase_admin and google.cloud.firestore and loading the service
+account take close to half a second, so importing this module does neither.
+main.py calls `init()` from a startup hook. `db`, `firestore` and `auth` are
+stand-ins that initialize on first attribute access, so modules can keep
+`from firebase import db` at import time and scripts that never call
+`init()` still work.
+"""
+import importlib
+import threading
 
-db = firestore.client()
+_lock = threading.Lock()
+_cred = None
+_db = None
+
+
+def init():
+    """Initializes the Firebase app and the shared Firestore client. Safe to call twice."""
+    global _cred, _db
+    if _db is None:
+        with _lock:
+            if _db is None:
+                import firebase_admin
+                from firebase_admin import credentials, firestore as admin_firestore
+                from services.firestore_accounting import instrument_client
+
+                _cred = credentials.Certificate("serviceAccountKey.json")
+                firebase_admin.initialize_app(_cred)
+                # every RPC is counted against the request that made it
+                _db = instrument_client(admin_firestore.client())
+    return _db
+
+
+def get_db():
+    return _db if _db is not None else init()
+
+
+def get_credentials():
+    """The service account certificate the app was initialized with."""
+    init()
+    return _cred
+
+
+class _LazyClient:
+    """Forwards to the Firestore client, initializing Firebase on first use."""
+
+    def __getattr__(self, name):
+        return getattr(get_db(), name)
+
+    def __repr__(self):
+        return f"<lazy {get_db()!r}>"
+
+
+class _LazyModule:
+    """Forwards to a firebase_admin module, which is imported (and the app initialized) on first use."""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, name):
+        module = self._module
+        if module is None:
+            get_db()
+            module = self._module = importlib.import_module(self._name)
+        return getattr(module, name)
+
+
+db = _LazyClient()
+firestore = _LazyModule("firebase_admin.firestore")
+auth = _LazyModule("firebase_admin.auth")
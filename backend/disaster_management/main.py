@@ -1,14 +1,60 @@
-import uvicorn
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI, HTTPException
 from pydantic import BaseModel
-from firebase import cred, db
+import firebase
 from fastapi.middleware.cors import CORSMiddleware
-from routers import users, incidents, rescue_ops, shelters, maps, communication, rescuers, sms, messages, victims, auth, autoassign
+from routers import users, incidents, rescue_ops, shelters, maps, communication, rescuers, sms, messages, victims, auth, autoassign, otp, metrics, admin, changes
+from services.location_buffer import location_buffer
+from services.identity_index import identity_index
+from services.location_index import location_index
+from services.state_backend import state_backend
+from services.blocking import configure_thread_pools, io_executor
+from services.loop_monitor import loop_monitor
+from services.metrics import MetricsMiddleware
+from services.firestore_accounting import FirestoreAccountingMiddleware
+from services.profiler import ProfilingMiddleware
+from config import settings
+from utils.pagination import NEXT_CURSOR_HEADER
+from utils.serialization import DefaultResponse
+from utils.log import configure_logging, stop_logging
+
+configure_logging()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_thread_pools()
+    loop_monitor.start()
+    # deferred from import time so a new instance comes up faster; runs before anything reads Firestore
+    firebase.init()
+    # boundary layers load off the startup path; a request that needs one first loads it itself
+    if settings.PRELOAD_GEO_DATA:
+        io_executor.submit(maps.preload_boundaries)
+    location_buffer.start()
+    # phone -> user/victim/rescuer lookups for inbound SMS, loaded in the background
+    identity_index.start()
+    # from the last snapshot plus what changed since, then kept current in the background
+    location_index.load()
+    location_index.start()
+
+    yield
+
+    # write out fixes still waiting in memory before the process exits
+    location_buffer.stop()
+    location_index.stop()
+    identity_index.stop()
+    loop_monitor.stop()
+    io_executor.shutdown(wait=True)
+    stop_logging()
+
 
 app = FastAPI(
     title="Disaster Management API",
     description="API for coordinating disaster relief and rescue operations.",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=DefaultResponse,
+    lifespan=lifespan,
 )
 
 
@@ -22,7 +68,11 @@ app.add_middleware(
     allow_origins=["http://localhost:5173"],
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[NEXT_CURSOR_HEADER, "X-Firestore-Reads", "X-Firestore-Writes", "X-Firestore-Queries"],
 )
+app.add_middleware(FirestoreAccountingMiddleware)
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 # Register routers
 app.include_router(users.router)
@@ -36,6 +86,10 @@ app.include_router(sms.router)
 app.include_router(messages.router)
 app.include_router(auth.router)
 app.include_router(autoassign.router)
+app.include_router(otp.router)
+app.include_router(metrics.router)
+app.include_router(admin.router)
+app.include_router(changes.router)
 
 app.include_router(victims.router)
 
@@ -46,5 +100,15 @@ def read_root():
 
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=5000, reload=True)
+    import uvicorn
+
+    if settings.WORKERS > 1 and not state_backend.shared_across_processes:
+        raise SystemExit("WORKERS > 1 needs a shared STATE_BACKEND (set STATE_BACKEND=sqlite)")
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=5000,
+        workers=settings.WORKERS,
+        reload=settings.RELOAD and settings.WORKERS == 1,
+    )
     
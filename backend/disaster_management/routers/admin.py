@@ -0,0 +1,58 @@
+# routers/admin.py
+import asyncio
+import threading
+
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from config import settings
+from services.profiler import SamplingProfiler, arm_request_profile, disarm
+from utils.admin import require_admin
+
+router = APIRouter(prefix="/api/admin", tags=["Admin"], dependencies=[Depends(require_admin)])
+
+# one profile at a time: two samplers would each double the other's overhead
+_profile_lock = asyncio.Lock()
+
+
+def _render(profile, fmt: str):
+    if fmt == "collapsed":
+        return PlainTextResponse(profile.collapsed())
+    return JSONResponse(profile.speedscope())
+
+
+@router.get("/profile")
+async def profile(
+    seconds: float = Query(10.0, gt=0, le=settings.PROFILE_MAX_SECONDS,
+                           description="Sampling window, or how long to wait for the target request"),
+    interval_ms: float = Query(5.0, ge=1, le=100, description="Time between samples"),
+    path: str | None = Query(None, description="Profile only the next request whose path starts with this"),
+    format: str = Query("speedscope", pattern="^(speedscope|collapsed)$"),
+):
+    """
+    Samples the live process and returns a flame-graph profile: speedscope
+    JSON (open at speedscope.app) or collapsed stacks for flamegraph.pl.
+
+    Without `path`, every busy thread and every in-flight request is
+    sampled for `seconds`. With `path`, the next matching request is
+    profiled from start to finish; 408 if none arrives within `seconds`.
+    """
+    if _profile_lock.locked():
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    async with _profile_lock:
+        interval = interval_ms / 1000
+        if path is None:
+            profiler = SamplingProfiler(
+                asyncio.get_running_loop(), threading.get_ident(), interval, name=f"{seconds:g}s window"
+            ).start()
+            await asyncio.sleep(seconds)
+            return _render(profiler.stop(), format)
+
+        target = arm_request_profile(path, interval)
+        try:
+            await asyncio.wait_for(target.done.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=408, detail=f"No request to {path} completed within {seconds:g}s")
+        finally:
+            disarm(target)
+        return _render(target.profile, format)
@@ -1,43 +1,57 @@
 from fastapi import APIRouter, HTTPException
 from firebase import db
-from datetime import datetime
-import math
+from services.blocking import run_blocking, fetch_all
+from utils.firestore_batch import commit_updates
+from utils.change_stamp import stamped
+from services.location_index import location_index
+from config import settings
 from fastapi import Query
 
 router = APIRouter(prefix="/api/assign", tags=["Assignment"])
 
-# Haversine formula
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371  # Earth radius in km
-    d_lat = math.radians(lat2 - lat1)
-    d_lon = math.radians(lon2 - lon1)
-    a = (math.sin(d_lat / 2) ** 2 +
-         math.cos(math.radians(lat1)) *
-         math.cos(math.radians(lat2)) *
-         math.sin(d_lon / 2) ** 2)
-    return 2 * R * math.asin(math.sqrt(a))
-
-# Calculate age
-def calculate_age(birthday_str):
-    try:
-        birthday = datetime.fromisoformat(birthday_str)
-        today = datetime.now()
-        return today.year - birthday.year - (
-            (today.month, today.day) < (birthday.month, birthday.day)
-        )
-    except Exception:
-        return None
+
+def _nearest_teams(teams: list) -> dict:
+    """victim id -> (victim row, nearest team, km) for active victims within 5 km of an assigned team."""
+    nearest = {}
+    for team in teams:
+        t_lat = team.get("assignedLatitude")  # Fixed field
+        t_lon = team.get("assignedLongitude") # Fixed field
+        if t_lat is None or t_lon is None:
+            continue
+        for victim in location_index.victims_within(t_lat, t_lon, 5):
+            best = nearest.get(victim.id)
+            if best is None or victim.distance_km < best[2]:
+                nearest[victim.id] = (victim, team, victim.distance_km)
+    return nearest
+
+
+def _victims_by_team(teams: list):
+    # the index refreshes in the background; catching up first picks up victims the apps wrote since
+    location_index.ensure_loaded()
+    location_index.catch_up(settings.FIREBASE_COLLECTION_VICTIMS)
+    return _nearest_teams(teams), location_index.victim_ids()
+
 
 @router.post("/")
 async def auto_assign_victims_debug_fixed():
+    """
+    Assigns each victim to the nearest team with status "Assigned" within
+    5 km, children and over-50s first.
+
+    Victims come from the location index, not from a read of the whole
+    collection, so only active victims with coordinates are considered:
+    inactive victims are never assigned, victims without coordinates are
+    not listed under "skipped" (there is no "Missing coordinates" reason),
+    and debug.total_victims counts active, located victims only.
+    """
     if not db:
         raise HTTPException(500, "Database not connected.")
 
     victims_ref = db.collection("victims")
     teams_ref = db.collection("rescue_teams")
 
-    victims = [v.to_dict() | {"id": v.id} for v in victims_ref.stream()]
-    teams = [t.to_dict() | {"id": t.id} for t in teams_ref.stream()]
+    team_docs = await fetch_all(teams_ref)
+    teams = [t.to_dict() | {"id": t.id} for t in team_docs]
 
     # Only teams with status == "Assigned"
     available_teams = [t for t in teams if t.get("status") == "Assigned"]
@@ -50,58 +64,39 @@ async def auto_assign_victims_debug_fixed():
             "debug": {"total_teams": len(teams)}
         }
 
-    enriched_victims = []
-    skipped_victims = []
-
-    for victim in victims:
-        v_id = victim["id"]
-        v_lat = victim.get("latitude")
-        v_lon = victim.get("longitude")
+    # victims come from the location index's victim store: a radius query per team instead of every document
+    nearest, victim_ids = await run_blocking(_victims_by_team, available_teams)
 
-        if v_lat is None or v_lon is None:
-            skipped_victims.append({"victimId": v_id, "reason": "Missing coordinates"})
-            continue
+    enriched_victims = []
+    skipped_victims = [
+        {"victimId": v_id, "reason": "No team within 5 km"}
+        for v_id in victim_ids if v_id not in nearest
+    ]
 
-        age = calculate_age(victim.get("birthday"))
+    for victim, team, dist in nearest.values():
+        age = victim.age
         priority = 1 if (age is not None and (age < 15 or age > 50)) else 2
+        enriched_victims.append((priority, dist, victim.id, team["id"]))
 
-        nearest_team = None
-        nearest_dist = float("inf")
-
-        for team in available_teams:
-            t_lat = team.get("assignedLatitude")  # Fixed field
-            t_lon = team.get("assignedLongitude") # Fixed field
-            if t_lat is None or t_lon is None:
-                continue
-
-            dist = haversine(v_lat, v_lon, t_lat, t_lon)
-            if dist <= 5 and dist < nearest_dist:
-                nearest_team = team
-                nearest_dist = dist
+    enriched_victims.sort(key=lambda v: (v[0], v[1]))
 
-        if nearest_team:
-            enriched_victims.append({
-                **victim,
-                "priority": priority,
-                "nearest_team": nearest_team,
-                "nearest_dist": nearest_dist
-            })
-        else:
-            skipped_victims.append({"victimId": v_id, "reason": "No team within 5 km"})
-
-    enriched_victims.sort(key=lambda v: (v["priority"], v["nearest_dist"]))
+    updates = [
+        (victims_ref.document(v_id), stamped({"assignedTeamId": team_id}))
+        for _, _, v_id, team_id in enriched_victims
+    ]
+    _, failed_ids = await run_blocking(commit_updates, updates)
+    failed = set(failed_ids)
 
     assigned = []
-    for victim in enriched_victims:
-        team = victim["nearest_team"]
-        victims_ref.document(victim["id"]).update({
-            "assignedTeamId": team["id"]
-        })
+    for priority, dist, v_id, team_id in enriched_victims:
+        if v_id in failed:
+            skipped_victims.append({"victimId": v_id, "reason": "Assignment write failed"})
+            continue
         assigned.append({
-            "victimId": victim["id"],
-            "teamId": team["id"],
-            "distance_km": round(victim["nearest_dist"], 2),
-            "priority": victim["priority"]
+            "victimId": v_id,
+            "teamId": team_id,
+            "distance_km": round(dist, 2),
+            "priority": priority
         })
 
     return {
@@ -109,7 +104,7 @@ async def auto_assign_victims_debug_fixed():
         "count": len(assigned),
         "skipped": skipped_victims,
         "debug": {
-            "total_victims": len(victims),
+            "total_victims": len(victim_ids),
             "available_teams": len(available_teams)
         }
     }
@@ -0,0 +1,159 @@
+# routers/changes.py
+"""
+Delta sync for the dashboards and apps: GET /api/changes returns only the
+documents created, updated or deleted since a token, across victims,
+rescuers, teams, shelters and messages.
+
+A client starts without a token, which pages through every document, and
+keeps the `next` token of each response. While `more` is true it calls
+again straight away to finish the round; once it is false the client is
+caught up and polls later with that `next`.
+
+Documents come back whole, as stored, with their id. Deletions come back
+as ids with their deletion time (epoch ms); a client drops its copy only
+if that copy was synced before then. Each round re-reads the last
+CHANGES_OVERLAP_SECONDS before the previous one started, so a write whose
+stamp was taken before it reached Firestore is not missed; a few
+documents may therefore arrive twice and should be applied as upserts.
+
+A round reads each collection twice and returns the union, by id:
+- documents whose `syncedAt` (the time this server sent the write, see
+  utils/change_stamp.py) is at or after the watermark, which catches an
+  SMS location fix stamped with a phone clock that is hours behind;
+- documents whose own update field (`updatedAt`, or `lastUpdated` for
+  shelters) is at or after it, as epoch ms or as a Firestore Timestamp,
+  which catches what the apps write to Firestore directly.
+"""
+import asyncio
+import time
+from typing import NamedTuple
+
+from fastapi import APIRouter, HTTPException, Query, Response
+
+from config import settings
+from services.location_buffer import location_buffer
+from services.repository import (
+    Repository, victims_repo, rescuers_repo, teams_repo, shelters_repo, messages_repo, tombstones_repo,
+)
+from utils.change_stamp import SYNCED_AT
+from utils.pagination import encode_cursor, decode_cursor
+from utils.serialization import dumps
+
+router = APIRouter(prefix="/api/changes", tags=["Changes"])
+
+# the key deletions are reported under in a token's cursors
+_DELETED = "deleted"
+# a feed's cursor for its own update field is under "<feed>.updated"; "<feed>" is for syncedAt
+_BY_UPDATE_FIELD = ".updated"
+
+
+class _Feed(NamedTuple):
+    repo: Repository
+    updated_field: str
+
+
+# by the name used in responses
+_FEEDS = {
+    "victims": _Feed(victims_repo, "updatedAt"),
+    "rescuers": _Feed(rescuers_repo, "updatedAt"),
+    "teams": _Feed(teams_repo, "updatedAt"),
+    "shelters": _Feed(shelters_repo, "lastUpdated"),
+    "messages": _Feed(messages_repo, "updatedAt"),
+}
+_NAMES = {feed.repo.collection: name for name, feed in _FEEDS.items()}
+_CURSOR_KEYS = {*_FEEDS, *(name + _BY_UPDATE_FIELD for name in _FEEDS), _DELETED}
+
+
+def _encode_token(watermark: int, started: int, cursors: dict) -> str:
+    return encode_cursor([watermark, started, cursors])
+
+
+def _decode_token(token: str) -> tuple:
+    """(watermark, round start, {feed: page cursor}); no cursors means the next call starts a new round."""
+    watermark, started, cursors = decode_cursor(token, 3)
+    valid = (
+        isinstance(watermark, int) and isinstance(started, int) and isinstance(cursors, dict)
+        and all(key in _CURSOR_KEYS and isinstance(c, str) for key, c in cursors.items())
+    )
+    if not valid:
+        raise HTTPException(status_code=400, detail="Invalid change token")
+    return watermark, started, cursors
+
+
+async def _read_feed(key: str, watermark: int, limit: int, after: str | None):
+    name = key.removesuffix(_BY_UPDATE_FIELD)
+    feed = _FEEDS[name]
+    if not watermark:
+        # a full sync also covers documents that carry neither time
+        page = await feed.repo.page(limit=limit, after=after)
+    elif key == name:
+        page = await feed.repo.page((SYNCED_AT, ">=", watermark), limit=limit, after=after, order_by=SYNCED_AT)
+    else:
+        page = await feed.repo.page_since(feed.updated_field, watermark, limit=limit, after=after)
+    docs = []
+    for doc_id, data in page.items:
+        # a buffered location fix is newer than what Firestore has
+        data = location_buffer.overlay(feed.repo.collection, doc_id, data)
+        docs.append({**data, "id": doc_id})
+    return name, docs, page.next_cursor
+
+
+async def _read_deletions(watermark: int, limit: int, after: str | None):
+    page = await tombstones_repo.page(("deletedAt", ">=", watermark), limit=limit, after=after, order_by="deletedAt")
+    deleted = {name: [] for name in _FEEDS}
+    for _, data in page.items:
+        name = _NAMES.get(data.get("collection"))
+        if name is not None:
+            deleted[name].append({"id": data.get("docId"), "deletedAt": data.get("deletedAt")})
+    return _DELETED, deleted, page.next_cursor
+
+
+@router.get("")
+async def get_changes(
+    since: str | None = Query(None, description="The `next` token of the previous response; omit for a full sync"),
+    limit: int = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE,
+                       description="Maximum number of documents per collection and query in this response; "
+                                   "a collection is queried by syncedAt and by its own update time"),
+):
+    now = int(time.time() * 1000)
+    watermark, started, cursors = _decode_token(since) if since else (0, now, {})
+    if watermark and watermark < now - settings.TOMBSTONE_RETENTION_SECONDS * 1000:
+        raise HTTPException(status_code=410, detail="Change token has expired, sync again without a token")
+    if not cursors:
+        # a new round: every collection, from the watermark
+        started = now
+        cursors = dict.fromkeys(_FEEDS)
+        if watermark:
+            cursors.update(dict.fromkeys(name + _BY_UPDATE_FIELD for name in _FEEDS))
+            cursors[_DELETED] = None
+
+    keys = list(cursors)
+    results = await asyncio.gather(*(
+        _read_deletions(watermark, limit, cursors[key]) if key == _DELETED
+        else _read_feed(key, watermark, limit, cursors[key])
+        for key in keys
+    ))
+
+    # a document written by both this server and an app comes back from both queries
+    found_by_id = {name: {} for name in _FEEDS}
+    deleted = {name: [] for name in _FEEDS}
+    next_cursors = {}
+    for key, (name, found, next_cursor) in zip(keys, results):
+        if name == _DELETED:
+            deleted = found
+        else:
+            found_by_id[name].update((doc["id"], doc) for doc in found)
+        if next_cursor:
+            next_cursors[key] = next_cursor
+    changes = {name: list(docs.values()) for name, docs in found_by_id.items()}
+
+    if next_cursors:
+        token = _encode_token(watermark, started, next_cursors)
+    else:
+        # caught up: the next round starts a little before this one did
+        overlap_ms = int(settings.CHANGES_OVERLAP_SECONDS * 1000)
+        token = _encode_token(max(watermark, started - overlap_ms), started, {})
+
+    body = {"changes": changes, "deleted": deleted, "next": token, "more": bool(next_cursors)}
+    # documents go out as stored (timestamps, GeoPoints), so they are encoded here rather than by a model
+    return Response(dumps(body), media_type="application/json")
@@ -1,12 +1,17 @@
+import logging
+
 from fastapi import APIRouter, HTTPException
 from firebase import db
 from config import settings
 from schemas.communication import StatusUpdate, Broadcast
 # from utils.sms import send_sms
 from utils.geo import haversine
+from utils.log import log_sampled
 
 router = APIRouter(prefix="/api", tags=["Communication"])
 
+logger = logging.getLogger(__name__)
+
 # User status update
 @router.post("/users/{userId}/status")
 def update_status(userId: str, status: StatusUpdate):
@@ -29,7 +34,7 @@ def broadcast(b: Broadcast):
     if b.area:
         for u in users:
             data = u.to_dict()
-            print(data)
+            log_sampled(logger, logging.DEBUG, "broadcast-user", "Broadcast candidate: %s", data)
             dist = haversine(
                 b.area["latitude"], b.area["longitude"],
                 data["location"]["latitude"], data["location"]["longitude"]
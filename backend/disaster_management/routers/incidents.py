@@ -1,6 +1,7 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from schemas.incident import IncidentCreate, IncidentResponse
 from firebase import db
+from services.blocking import run_blocking
 # from core.auth import get_current_user
 
 router = APIRouter(prefix="/api/incidents", tags=["Incidents"])
@@ -18,5 +19,5 @@ async def create_incident(incident: IncidentCreate): #, current_user: dict = Dep
     data["incidentId"] = inc_id
     data["status"] = "Active"
 
-    inc_ref.set(data)
+    await run_blocking(inc_ref.set, data)
     return data
@@ -1,18 +1,23 @@
+import asyncio
 import json
+import logging
 from fastapi import APIRouter, Query
 from firebase import db
 from config import settings
+from services.repository import users_repo, teams_repo, shelters_repo, rescuers_repo
 from fastapi.responses import FileResponse, JSONResponse
 import os
-from shapely.geometry import shape, box
+from functools import lru_cache
 
 
 
 router = APIRouter(prefix="/api/map", tags=["Maps"])
 
+logger = logging.getLogger(__name__)
+
 
 @router.get("/coverage")
-def map_coverage(
+async def map_coverage(
     min_lat: float = Query(..., description="Southwest corner latitude"),
     min_lon: float = Query(..., description="Southwest corner longitude"),
     max_lat: float = Query(..., description="Northeast corner latitude"),
@@ -26,34 +31,29 @@ def map_coverage(
     def in_box(lat, lon):
         return min_lat <= lat <= max_lat and min_lon <= lon <= max_lon
 
+    def located_in_box(data):
+        loc = data.get("location") or {}
+        return "latitude" in loc and "longitude" in loc and in_box(loc["latitude"], loc["longitude"])
+
+    # the three collections are independent, so read them together
+    all_users, all_teams, all_shelters = await asyncio.gather(
+        users_repo.list(), teams_repo.list(), shelters_repo.list()
+    )
+
     # --- Users ---
-    users = []
-    for u in db.collection(settings.FIREBASE_COLLECTION_USERS).stream():
-        data = u.to_dict()
-        loc = data.get("location", {})
-        if "latitude" in loc and "longitude" in loc and in_box(loc["latitude"], loc["longitude"]):
-            users.append(data)
+    users = [data for _, data in all_users if located_in_box(data)]
 
     # --- Rescue Teams + Members ---
-    rescue_teams = []
-    for team in db.collection(settings.FIREBASE_COLLECTION_RESCUE_TEAMS).stream():
-        team_data = team.to_dict()
-        team_loc = team_data.get("location", {})
-        if "latitude" in team_loc and "longitude" in team_loc and in_box(team_loc["latitude"], team_loc["longitude"]):
-            # fetch team members (if they exist)
-            members = []
-            for m in db.collection(settings.FIREBASE_COLLECTION_RESCUE_MEMBERS).where("teamId", "==", team_data["id"]).stream():
-                members.append(m.to_dict())
-            team_data["members"] = members
-            rescue_teams.append(team_data)
+    rescue_teams = [{**data, "id": data.get("id", team_id)} for team_id, data in all_teams if located_in_box(data)]
+    # fetch team members (if they exist), one query per team, all in flight at once
+    team_members = await asyncio.gather(
+        *(rescuers_repo.list(("teamId", "==", team["id"])) for team in rescue_teams)
+    )
+    for team, members in zip(rescue_teams, team_members):
+        team["members"] = [member for _, member in members]
 
     # --- Shelters ---
-    shelters = []
-    for s in db.collection(settings.FIREBASE_COLLECTION_SHELTERS).stream():
-        data = s.to_dict()
-        loc = data.get("location", {})
-        if "latitude" in loc and "longitude" in loc and in_box(loc["latitude"], loc["longitude"]):
-            shelters.append(data)
+    shelters = [data for _, data in all_shelters if located_in_box(data)]
 
     return {
         "users": users,
@@ -78,12 +78,47 @@ async def get_mumbai_map():
 
 
 
+# GeoJSON boundary layers by zoom band, coarsest first
+BOUNDARY_FILES = (
+    "india_boundary.geojson",
+    "india_states.geojson",
+    "india_districts.geojson",
+    "india_subdistricts.geojson",
+)
+
+
+@lru_cache(maxsize=None)
+def boundary_layer(file_name: str) -> list:
+    """
+    [(feature, geometry)] for a file under static/geojson, parsed once and
+    kept, so /boundaries only intersects shapes instead of re-reading the
+    file on every pan. shapely is imported here, on the first load.
+    """
+    from shapely.geometry import shape
+
+    file_path = os.path.join(STATIC_DIR, "geojson", file_name)
+    logger.debug("Loading GeoJSON file %s", file_path)
+    with open(file_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return [(feat, shape(feat["geometry"])) for feat in data.get("features", [])]
+
+
+def preload_boundaries():
+    """Loads the boundary layers that exist on disk; run off the startup path by main.py."""
+    for file_name in BOUNDARY_FILES:
+        if os.path.exists(os.path.join(STATIC_DIR, "geojson", file_name)):
+            boundary_layer(file_name)
+
+
 @router.get("/boundaries")
 def get_boundaries(zoom: int, bounds: str):
     """
     Selects a GeoJSON file based on zoom level and filters its features
     to only include those that intersect with the current map viewport.
     """
+    from shapely.geometry import box
+    from shapely.prepared import prep
+
     try:
         # The bounds string from the frontend is URL-encoded JSON
         bounds_data = json.loads(bounds)
@@ -100,27 +135,23 @@ def get_boundaries(zoom: int, bounds: str):
 
     # --- Strategy for progressive loading ---
     if 3 <= zoom <= 5:
-        file_name = "india_boundary.geojson"
+        file_name = BOUNDARY_FILES[0]
     elif 6 <= zoom <= 8:
-        file_name = "india_states.geojson"
+        file_name = BOUNDARY_FILES[1]
     elif 9 <= zoom <= 11:
-        file_name = "india_districts.geojson"
+        file_name = BOUNDARY_FILES[2]
     else: # zoom 12+
         # NOTE: You don't have a city/ward file, so we use the most detailed one available.
-        file_name = "india_subdistricts.geojson"
+        file_name = BOUNDARY_FILES[3]
     
-    file_path = os.path.join(STATIC_DIR, "geojson", file_name)
-    print(f"Loading GeoJSON file: {file_path}")
-    if not os.path.exists(file_path):
+    if not os.path.exists(os.path.join(STATIC_DIR, "geojson", file_name)):
         return JSONResponse(status_code=404, content={"error": f"File not found: {file_name}"})
 
-    with open(file_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
     # Filter features to only those intersecting with the current map view
+    viewport = prep(bbox)
     filtered_features = [
-        feat for feat in data.get("features", [])
-        if shape(feat["geometry"]).intersects(bbox)
+        feat for feat, geometry in boundary_layer(file_name)
+        if viewport.intersects(geometry)
     ]
     
     # Construct a new valid GeoJSON FeatureCollection
@@ -129,4 +160,4 @@ def get_boundaries(zoom: int, bounds: str):
         "features": filtered_features,
     }
     
-    return JSONResponse(content=filtered_geojson)
\ No newline at end of file
+    return JSONResponse(content=filtered_geojson)
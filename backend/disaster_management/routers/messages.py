@@ -1,36 +1,62 @@
-from fastapi import APIRouter, HTTPException, status
+import logging
+
+from fastapi import APIRouter, HTTPException, status, Depends, Query, Response
 from firebase import db
 from schemas.messages import MessageBase
 from typing import List
 from config import settings
+from services.repository import messages_repo
+from utils.pagination import PageParams, page_params, page_response
+from utils.streaming import stream_format, streaming_response
+from utils.log import log_sampled
 
 router = APIRouter(prefix="/api/messages", tags=["Messages"])
 
+logger = logging.getLogger(__name__)
+
+
+def _to_message(message_data: dict) -> dict:
+    # Convert GeoPoint to Location dict
+    geo_point = message_data.get("location")
+    if geo_point:
+        message_data["location"] = {
+            "latitude": geo_point.latitude,
+            "longitude": geo_point.longitude
+        }
+    return message_data
+
+
 @router.get("/", response_model=List[MessageBase])
-async def get_all_messages():
+async def get_all_messages(
+    response: Response,
+    page: PageParams = Depends(page_params),
+    type: int | None = Query(None, description="Message type, e.g. 101 for SOS"),
+    sender: str | None = Query(None),
+    fmt: str | None = Depends(stream_format),
+):
     if not db:
         raise HTTPException(500, "Database not connected.")
 
-    messages_ref = db.collection(settings.FIREBASE_COLLECTION_MESSAGES)
-    messages = messages_ref.stream()
+    where = []
+    if type is not None:
+        where.append(("Type", "==", type))
+    if sender:
+        where.append(("Sender", "==", sender))
 
-    messages_list = []
+    if fmt:
+        async def rows():
+            async for _, message_data in messages_repo.stream(*where, fields=page.fields):
+                yield _to_message(message_data)
+        return streaming_response(rows(), fmt, None if page.fields else MessageBase)
 
-    for message in messages:
-        message_data = message.to_dict()
+    result = await messages_repo.page(*where, limit=page.limit, after=page.after, fields=page.fields)
 
-        print("🔥 Raw message from Firebase:", message_data)  # 👈 log raw data
+    messages_list = []
 
-        # Convert GeoPoint to Location dict
-        geo_point = message_data.get("location")
-        if geo_point:
-            message_data["location"] = {
-                "latitude": geo_point.latitude,
-                "longitude": geo_point.longitude
-            }
+    for _, message_data in result.items:
 
-        msg = MessageBase.model_validate(message_data)
-        messages_list.append(msg)
+        log_sampled(logger, logging.DEBUG, "raw-message", "Raw message from Firebase: %s", message_data)
+        messages_list.append(_to_message(message_data))
 
-    print("✅ Final messages list:", messages_list)  # 👈 log final output
-    return messages_list
+    logger.debug("Returning messages", extra={"fields": {"count": len(messages_list)}})
+    return page_response(response, messages_list, result.next_cursor, page, model=MessageBase)
@@ -0,0 +1,34 @@
+# routers/metrics.py
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from services.metrics import registry, CallbackGauge
+from services.loop_monitor import loop_monitor
+from routers.sms import outgoing_sms_queue, sms_queue_stats
+from routers.rescue_ops import reverse_geocode
+
+router = APIRouter(tags=["Metrics"])
+
+# values kept by their owners, read when /metrics is scraped
+registry.register(CallbackGauge(
+    "sms_queue_depth", "Outgoing SMS waiting for the gateway", lambda: len(outgoing_sms_queue)))
+registry.register(CallbackGauge(
+    "sms_queued_total", "Outgoing SMS queued", lambda: sms_queue_stats.get("queued"), kind="counter"))
+registry.register(CallbackGauge(
+    "sms_dispatched_total", "Outgoing SMS collected by the gateway", lambda: sms_queue_stats.get("dispatched"), kind="counter"))
+registry.register(CallbackGauge(
+    "geocode_cache_hits_total", "Reverse-geocoding cache hits", lambda: reverse_geocode.cache_info().hits, kind="counter"))
+registry.register(CallbackGauge(
+    "geocode_cache_misses_total", "Reverse-geocoding cache misses", lambda: reverse_geocode.cache_info().misses, kind="counter"))
+registry.register(CallbackGauge(
+    "event_loop_last_lag_seconds", "Lag seen by the most recent loop heartbeat", lambda: loop_monitor.last_lag))
+registry.register(CallbackGauge(
+    "event_loop_max_lag_seconds", "Largest heartbeat lag since start", lambda: loop_monitor.max_lag))
+registry.register(CallbackGauge(
+    "event_loop_stalls_total", "Times the loop was blocked past the threshold", lambda: loop_monitor.stalls, kind="counter"))
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def metrics():
+    # a plain def: the SQLite-backed queue counters must not be read on the loop
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
@@ -1,13 +1,12 @@
 # app/otp.py
-import random, time
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from .sms_queue import sms_queue
+from routers.sms import enqueue_sms
+from services.otp_store import otp_store, OtpThrottled, OTP_OK, OTP_LOCKED, OTP_MISSING
+from utils.phone import normalize_phone
 
 router = APIRouter()
 
-# In-memory OTP store: { phone_number: {otp: str, expires: timestamp} }
-otp_store = {}
 
 class PhoneRequest(BaseModel):
     phone_number: str
@@ -18,29 +17,29 @@ class VerifyRequest(BaseModel):
 
 @router.post("/request_otp")
 def request_otp(req: PhoneRequest):
-    otp = str(random.randint(100000, 999999))  # 6 digit OTP
-    expiry = time.time() + 300  # 5 minutes
-
-    otp_store[req.phone_number] = {"otp": otp, "expires": expiry}
+    phone = normalize_phone(req.phone_number) or req.phone_number
+    try:
+        otp = otp_store.issue(phone)
+    except OtpThrottled as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(int(e.retry_after) + 1)})
 
     # enqueue SMS for Flutter gateway
-    sms_queue.append({"number": req.phone_number, "msg": f"Your OTP is {otp}"})
+    enqueue_sms(req.phone_number, f"Your OTP is {otp}")
 
     return {"status": "ok", "message": f"OTP sent to {req.phone_number}"}
 
 @router.post("/verify_otp")
 def verify_otp(req: VerifyRequest):
-    record = otp_store.get(req.phone_number)
+    phone = normalize_phone(req.phone_number) or req.phone_number
+    result = otp_store.verify(phone, req.otp)
 
-    if not record:
-        raise HTTPException(status_code=400, detail="No OTP requested")
+    if result == OTP_MISSING:
+        raise HTTPException(status_code=400, detail="No OTP requested or OTP expired")
 
-    if time.time() > record["expires"]:
-        del otp_store[req.phone_number]
-        raise HTTPException(status_code=400, detail="OTP expired")
+    if result == OTP_LOCKED:
+        raise HTTPException(status_code=429, detail="Too many invalid attempts, request a new OTP")
 
-    if req.otp != record["otp"]:
+    if result != OTP_OK:
         raise HTTPException(status_code=400, detail="Invalid OTP")
 
-    del otp_store[req.phone_number]  # OTP is one-time use
     return {"status": "ok", "message": "OTP verified"}
@@ -1,7 +1,10 @@
 # backend/app/routes/rescue_ops.py
 
+import asyncio
+import logging
+import time
+
 from fastapi import APIRouter, HTTPException, Body
-from firebase_admin import firestore
 from firebase import db
 from config import settings
 from schemas import victims
@@ -9,17 +12,29 @@ from schemas.rescue import (
     RescueTeamCreate, 
     RescueTeamResponse, 
     RescueTeamUpdate, 
-    LeaderInfo,
     TeamStatus
 )
 from uuid import uuid4
 from typing import List
 from math import radians, cos, sin, asin, sqrt
 from routers.sms import send_sms
+from services.location_buffer import location_buffer
+from services.location_index import location_index
+from services.victim_store import VictimRow
+from services.blocking import run_blocking
+from utils.firestore_preconditions import update_if_unchanged, WriteConflict
+from utils.change_stamp import stamped
+from utils.serialization import model_list_response
+from services.repository import rescuers_repo, teams_repo
+from services import team_membership
+from utils.sms_codec import VICTIM_LIST_TAG, encode_victim_list_sms, pack_victims_to_binary_base64
 
 
 router = APIRouter(prefix="/api", tags=["Rescue Ops"])
 
+logger = logging.getLogger(__name__)
+
+
 def _fetch_rescuers_data(rescuer_ids: list) -> dict:
     """Helper function to fetch rescuer data in batches."""
     if not rescuer_ids:
@@ -31,32 +46,73 @@ def _fetch_rescuers_data(rescuer_ids: list) -> dict:
         batch_ids = rescuer_ids[i:i+30]
         rescuers_query = db.collection(settings.FIREBASE_COLLECTION_RESCUERS).where("id", "in", batch_ids).stream()
         for rescuer in rescuers_query:
-            rescuer_data = rescuer.to_dict()
+            rescuer_data = location_buffer.overlay(settings.FIREBASE_COLLECTION_RESCUERS, rescuer.id, rescuer.to_dict())
             rescuers_map[rescuer_data["id"]] = rescuer_data
     return rescuers_map
 
-def _construct_team_response(team_doc: firestore.DocumentSnapshot) -> dict:
+def _team_rescuer_ids(team_data: dict) -> list:
+    return list(set([team_data.get("leader")] + team_data.get("members", [])) - {None})
+
+
+def _is_assigned(team_data: dict) -> bool:
+    return team_data.get("assignedLatitude") is not None and team_data.get("assignedLongitude") is not None
+
+
+def _assigned_point(team_data: dict) -> tuple:
+    return team_data["assignedLatitude"], team_data["assignedLongitude"]
+
+
+def _construct_team_response(team_data: dict) -> dict:
     """Helper function to construct the detailed team response, including nearby victims."""
-    team_data = team_doc.to_dict()
     if not team_data:
         return None
 
+    rescuers_data = _fetch_rescuers_data(_team_rescuer_ids(team_data))
+    address = get_address_from_latlong(*_assigned_point(team_data)) if _is_assigned(team_data) else None
+    return _build_team_response(team_data, rescuers_data, address)
+
+
+async def _construct_team_responses(teams: list) -> list:
+    """
+    Async counterpart of _construct_team_response for any number of teams.
+    Rescuers and the addresses of assigned teams are loaded concurrently,
+    once for all teams, so the response costs the slowest read rather than
+    the sum. Addresses not yet cached are still looked up one per second.
+    """
+    rescuer_ids = {rescuer_id for team_data in teams for rescuer_id in _team_rescuer_ids(team_data)}
+
+    async def no_address():
+        return None
+
+    # unassigned teams have nothing to geocode
+    rescuers, *addresses = await asyncio.gather(
+        rescuers_repo.get_many(rescuer_ids),
+        *(run_blocking(get_address_from_latlong, *_assigned_point(t)) if _is_assigned(t) else no_address() for t in teams),
+    )
+    rescuers_data = {
+        rescuer_id: location_buffer.overlay(settings.FIREBASE_COLLECTION_RESCUERS, rescuer_id, data)
+        for rescuer_id, data in rescuers.items()
+    }
+    return [
+        _build_team_response(team_data, rescuers_data, address)
+        for team_data, address in zip(teams, addresses)
+    ]
+
+
+def _build_team_response(team_data: dict, rescuers_data: dict, address: str) -> dict:
     leader_id = team_data.get("leader")
     member_ids = team_data.get("members", [])
-    all_rescuer_ids = list(set([leader_id] + member_ids) - {None})
-
-    rescuers_data = _fetch_rescuers_data(all_rescuer_ids)
 
     # Construct leader info
     leader_info = None
     if leader_id and leader_id in rescuers_data:
         leader_data = rescuers_data[leader_id]
-        leader_info = LeaderInfo(
-            id=leader_id,
-            name=leader_data.get("name"),
-            latitude=leader_data.get("latitude"),
-            longitude=leader_data.get("longitude")
-        )
+        leader_info = {
+            "id": leader_id,
+            "name": leader_data.get("name"),
+            "latitude": leader_data.get("latitude"),
+            "longitude": leader_data.get("longitude"),
+        }
 
     # Construct members dictionary
     members_dict = {
@@ -65,30 +121,22 @@ def _construct_team_response(team_doc: firestore.DocumentSnapshot) -> dict:
     }
 
     # Find victims within 5km of assigned location
-    assigned_lat = team_data.get("assignedLatitude")
-    assigned_lon = team_data.get("assignedLongitude")
     nearby_victims = []
-    if assigned_lat is not None and assigned_lon is not None:
-        victims_ref = db.collection(settings.FIREBASE_COLLECTION_VICTIMS).where("isActive", "==", True)
-        victims_docs = victims_ref.stream()
-        victims = []
-        for victim in victims_docs:
-            victim_data = victim.to_dict()
-            if victim_data.get("isActive") is True:
-                victims.append(victim_data)
-        nearby_victims = find_nearest_victims(assigned_lat, assigned_lon, victims)
-
-    return RescueTeamResponse(
-        teamId=team_data["teamId"],
-        teamName=team_data.get("teamName"),
-        leader=leader_info,
-        members=members_dict,
-        status=team_data.get("status", TeamStatus.UNKNOWN),
-        assignedLatitude=team_data.get("assignedLatitude"),
-        assignedLongitude=team_data.get("assignedLongitude"),
-        teamAddress=get_address_from_latlong(team_data.get("assignedLatitude"), team_data.get("assignedLongitude")),
-        victimsNearby=nearby_victims
-    ).dict()
+    if _is_assigned(team_data):
+        nearby_victims = [v.id for v in find_nearest_victims(*_assigned_point(team_data))]
+
+    # a plain dict: the response model validates it once, on the way out
+    return {
+        "teamId": team_data["teamId"],
+        "teamName": team_data.get("teamName"),
+        "leader": leader_info,
+        "members": members_dict,
+        "status": team_data.get("status", TeamStatus.UNKNOWN),
+        "assignedLatitude": team_data.get("assignedLatitude"),
+        "assignedLongitude": team_data.get("assignedLongitude"),
+        "teamAddress": address,
+        "victimsNearby": nearby_victims,
+    }
 
 @router.post("/rescue-ops/teams", response_model=RescueTeamResponse, status_code=201)
 def create_team(team: RescueTeamCreate):
@@ -108,111 +156,58 @@ def create_team(team: RescueTeamCreate):
         "assignedLongitude": None
     }
     
-    team_ref = db.collection(settings.FIREBASE_COLLECTION_RESCUE_TEAMS).document(team_id)
-    team_ref.set(team_data)
-
-    # Update teamId for all members
-    for member_id in members:
-        try:
-            db.collection(settings.FIREBASE_COLLECTION_RESCUERS).document(member_id).update({
-                "teamId": team_id,
-                "teamName": team.teamName,
-                "status": TeamStatus.ASSIGNED.value
-            })
-        except Exception:
-            pass # Ignore if a rescuer doesn't exist
+    # team document and every member's teamId are written in one transaction
+    try:
+        team_membership.create_team(team_data)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
-    return _construct_team_response(team_ref.get())
+    return _construct_team_response(team_data)
 
 @router.get("/rescue-ops/teams", response_model=List[RescueTeamResponse])
-def list_teams():
+async def list_teams():
     """Lists all rescue teams with enriched leader and member data."""
-    teams_stream = db.collection(settings.FIREBASE_COLLECTION_RESCUE_TEAMS).stream()
-    return [_construct_team_response(team_doc) for team_doc in teams_stream]
+    teams = [team_data for _, team_data in await teams_repo.list() if team_data]
+    return model_list_response(RescueTeamResponse, await _construct_team_responses(teams))
 
 @router.get("/rescue-ops/teams/{team_id}", response_model=RescueTeamResponse)
-def get_team(team_id: str):
+async def get_team(team_id: str):
     """Retrieves a single team by its ID with enriched data."""
-    team_doc = db.collection(settings.FIREBASE_COLLECTION_RESCUE_TEAMS).document(team_id).get()
-    if not team_doc.exists:
+    team_data = await teams_repo.get(team_id)
+    if team_data is None:
         raise HTTPException(status_code=404, detail="Team not found")
-    return _construct_team_response(team_doc)
+    return (await _construct_team_responses([team_data]))[0]
 
 @router.put("/rescue-ops/teams/{team_id}", response_model=RescueTeamResponse)
 def update_team(team_id: str, team_update: RescueTeamUpdate):
     """Updates a team's information."""
-    team_ref = db.collection(settings.FIREBASE_COLLECTION_RESCUE_TEAMS).document(team_id)
-    if not team_ref.get().exists:
-        raise HTTPException(status_code=404, detail="Team not found")
-
     update_data = team_update.dict(exclude_unset=True)
     
     # Ensure leader is always in members list if members are being updated
     if 'members' in update_data and 'leader' in update_data:
         if update_data['leader'] not in update_data['members']:
             update_data['members'].append(update_data['leader'])
-    # update the status and teamId and teamName of all members
-    if 'members' in update_data or 'leader' in update_data or 'teamName' in update_data:
-        team_doc = team_ref.get().to_dict()
-        new_members = set(update_data.get('members', team_doc.get('members', [])))
-        new_leader = update_data.get('leader', team_doc.get('leader'))
-        if new_leader:
-            new_members.add(new_leader)
-        new_team_name = update_data.get('teamName', team_doc.get('teamName'))
-
-        # Fetch current members to identify removals
-        current_members = set(team_doc.get('members', []))
-        if team_doc.get('leader'):
-            current_members.add(team_doc.get('leader'))
-
-        # Members to be removed
-        members_to_remove = current_members - new_members
-        for member_id in members_to_remove:
-            try:
-                db.collection(settings.FIREBASE_COLLECTION_RESCUERS).document(member_id).update({
-                    "teamId": None,
-                    "teamName": None,
-                    "status": TeamStatus.FREE.value
-                })
-            except Exception:
-                pass # Ignore if a rescuer doesn't exist
-
-        # Update new members with the latest team info
-        for member_id in new_members:
-            try:
-                db.collection(settings.FIREBASE_COLLECTION_RESCUERS).document(member_id).update({
-                    "teamId": team_id,
-                    "teamName": new_team_name,
-                    "status": TeamStatus.ASSIGNED.value
-                })
-            except Exception:
-                pass # Ignore if a rescuer doesn't exist
-
-    team_ref.update(update_data)
-    return _construct_team_response(team_ref.get())
+    # the team and the teamId/teamName/status of removed and current members change in one transaction
+    try:
+        team_data = team_membership.update_team(team_id, update_data)
+    except team_membership.TeamNotFound:
+        raise HTTPException(status_code=404, detail="Team not found")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _construct_team_response(team_data)
 
 
 @router.delete("/rescue-ops/teams/{team_id}", status_code=204)
 def delete_team(team_id: str):
     """Deletes a rescue team and unlinks its members."""
-    team_ref = db.collection(settings.FIREBASE_COLLECTION_RESCUE_TEAMS).document(team_id)
-    team_doc = team_ref.get()
-    if not team_doc.exists:
+    # Unlink members and delete the team in one transaction
+    try:
+        team_membership.delete_team(team_id)
+    except team_membership.TeamNotFound:
         raise HTTPException(status_code=404, detail="Team not found")
-
-    # Unlink members from the team
-    team_data = team_doc.to_dict()
-    for member_id in team_data.get("members", []):
-        try:
-            db.collection(settings.FIREBASE_COLLECTION_RESCUERS).document(member_id).update({
-                "teamId": None,
-                "teamName": None,
-                "status": TeamStatus.FREE.value
-            })
-        except Exception:
-            pass
-            
-    team_ref.delete()
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    location_index.remove(settings.FIREBASE_COLLECTION_RESCUE_TEAMS, team_id)
     return None
 
 
@@ -227,17 +222,36 @@ def assign_team(team_id: str, latitude: float = Body(...), longitude: float = Bo
     if team_doc.to_dict().get("status") != TeamStatus.FREE.value:
         raise HTTPException(status_code=400, detail="Team is not available for assignment.")
 
-    team_ref.update({
-        "status": TeamStatus.ASSIGNED.value,
-        "assignedLatitude": latitude,
-        "assignedLongitude": longitude
-    })
+    # conditioned on the read above, so two dispatchers cannot both assign a free team
+    try:
+        team_data = update_if_unchanged(team_ref, team_doc, stamped({
+            "status": TeamStatus.ASSIGNED.value,
+            "assignedLatitude": latitude,
+            "assignedLongitude": longitude,
+            "updatedAt": int(time.time() * 1000),
+        }))
+    except WriteConflict:
+        raise HTTPException(status_code=409, detail="Team was modified concurrently, retry the assignment")
+    location_index.put(settings.FIREBASE_COLLECTION_RESCUE_TEAMS, team_id, team_data)
 
     # send sms to all team members with the assigned location details
     # get all team members
     try:
-        team_data = team_ref.get().to_dict()
         member_ids = team_data.get("members", [])
+
+        # The address and victim list are the same for every member, so build them once
+        address = get_address_from_latlong(latitude, longitude)
+        location_message = f'DISASTERLINKx9050 {{"msg": "99", "lat": {latitude}, "lon": {longitude}, "address": "{address}"}}'
+
+        # get users within 5km radius of the assigned location
+        nearest_victims = find_nearest_victims(latitude, longitude)
+
+        cluster_message = None
+        victim_list_messages = None  # encoded on first use: only members whose app decodes DL2 get it
+        if nearest_victims:
+            nearest_victims_string = cluster_and_prioritize_victims(nearest_victims, rescuer_lat=latitude, rescuer_lon=longitude)
+            cluster_message = f'DISASTERLINKx9050 {{"msg": "97", "victims_count": {nearest_victims_string}}}'
+
         for member_id in member_ids:
             # get phone number of the member
             rescuer_ref = db.collection(settings.FIREBASE_COLLECTION_RESCUERS).document(member_id)
@@ -246,45 +260,26 @@ def assign_team(team_id: str, latitude: float = Body(...), longitude: float = Bo
                 continue
             rescuer_data = rescuer_doc.to_dict()
             phone_number = rescuer_data.get("phone")
-            print(":::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::")
-            address = get_address_from_latlong(latitude, longitude)
-            print(":::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::::")
-            message = f'DISASTERLINKx9050 {{"msg": "99", "lat": {latitude}, "lon": {longitude}, "address": "{address}"}}'
-            send_sms(phone_number, message)
-            # print(address)
-
-            # user list of all victims to be send in sms:
-            # get users within 5km radius of the assigned location
-            victims_ref = db.collection(settings.FIREBASE_COLLECTION_VICTIMS).where("isActive", "==", True)
-            victims_docs = victims_ref.stream()
-            victims = []
-            for victim in victims_docs:
-                victim_data = victim.to_dict()
-                if victim_data.get("isActive") is True:
-                    victims.append(victim_data)
-            nearest_victims = find_nearest_victims(latitude, longitude, victims)
-            if not nearest_victims:
+            send_sms(phone_number, location_message)
+            if cluster_message is None:
                 continue
+            if VICTIM_LIST_TAG not in (rescuer_data.get("smsFormats") or []):
+                send_sms(phone_number, cluster_message)
+                continue
+            # the app decodes DL2: numbered segments carrying the full victim list replace the cluster summary
+            if victim_list_messages is None:
+                victim_list_messages = encode_victim_list_sms(
+                    [_victim_sms_record(v) for v in nearest_victims],
+                    latitude, longitude,
+                    prefix="DISASTERLINKx9050 "
+                )
+            for segment in victim_list_messages:
+                send_sms(phone_number, segment)
 
-            nearest_victims_string = cluster_and_prioritize_victims(nearest_victims, rescuer_lat=latitude, rescuer_lon=longitude)
-            print("-=-=-=-==-=-==-=-=-=-=-=-=-=-=-=-=--=-=")
-            print(nearest_victims_string)
-            send_sms(phone_number, f'DISASTERLINKx9050 {{"msg": "97", "victims_count": {nearest_victims_string}}}')
-
-            # print(nearest_victims)
-            # # Send the list of nearest victims to the rescuer via SMS
-            # for victim in nearest_victims:
-            #     victim_list_str = f'{victim.get("phoneNumber","N/A")},{victim.get("name","N/A")},{victim.get("dateOfBirth","N/A")},{victim.get("status","N/A")};'
-            #     victim_list_message = f'DISASTERLINKx9050 {{"msg": "98", "victim": "{victim_list_str}"}}'
-            #     print(victim_list_message)
-            # victim_list_message = f'DISASTERLINKx9050 {{"msg": "98", "victims": "{victim_list_str}"}}'
-
-            
-
-    except Exception as e:
-        print(f"Error sending SMS to team members: {e}")
+    except Exception:
+        logger.exception("Error sending SMS to team members", extra={"fields": {"team": team_id}})
 
-    return _construct_team_response(team_ref.get())
+    return _construct_team_response(team_data)
 
 
 @router.post("/rescue-ops/teams/{team_id}/unassign", response_model=RescueTeamResponse)
@@ -299,13 +294,18 @@ def unassign_team(team_id: str):
     if team_doc.to_dict().get("status") != TeamStatus.ASSIGNED.value:
         raise HTTPException(status_code=400, detail="Team is not currently assigned.")
     
-    team_ref.update({
-        "status": TeamStatus.FREE.value,
-        "assignedLatitude": None,
-        "assignedLongitude": None
-    })
-    
-    return _construct_team_response(team_ref.get())
+    try:
+        team_data = update_if_unchanged(team_ref, team_doc, stamped({
+            "status": TeamStatus.FREE.value,
+            "assignedLatitude": None,
+            "assignedLongitude": None,
+            "updatedAt": int(time.time() * 1000),
+        }))
+    except WriteConflict:
+        raise HTTPException(status_code=409, detail="Team was modified concurrently, retry the unassignment")
+    location_index.remove(settings.FIREBASE_COLLECTION_RESCUE_TEAMS, team_id)
+
+    return _construct_team_response(team_data)
 
 
 
@@ -345,23 +345,14 @@ def sendVictimListToTeamMember():
     if assigned_lat is None or assigned_lon is None:
         raise HTTPException(status_code=400, detail="Team is not assigned to any location")
     
-    # get all victims
-    victims_ref = db.collection(settings.FIREBASE_COLLECTION_VICTIMS).where("isActive", "==", True)
-    victims_docs = victims_ref.stream()
-    victims = []
-    for victim in victims_docs:
-        victim_data = victim.to_dict()
-        if victim_data.get("isActive") is True:
-            victims.append(victim_data)
-
    # find nearest victims
-    nearest_victims = find_nearest_victims(assigned_lat, assigned_lon, victims)
+    nearest_victims = find_nearest_victims(assigned_lat, assigned_lon)
     if not nearest_victims:
        raise HTTPException(status_code=404, detail="No active victims found nearby")
 
     # send sms to the rescuer with the list of nearest victims
     ### LEFT 
-    print(f"Sending SMS to rescuer {rescuerId} with nearest victims: {nearest_victims}")
+    logger.info("Sending SMS to rescuer with nearest victims", extra={"fields": {"rescuer": rescuerId, "victims": len(nearest_victims)}})
     # return in Http response
 
 
@@ -370,42 +361,25 @@ def sendVictimListToTeamMember():
 
 
 
-    return {"message": f"SMS sent to rescuer {rescuerId} with nearest victims", "victims": nearest_victims}
-
-
-
-def find_nearest_victims(lat: float, lon: float, victims: list, radius_km: float = 5.0) -> list:
-    def haversine(lat1, lon1, lat2, lon2):
-        # Convert decimal degrees to radians 
-        lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-        # Haversine formula 
-        dlon = lon2 - lon1 
-        dlat = lat2 - lat1 
-        a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-        c = 2 * asin(sqrt(a)) 
-        r = 6371 # Radius of earth in kilometers
-        return c * r
-
-    nearby_victims = []
-    for victim in victims:
-        v_lat = victim.get("latitude")
-        v_lon = victim.get("longitude")
-        if v_lat is not None and v_lon is not None:
-            distance = haversine(lat, lon, v_lat, v_lon)
-            if distance <= radius_km:
-                nearby_victims.append(victim)
-    
-    
-
-    return nearby_victims    
-
-
-
+    return {"message": f"SMS sent to rescuer {rescuerId} with nearest victims", "victims": [_victim_sms_record(v) for v in nearest_victims]}
 
 
 
+def _victim_sms_record(victim: VictimRow) -> dict:
+    """Reduces a victim to the fields sent to rescuers by SMS."""
+    return {
+        "phone": victim.phone,
+        "name": victim.name,
+        "age": DEFAULT_AGE if victim.age is None else victim.age,
+        "status": victim.status,
+        "latitude": victim.latitude,
+        "longitude": victim.longitude,
+    }
 
 
+def find_nearest_victims(lat: float, lon: float, radius_km: float = 5.0) -> list:
+    """Active victims within radius_km, nearest first, as VictimRows from the location index."""
+    return location_index.victims_within(lat, lon, radius_km)
 
 
 
@@ -424,77 +398,57 @@ def find_nearest_victims(lat: float, lon: float, victims: list, radius_km: float
 
 
 
-import struct
-import base64
 
-def pack_victims_to_binary_base64(victim_list: list) -> str:
-    """
-    Packs a list of victim dictionaries into a compact binary format and
-    encodes it as a Base64 string for sending via SMS.
-    
-    Expected format for each victim dict:
-    {
-        "phone": "123456789012",  # String of 12 digits
-        "name": "JaneDoe",
-        "age": 30
-    }
-    """
-    all_packed_records = []
 
-    for victim in victim_list:
-        # --- 1. Safely extract and sanitize data ---
-        # Convert the phone string to an integer. Default to 0 if missing/invalid.
-        try:
-            phone_int = int(victim.get("phone", 0))
-        except (ValueError, TypeError):
-            phone_int = 0
-            
-        # Get the name. Default to an empty string if missing.
-        name_str = victim.get("name", "")
-        
-        # Get the age. Default to 0 if missing.
-        age_int = victim.get("age", 0)
 
-        # --- 2. Encode the name and get its length ---
-        name_bytes = name_str.encode('utf-8')
-        name_length = len(name_bytes)
-        
-        # --- 3. Define the binary format for this record ---
-        # > = Big-Endian (network standard)
-        # Q = Unsigned long long (8 bytes) for the phone number
-        # B = Unsigned char (1 byte) for the name length
-        # {name_length}s = The variable-length name string itself
-        # B = Unsigned char (1 byte) for the age
-        format_string = f'> Q B {name_length}s B'
-
-        # --- 4. Pack the data into a binary chunk ---
-        try:
-            packed_record = struct.pack(format_string, phone_int, name_length, name_bytes, age_int)
-            all_packed_records.append(packed_record)
-        except struct.error as e:
-            print(f"Skipping record due to packing error: {e}. Data: {victim}")
-            continue
 
-    # --- 5. Join all chunks and encode to Base64 ---
-    final_payload_bytes = b"".join(all_packed_records)
-    final_payload_base64 = base64.b64encode(final_payload_bytes).decode('utf-8')
-    
-    return final_payload_base64
 
 
 
 
+import threading
+from functools import lru_cache
+from services.metrics import geocode_duration
 
 
+@lru_cache(maxsize=None)
+def get_geolocator():
+    # geopy imports every geocoder it ships, so it is loaded on the first lookup
+    from geopy.geocoders import Nominatim
 
+    return Nominatim(user_agent="disasterlink_app_v1") # Use a descriptive user agent
 
 
+# Nominatim's usage policy allows at most one request per second
+GEOCODE_MIN_INTERVAL_SECONDS = 1.0
+_geocode_lock = threading.Lock()
+_last_geocode = 0.0
 
-from geopy.geocoders import Nominatim
 
-from geopy.geocoders import Nominatim
-from geopy.exc import GeocoderTimedOut, GeocoderServiceError
+@lru_cache(maxsize=4096)
+def reverse_geocode(lat, long) -> str:
+    """
+    Cached Nominatim lookup, keyed by coordinates rounded to 4 decimals
+    (~11 m). Errors raise and so are never cached. Cache misses go out one
+    at a time and at least GEOCODE_MIN_INTERVAL_SECONDS apart, however many
+    threads miss at once.
+    """
+    global _last_geocode
+    with _geocode_lock:
+        time.sleep(max(0.0, _last_geocode + GEOCODE_MIN_INTERVAL_SECONDS - time.monotonic()))
+        try:
+            with geocode_duration.time():
+                location = get_geolocator().reverse((lat, long), language="en", timeout=10)
+        finally:
+            _last_geocode = time.monotonic()
 
+    if location and location.address:
+        # Truncate address to max 55 characters
+        address = location.address
+        if len(address) > 55:
+            address = address[:52] + "..."
+        return address
+    return "Address not found for the given coordinates."
 
 
 def get_address_from_latlong(lat, long):
@@ -502,22 +456,13 @@ def get_address_from_latlong(lat, long):
     Gets a formatted address from latitude and longitude using Nominatim.
     Includes error handling for network issues and timeouts.
     """
+    from geopy.exc import GeocoderTimedOut, GeocoderServiceError
+
     if lat is not None and long is not None:
         lat = round(float(lat), 4)
         long = round(float(long), 4)
     try:
-        geolocator = Nominatim(user_agent="disasterlink_app_v1") # Use a descriptive user agent
-        location = geolocator.reverse((lat, long), language="en", timeout=10)
-        
-        if location and location.address:
-            # Truncate address to max 55 characters
-            address = location.address
-            if len(address) > 55:
-                address = address[:52] + "..."
-            return address
-        else:
-            return "Address not found for the given coordinates."
-            
+        return reverse_geocode(lat, long)
     except GeocoderTimedOut:
         return "Error: Geocoding service timed out."
     except GeocoderServiceError as e:
@@ -539,7 +484,8 @@ def get_address_from_latlong(lat, long):
 
 from datetime import datetime
 
-
+# what calculate_age reports for a missing or unreadable date of birth
+DEFAULT_AGE = 30
 
 
 def calculate_age(dob_str: str) -> int:
@@ -550,7 +496,7 @@ def calculate_age(dob_str: str) -> int:
         return today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
     except (ValueError, TypeError):
         # Return a default age if format is wrong or dob_str is None
-        return 30 
+        return DEFAULT_AGE
 
 # --- Helper function to calculate distance ---
 def haversine(lat1, lon1, lat2, lon2):
@@ -577,7 +523,7 @@ def _fetch_rescuers_data(rescuer_ids: list) -> dict:
         batch_ids = rescuer_ids[i:i+30]
         rescuers_query = db.collection(settings.FIREBASE_COLLECTION_RESCUERS).where("id", "in", batch_ids).stream()
         for rescuer in rescuers_query:
-            rescuer_data = rescuer.to_dict()
+            rescuer_data = location_buffer.overlay(settings.FIREBASE_COLLECTION_RESCUERS, rescuer.id, rescuer.to_dict())
             rescuers_map[rescuer_data["id"]] = rescuer_data
     return rescuers_map
 
@@ -604,16 +550,8 @@ def auto_assign_team_to_incident(incident_id: str):
     if not available_teams:
         raise HTTPException(status_code=404, detail="No free teams available for assignment.")
 
-    victims_ref = db.collection(settings.FIREBASE_COLLECTION_VICTIMS)
-    active_victims_docs = victims_ref.where("isActive", "==", True).stream()
-    active_victims = [v.to_dict() for v in active_victims_docs]
-
     # 2. Cluster Victims for the Incident
-    incident_victims = []
-    for victim in active_victims:
-        dist = haversine(incident_location['latitude'], incident_location['longitude'], victim.get('latitude'), victim.get('longitude'))
-        if dist <= 1.0: # Cluster victims within a 1km radius
-            incident_victims.append(victim)
+    incident_victims = find_nearest_victims(incident_location['latitude'], incident_location['longitude'], radius_km=1.0) # Cluster victims within a 1km radius
     
     if not incident_victims:
         raise HTTPException(status_code=404, detail="No active victims found within 1km of the incident location.")
@@ -622,14 +560,12 @@ def auto_assign_team_to_incident(incident_id: str):
     total_vulnerability_points = 0
     for victim in incident_victims:
         points = 0
-        if victim.get("status") == "Critical": points += 10
-        elif victim.get("status") == "Needs Help": points += 5
+        if victim.status == "Critical": points += 10
+        elif victim.status == "Needs Help": points += 5
         else: points += 1
         
-        dob_datetime = victim.get("dateOfBirth")
-        if isinstance(dob_datetime, datetime):
-            age = calculate_age(dob_datetime.strftime('%Y-%m-%d'))
-            if age < 15 or age > 60: points += 4
+        if victim.age is not None:
+            if victim.age < 15 or victim.age > 60: points += 4
             else: points += 1
         else:
             points += 1
@@ -740,7 +676,7 @@ def auto_assign_team_to_incident(incident_id: str):
 
 from typing import List, Dict, Any
 def cluster_and_prioritize_victims(
-    all_active_victims: List[Dict[str, Any]], 
+    all_active_victims: List[VictimRow], 
     rescuer_lat: float, 
     rescuer_lon: float,
     operational_radius_km: float = 5.0,
@@ -759,33 +695,25 @@ def cluster_and_prioritize_victims(
             'kid_count': Number of victims younger than 16 in the cluster.
     """
 
+    # (victim, age, individual score) per victim; the rows themselves are not copied
     scored_nearby_victims = []
     
     # 1. Fetch and Score All Nearby Victims
     for victim in all_active_victims:
-        victim_lat = victim.get('latitude')
-        victim_lon = victim.get('longitude')
-        
-        if victim_lat is None or victim_lon is None:
-            continue
-
-        distance_to_rescuer = haversine(rescuer_lat, rescuer_lon, victim_lat, victim_lon)
+        distance_to_rescuer = victim.distance_km
+        if distance_to_rescuer is None:
+            distance_to_rescuer = haversine(rescuer_lat, rescuer_lon, victim.latitude, victim.longitude)
 
         if distance_to_rescuer <= operational_radius_km:
-            dob = victim.get("dateOfBirth")
-            age = calculate_age(dob)
+            age = DEFAULT_AGE if victim.age is None else victim.age
             age_score = 1.0 if age < 15 or age > 60 else 0.5
             
-            gender = victim.get("gender", "").lower()
+            gender = (victim.gender or "").lower()
             gender_score = 0.6 if gender == "female" else 0.4
 
             individual_score = (0.5 * age_score) + (0.5 * gender_score)
             
-            scored_nearby_victims.append({
-                **victim,
-                'age': age, # Store calculated age for later use
-                'individual_score': individual_score,
-            })
+            scored_nearby_victims.append((victim, age, individual_score))
 
     if not scored_nearby_victims:
         return []
@@ -801,8 +729,8 @@ def cluster_and_prioritize_victims(
 
         for victim in unclustered_victims:
             dist_to_seed_km = haversine(
-                seed_victim['latitude'], seed_victim['longitude'],
-                victim['latitude'], victim['longitude']
+                seed_victim[0].latitude, seed_victim[0].longitude,
+                victim[0].latitude, victim[0].longitude
             )
             if dist_to_seed_km * 1000 <= cluster_radius_m:
                 current_cluster_victims.append(victim)
@@ -818,30 +746,32 @@ def cluster_and_prioritize_victims(
     for cluster_data in clusters:
         if not cluster_data: continue
 
-        total_individual_score = sum(v['individual_score'] for v in cluster_data)
+        total_individual_score = sum(score for _, _, score in cluster_data)
         num_people_in_cluster = len(cluster_data)
         final_cluster_score = total_individual_score * num_people_in_cluster
 
-        center_lat = sum(v['latitude'] for v in cluster_data) / num_people_in_cluster
-        center_lon = sum(v['longitude'] for v in cluster_data) / num_people_in_cluster
+        center_lat = sum(v.latitude for v, _, _ in cluster_data) / num_people_in_cluster
+        center_lon = sum(v.longitude for v, _, _ in cluster_data) / num_people_in_cluster
 
         # --- NEW: Summarize victim demographics ---
         male_count = 0
         female_count = 0
         kid_count = 0
-        for victim in cluster_data:
-            if victim.get('gender', '').lower() == 'male':
+        for victim, age, _ in cluster_data:
+            gender = (victim.gender or '').lower()
+            if gender == 'male':
                 male_count += 1
-            elif victim.get('gender', '').lower() == 'female':
+            elif gender == 'female':
                 female_count += 1
             
             # Use pre-calculated age
-            if victim.get('age', 99) < 16:
+            if age < 16:
                 kid_count += 1
         
         # Append the summarized data instead of the full victim list
         # Format as a string: "score-centerlat-centerlon-male-female-kid"
-        cluster_str = f"{final_cluster_score}-{center_lat}-{center_lon}-{male_count}-{female_count}-{kid_count}"
+        # 5 decimals is ~1 m; full float precision only burns SMS characters
+        cluster_str = f"{final_cluster_score:.2f}-{center_lat:.5f}-{center_lon:.5f}-{male_count}-{female_count}-{kid_count}"
         prioritized_clusters.append(cluster_str)
 
         return "|".join(prioritized_clusters)
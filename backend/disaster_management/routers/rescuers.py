@@ -1,16 +1,27 @@
 # disaster_management/routers/rescuers.py
+import logging
+import time
 
-from fastapi import APIRouter, HTTPException
-from firebase import db
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from firebase import db, auth
 from config import settings
 from schemas.rescue import (
     RescueMemberCreate,
     RescueMemberResponse,
 )
-from firebase_admin import auth
+from services.location_buffer import location_buffer
+from services.identity_index import identity_index, RESCUER
+from services.repository import rescuers_repo
+from utils.firestore_preconditions import WriteConflict
+from utils.pagination import PageParams, page_params, page_response, project
+from utils.log import log_sampled
+from utils.phone import phone_spellings
+from utils.change_stamp import stamped
 
 router = APIRouter(prefix="/api", tags=["Rescuers"])
 
+logger = logging.getLogger(__name__)
+
 # ================== Rescue Members ==================
 
 # Create a rescue member (auto Firestore ID)
@@ -60,10 +71,13 @@ def create_rescue_member(member: RescueMemberCreate):
         "auth_uid": user_record.uid, # Store the auth UID to link the records
         "status": "Free",
         "teamId": None,
-        "teamName": None
+        "teamName": None,
+        "updatedAt": int(time.time() * 1000),
     })
+    data = stamped(data)
     
     ref.set(data)
+    identity_index.put(RESCUER, member.email, member.phone)
     
     return data
 
@@ -76,22 +90,41 @@ def create_rescue_member(member: RescueMemberCreate):
 
 # Get a rescue member
 @router.get("/rescuemembers/{member_id}", response_model=RescueMemberResponse)
-def get_rescue_member(member_id: str):
-    doc = db.collection(settings.FIREBASE_COLLECTION_RESCUERS).document(member_id).get()
-    if not doc.exists:
+async def get_rescue_member(member_id: str):
+    member = await rescuers_repo.get(member_id)
+    if member is None:
         raise HTTPException(status_code=404, detail="Rescue member not found")
-    return doc.to_dict()
+    return location_buffer.overlay(settings.FIREBASE_COLLECTION_RESCUERS, member_id, member)
 
 
 # List all rescue members
 @router.get("/rescuemembers", response_model=list[RescueMemberResponse])
-def list_rescue_members():
-    members_stream = db.collection(settings.FIREBASE_COLLECTION_RESCUERS).stream()
-    
+async def list_rescue_members(
+    response: Response,
+    page: PageParams = Depends(page_params),
+    status: str | None = Query(None),
+    teamId: str | None = Query(None),
+    updated_since: int | None = Query(None, description="Only rescuers updated at or after this epoch-ms time"),
+):
+    where = []
+    if status:
+        where.append(("status", "==", status))
+    if teamId:
+        where.append(("teamId", "==", teamId))
+    fields = page.fields
+    if fields and "location" in fields:
+        # location is assembled from the stored latitude/longitude
+        fields = [f for f in fields if f != "location"] + ["latitude", "longitude"]
+    if updated_since is None:
+        result = await rescuers_repo.page(*where, limit=page.limit, after=page.after, fields=fields)
+    else:
+        result = await rescuers_repo.page_since(
+            "updatedAt", updated_since, *where, limit=page.limit, after=page.after, fields=fields,
+        )
+
     response_list = []
-    for member_doc in members_stream:
-        # Convert the Firestore document to a dictionary
-        member_data = member_doc.to_dict()
+    for member_id, member_data in result.items:
+        member_data = location_buffer.overlay(settings.FIREBASE_COLLECTION_RESCUERS, member_id, member_data)
         
         # Get latitude and longitude from the dictionary
         latitude = member_data.get("latitude")
@@ -103,42 +136,37 @@ def list_rescue_members():
         else:
             member_data["location"] = None
             
-        response_list.append(member_data)
+        response_list.append(project(member_data, page.fields))
         
-    return response_list
+    return page_response(response, response_list, result.next_cursor, page, model=RescueMemberResponse)
 
 # Update a rescue member
 @router.put("/rescuemembers/{member_id}", response_model=RescueMemberResponse)
-def update_rescue_member(member_id: str, member: RescueMemberCreate):
-    ref = db.collection(settings.FIREBASE_COLLECTION_RESCUERS).document(member_id)
-    if not ref.get().exists:
+async def update_rescue_member(member_id: str, member: RescueMemberCreate):
+    try:
+        updated = await rescuers_repo.update_and_merge(member_id, stamped(member.dict() | {"updatedAt": int(time.time() * 1000)}))
+    except WriteConflict:
+        raise HTTPException(status_code=409, detail="Rescue member was modified concurrently, retry the update")
+    if updated is None:
         raise HTTPException(status_code=404, detail="Rescue member not found")
-    
-    update_data = member.dict()
-    ref.update(update_data)
-    return ref.get().to_dict()
+    identity_index.put(RESCUER, member_id, member.phone)
+    return updated
 
 
 # Delete rescue member
 @router.delete("/rescuemembers/{member_id}")
-def delete_rescue_member(member_id: str):
-    ref = db.collection(settings.FIREBASE_COLLECTION_RESCUERS).document(member_id)
-    if not ref.get().exists:
+async def delete_rescue_member(member_id: str):
+    if not await rescuers_repo.delete(member_id):
         raise HTTPException(status_code=404, detail="Rescue member not found")
-    ref.delete()
+    identity_index.remove(RESCUER, member_id)
     return {"message": "Rescue member deleted successfully"}
 
 
 # List only free rescuers not assigned to any team
 @router.get("/rescuemembers/available", response_model=list[RescueMemberResponse])
-def list_available_rescue_members():
-    members_ref = db.collection(settings.FIREBASE_COLLECTION_RESCUERS)
-    available_members = (
-        members_ref.where("status", "==", "Free")
-                   .where("teamId", "==", None)
-                   .stream()
-    )
-    return [m.to_dict() for m in available_members]
+async def list_available_rescue_members():
+    available_members = await rescuers_repo.list(("status", "==", "Free"), ("teamId", "==", None))
+    return [member for _, member in available_members]
 
 
 
@@ -157,26 +185,50 @@ def list_available_rescue_members():
 
 
 # rescuer sms:
-from datetime import datetime
-from pytz import timezone
 
-def update_rescuer_location(lat: float, lon: float, id: str):
+def update_rescuer_location(lat: float, lon: float, id: str, updated_at: int | None = None):
     # get id==phone from victims collection    
     # remove leading + from id if present
     # update the victim document
-    print("inside update_rescuer_location")
-    print("id:", id)
-    print("lat:", lat)
-    print("lon:", lon)
-
-    doc_ref = db.collection(settings.FIREBASE_COLLECTION_RESCUERS).document(id)
-    ist = timezone('Asia/Kolkata')
-    now_ist = datetime.now(ist)
-    victim_data = {
+    log_sampled(logger, logging.DEBUG, "rescuer-location", "Rescuer location update",
+                fields={"id": id, "lat": lat, "lon": lon})
+
+    # queue the update; the location buffer coalesces and flushes it
+    fields = rescuer_location_fields(lat, lon, updated_at)
+    location_buffer.put(settings.FIREBASE_COLLECTION_RESCUERS, id, fields, fixed_at=fields["updatedAt"])
+
+
+def rescuer_location_fields(lat: float, lon: float, updated_at: int | None = None) -> dict:
+    """Fields written to a rescuer document for a location update. updated_at is epoch ms, default now."""
+    if updated_at is None:
+        updated_at = int(time.time() * 1000)
+    return {
         "latitude": lat,
         "longitude": lon,
-        "updatedAt": int(now_ist.timestamp() * 1000)
+        "updatedAt": updated_at
     }
-    doc_ref.update(victim_data)
+
+
+def find_rescuer_id_by_phone(phone: str) -> str | None:
+    """
+    Resolves a rescuer document id (their email) from the sending phone.
+    Compact SMS frames carry no email, so the sender number is all we have.
+    """
+    rescuer_id = identity_index.resolve(phone, RESCUER)
+    if rescuer_id is not None:
+        return rescuer_id
+    # the index may still be loading, or this rescuer registered since its last catch-up;
+    # an unknown sender is only asked about once per IDENTITY_MISS_TTL_SECONDS
+    if identity_index.recently_missed(phone, RESCUER):
+        return None
+    # stored numbers may be spelled differently from the sender, e.g. "+91..." against "91..."
+    spellings = phone_spellings(phone)
+    if not spellings:
+        return None
+    for doc in db.collection(settings.FIREBASE_COLLECTION_RESCUERS).where("phone", "in", spellings).limit(1).stream():
+        identity_index.put(RESCUER, doc.id, phone)
+        return doc.id
+    identity_index.record_miss(phone, RESCUER)
+    return None
 
 
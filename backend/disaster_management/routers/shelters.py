@@ -1,174 +1,184 @@
 # shelter route
 
 from os import name
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
 from firebase import db
 from config import settings
 from schemas.shelter import ShelterCreate, ShelterResponse
 from schemas.user import UserResponse
+from services.repository import shelters_repo, users_repo
+from services.location_index import location_index
+from utils.change_stamp import stamped
+from services.shelter_occupancy import shelter_admissions, ShelterNotFound, AlreadyAdmitted, NotAdmitted, ShelterFull
+from utils.firestore_preconditions import WriteConflict
+from utils.pagination import PageParams, page_params, page_response, project
 import time
 
 router = APIRouter(prefix="/api/shelters", tags=["Shelters"])
 
 
-def enrich_shelter_with_users(shelter: dict) -> dict:
-    """Attach full user details for rescuedMembers."""
-    users = []
-    for uid in shelter.get("rescuedMembers", []):
-        doc = db.collection(settings.FIREBASE_COLLECTION_USERS).document(uid).get()
-        if doc.exists:
-            users.append(UserResponse(**doc.to_dict()))
+# only what UserResponse needs is read for each member
+USER_RESPONSE_FIELDS = list(UserResponse.model_fields)
+
+
+def _member_ids(shelter: dict) -> list:
+    # SMS check-ins store rescuedMembers as {phone: name}; iterating gives the keys either way
+    return list(shelter.get("rescuedMembers") or [])
+
+
+def _attach_users(shelter: dict, users_by_id: dict) -> dict:
+    # plain dicts: the response model validates them once, on the way out
+    users = [users_by_id[uid] for uid in _member_ids(shelter) if uid in users_by_id]
     shelter["rescuedMembers"] = users
     shelter["currentOccupancy"] = len(users)
     return shelter
 
 
+def _with_member_ids(shelter: dict) -> dict:
+    shelter["rescuedMembers"] = [str(uid) for uid in _member_ids(shelter)]
+    shelter["currentOccupancy"] = len(shelter["rescuedMembers"])
+    return shelter
+
+
+def _wants_members(include: str | None) -> bool:
+    return include is not None and "members" in include.split(",")
+
+
+def enrich_shelter_with_users(shelter: dict) -> dict:
+    """Attach full user details for rescuedMembers."""
+    users_ref = db.collection(settings.FIREBASE_COLLECTION_USERS)
+    refs = [users_ref.document(uid) for uid in dict.fromkeys(_member_ids(shelter))]
+    users_by_id = {}
+    if refs:
+        for doc in db.get_all(refs, field_paths=USER_RESPONSE_FIELDS):
+            if doc.exists:
+                users_by_id[doc.id] = doc.to_dict()
+    return _attach_users(shelter, users_by_id)
+
+
+async def enrich_shelters_with_users(shelters: list) -> list:
+    """Attach full user details for rescuedMembers, fetching every shelter's members in one read."""
+    member_ids = [uid for shelter in shelters for uid in _member_ids(shelter)]
+    users_by_id = await users_repo.get_many(member_ids, fields=USER_RESPONSE_FIELDS)
+    return [_attach_users(shelter, users_by_id) for shelter in shelters]
+
+
+INCLUDE_QUERY = Query(None, description="Comma-separated extras; 'members' embeds full user records in rescuedMembers")
+
+
 # ---------- CREATE SHELTER ----------
 @router.post("", response_model=ShelterResponse)
-def create_shelter(shelter: ShelterCreate):
-    ref = db.collection(settings.FIREBASE_COLLECTION_SHELTERS).document()
+async def create_shelter(shelter: ShelterCreate):
+    shelter_id = shelters_repo.new_id()
     data = shelter.dict()
     data.update({
-        "id": ref.id,
+        "id": shelter_id,
         "rescuedMembers": [],
         "currentOccupancy": 0,
         "lastUpdated": int(time.time() * 1000),
     })
-    ref.set(data)
-    return enrich_shelter_with_users(data)
+    data = stamped(data)
+    await shelters_repo.set(shelter_id, data)
+    location_index.put(settings.FIREBASE_COLLECTION_SHELTERS, shelter_id, data)
+    return _attach_users(data, {})
 
 
 # ---------- LIST ALL SHELTERS ----------
 @router.get("", response_model=list[ShelterResponse])
-def list_shelters():
-    shelters = db.collection(settings.FIREBASE_COLLECTION_SHELTERS).stream()
-    results = []
-    for s in shelters:
-        data = s.to_dict()
-        data["id"] = s.id
-        results.append(enrich_shelter_with_users(data))
-    return results
+async def list_shelters(
+    response: Response,
+    page: PageParams = Depends(page_params),
+    include: str | None = INCLUDE_QUERY,
+    status: str | None = Query(None),
+    isActive: bool | None = Query(None),
+    updated_since: int | None = Query(None, description="Only shelters updated at or after this epoch-ms time"),
+):
+    where = []
+    if status:
+        where.append(("status", "==", status))
+    if isActive is not None:
+        where.append(("isActive", "==", isActive))
+    fields = page.fields
+    if fields and ("currentOccupancy" in fields or _wants_members(include)):
+        # occupancy and enrichment are derived from the member list
+        fields = [*fields, "rescuedMembers"]
+    if updated_since is None:
+        result = await shelters_repo.page(*where, limit=page.limit, after=page.after, fields=fields)
+    else:
+        result = await shelters_repo.page_since(
+            "lastUpdated", updated_since, *where, limit=page.limit, after=page.after, fields=fields,
+        )
+
+    shelters = [{**data, "id": shelter_id} for shelter_id, data in result.items]
+    if _wants_members(include):
+        shelters = await enrich_shelters_with_users(shelters)
+    else:
+        shelters = [_with_member_ids(shelter) for shelter in shelters]
+    shelters = [project(s, page.fields) for s in shelters]
+    return page_response(response, shelters, result.next_cursor, page, model=ShelterResponse)
 
 
 # ---------- GET SHELTER BY ID ----------
 @router.get("/{shelterId}", response_model=ShelterResponse)
-def get_shelter(shelterId: str):
-    doc = db.collection(settings.FIREBASE_COLLECTION_SHELTERS).document(shelterId).get()
-    if not doc.exists:
+async def get_shelter(shelterId: str, include: str | None = INCLUDE_QUERY):
+    data = await shelters_repo.get(shelterId)
+    if data is None:
         raise HTTPException(status_code=404, detail="Shelter not found")
-    data = doc.to_dict()
-    data["id"] = doc.id
-    return enrich_shelter_with_users(data)
+    data["id"] = shelterId
+    if not _wants_members(include):
+        return _with_member_ids(data)
+    return (await enrich_shelters_with_users([data]))[0]
 
 
 # ---------- UPDATE SHELTER ----------
 @router.put("/{shelterId}", response_model=ShelterResponse)
-def update_shelter(shelterId: str, payload: dict):
-    ref = db.collection(settings.FIREBASE_COLLECTION_SHELTERS).document(shelterId)
-    if not ref.get().exists:
-        raise HTTPException(status_code=404, detail="Shelter not found")
-
+async def update_shelter(shelterId: str, payload: dict):
     payload["lastUpdated"] = int(time.time() * 1000)
-    ref.update(payload)
-
-    doc = ref.get()
-    data = doc.to_dict()
-    data["id"] = doc.id
-    return enrich_shelter_with_users(data)
+    try:
+        data = await shelters_repo.update_and_merge(shelterId, stamped(payload))
+    except WriteConflict:
+        raise HTTPException(status_code=409, detail="Shelter was modified concurrently, retry the update")
+    if data is None:
+        raise HTTPException(status_code=404, detail="Shelter not found")
+    location_index.put(settings.FIREBASE_COLLECTION_SHELTERS, shelterId, data)
+    data["id"] = shelterId
+    return (await enrich_shelters_with_users([data]))[0]
 
 
 # ---------- DELETE SHELTER ----------
 @router.delete("/{shelterId}")
-def delete_shelter(shelterId: str):
-    ref = db.collection(settings.FIREBASE_COLLECTION_SHELTERS).document(shelterId)
-    if not ref.get().exists:
+async def delete_shelter(shelterId: str):
+    if not await shelters_repo.delete(shelterId):
         raise HTTPException(status_code=404, detail="Shelter not found")
-    ref.delete()
+    location_index.remove(settings.FIREBASE_COLLECTION_SHELTERS, shelterId)
     return {"message": "Shelter deleted successfully"}
 
 
 # ---------- ADD MEMBER ----------
 @router.post("/{shelterId}/add-member/{memberId}", response_model=ShelterResponse)
 def add_member_to_shelter(shelterId: str, memberId: str):
-    ref = db.collection(settings.FIREBASE_COLLECTION_SHELTERS).document(shelterId)
-    doc = ref.get()
-    if not doc.exists:
-        raise HTTPException(status_code=404, detail="Shelter not found")
+    return enrich_shelter_with_users(admit_to_shelter(shelterId, memberId))
 
-    shelter = doc.to_dict()
-    members = shelter.get("rescuedMembers", [])
 
-    if memberId in members:
+def admit_to_shelter(shelterId: str, memberId: str) -> dict:
+    """Capacity-checked check-in; returns the shelter with member ids."""
+    try:
+        return shelter_admissions.admit(shelterId, memberId)
+    except ShelterNotFound:
+        raise HTTPException(status_code=404, detail="Shelter not found")
+    except AlreadyAdmitted:
         raise HTTPException(status_code=400, detail="Member already in shelter")
-    if len(members) >= shelter["capacity"]:
+    except ShelterFull:
         raise HTTPException(status_code=400, detail="Shelter is at full capacity")
 
-    members.append(memberId)
-    shelter["rescuedMembers"] = members
-    shelter["lastUpdated"] = int(time.time() * 1000)
-    ref.update(shelter)
-
-    shelter["id"] = doc.id
-    return enrich_shelter_with_users(shelter)
-
 
 # ---------- REMOVE MEMBER ----------
 @router.post("/{shelterId}/remove-member/{memberId}", response_model=ShelterResponse)
 def remove_member_from_shelter(shelterId: str, memberId: str):
-    ref = db.collection(settings.FIREBASE_COLLECTION_SHELTERS).document(shelterId)
-    doc = ref.get()
-    if not doc.exists:
+    try:
+        shelter = shelter_admissions.discharge(shelterId, memberId)
+    except ShelterNotFound:
         raise HTTPException(status_code=404, detail="Shelter not found")
-
-    shelter = doc.to_dict()
-    members = shelter.get("rescuedMembers", [])
-    if memberId not in members:
+    except NotAdmitted:
         raise HTTPException(status_code=400, detail="Member not in shelter")
-
-    members.remove(memberId)
-    shelter["rescuedMembers"] = members
-    shelter["lastUpdated"] = int(time.time() * 1000)
-    ref.update(shelter)
-
-    shelter["id"] = doc.id
     return enrich_shelter_with_users(shelter)
-
-
-
-
-
-
-# shelter sms:
-
-def addUserToShelter(shelterId: str, phone: str):
-    # rescuedmember[userid] = phone
-    ref = db.collection(settings.FIREBASE_COLLECTION_SHELTERS).document(shelterId)
-    doc = ref.get()
-    if not doc.exists:
-        raise HTTPException(status_code=404, detail="Shelter not found")
-
-    shelter = doc.to_dict()
-    members = shelter.get("rescuedMembers", {})
-
-    # get name from victims collection:
-    doc_ref = db.collection(settings.FIREBASE_COLLECTION_VICTIMS).document(phone)
-    victim = doc_ref.get()
-    if not victim.exists:    
-        raise HTTPException(status_code=404, detail="Victim not found")
-    
-    name = victim.to_dict().get("name", "Unknown")
-    
-    members[phone] = name
-    shelter["rescuedMembers"] = members
-    shelter["lastUpdated"] = int(time.time() * 1000)
-    ref.update(shelter)
-
-    # update the victim isActive to false:
-    doc_ref = db.collection(settings.FIREBASE_COLLECTION_VICTIMS).document(phone)
-    victim_data = {
-        "isActive": False,
-        "updatedAt": int(time.time() * 1000)
-    }
-    doc_ref.update(victim_data)
-
-
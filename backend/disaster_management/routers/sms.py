@@ -1,9 +1,10 @@
 # from utils.sms import send_sms
+import asyncio
 import datetime
+import logging
 import re
 
-from flask import json
-import requests
+import json
 from fastapi import APIRouter, HTTPException, Form
 from fastapi.responses import PlainTextResponse
 from fastapi import FastAPI
@@ -11,13 +12,29 @@ from fastapi.responses import HTMLResponse, RedirectResponse
 from pydantic import BaseModel
 from typing import List
 from firebase import db, firestore
+from services.state_backend import state_backend
+from services.blocking import run_blocking
+from utils.log import log_sampled
+from services.metrics import sms_dispatch_latency, track_firestore
+from services.location_index import location_index
+from config import settings
+import time
 import math
 
+logger = logging.getLogger(__name__)
+
 
 
 router = APIRouter(prefix="/api", tags=["SMS"])
 
-outgoing_sms_queue: List[dict] = []
+# drained by the SMS gateway app through /get_sms; shared between workers
+outgoing_sms_queue = state_backend.queue("outgoing_sms")
+sms_queue_stats = state_backend.counter("outgoing_sms")
+
+def enqueue_sms(number: str, msg: str):
+    # queued_at is wall-clock time so it means the same in every worker
+    outgoing_sms_queue.push({"number": number, "msg": msg, "queued_at": time.time()})
+    sms_queue_stats.incr("queued")
 
 class SMSRequest(BaseModel):
     number: str
@@ -26,15 +43,24 @@ router = APIRouter(prefix="/api", tags=["SMS"])
 
 @router.post("/queue_sms")
 async def queue_sms(sms: SMSRequest):
-    outgoing_sms_queue.routerend({"number": sms.number, "msg": sms.msg})
+    await run_blocking(enqueue_sms, sms.number, sms.msg)
     return {"status": "queued", "to": sms.number, "msg": sms.msg}
 
 @router.get("/get_sms")
 async def get_sms():
-    if outgoing_sms_queue:
-        return outgoing_sms_queue.pop(0)
+    sms = await run_blocking(outgoing_sms_queue.pop)
+    if sms is not None:
+        queued_at = sms.pop("queued_at", None)
+        if queued_at is not None:
+            sms_dispatch_latency.observe(max(0.0, time.time() - queued_at))
+        await run_blocking(sms_queue_stats.incr, "dispatched")
+        return sms
     return {"status": "empty"}
 
+@router.get("/sms_queue")
+def sms_queue_status():
+    return {"pending": len(outgoing_sms_queue), **sms_queue_stats.items()}
+
 
 
 # CALCULATING DISTANCEEEE
@@ -48,12 +74,31 @@ def haversine_distance(lat1, lon1, lat2, lon2):
     return R*c
 
 def get_nearest_shelters(user_location, top_n=1): 
-    db = firestore.client()
-    shelters_ref = db.collection('shelters')
-    
+    shelters_ref = db.collection(settings.FIREBASE_COLLECTION_SHELTERS)
+
+    if location_index.ready:
+        # the index picks the shelters, so only those documents are read
+        while True:
+            nearest = location_index.nearest(
+                settings.FIREBASE_COLLECTION_SHELTERS, user_location.latitude, user_location.longitude, top_n
+            )
+            with track_firestore("shelters", "get_all"):
+                docs = {doc.id: doc for doc in db.get_all([shelters_ref.document(shelter_id) for shelter_id, _ in nearest])}
+            stale = [shelter_id for shelter_id, _ in nearest if shelter_id not in docs or not docs[shelter_id].exists]
+            if not stale:
+                return [
+                    {**docs[shelter_id].to_dict(), "distance_km": distance, "id": shelter_id}
+                    for shelter_id, distance in nearest
+                ]
+            # deleted outside this process: drop them so the next nearest take their place
+            for shelter_id in stale:
+                location_index.remove(settings.FIREBASE_COLLECTION_SHELTERS, shelter_id)
+
     nearest_shelters = []
     
-    for doc in shelters_ref.stream():
+    with track_firestore("shelters", "query"):
+        docs = list(shelters_ref.stream())
+    for doc in docs:
         data = doc.to_dict()
         # Check if 'lat' and 'lon' exist
         if 'latitude' in data and 'longitude' in data:
@@ -65,7 +110,8 @@ def get_nearest_shelters(user_location, top_n=1):
             data['id'] = doc.id
             nearest_shelters.append(data)
         else:
-            print(f"Skipping {doc.id}, missing lat/lon")
+            log_sampled(logger, logging.WARNING, "shelter-missing-location",
+                        "Skipping shelter without lat/lon", fields={"shelter": doc.id})
     
     # Sort by distance
     nearest_shelters.sort(key=lambda x: x['distance_km'])
@@ -89,7 +135,7 @@ def send_REPLY(to: str, lat: float, lon: float, type: int):
 
             # Combine into final message
             final_msg = base_msg + "Nearest shelters:\n" + "\n".join(shelters_lines)
-            print(final_msg)
+            logger.debug("Shelter reply: %s", final_msg)
 
             # Send SMS
             send_sms(to, final_msg)
@@ -162,10 +208,11 @@ async def form_page():
 
 @router.post("/send_form")
 async def send_form(number: str = Form(...), msg: str = Form(...)):
-    outgoing_sms_queue.append({"number": number, "msg": msg})
+    await run_blocking(enqueue_sms, number, msg)
     return RedirectResponse("/api/test-sms", status_code=303)
 
 API_URL = "https://yourowncustommessagingservice.onrender.com/queue_sms"
+SMS_API_TIMEOUT_SECONDS = 10
 
 def send_sms(to: str, msg: str) -> dict:
     """
@@ -182,13 +229,16 @@ def send_sms(to: str, msg: str) -> dict:
         "number": to,
         "msg": msg
     }
+    # requests is only needed once a message goes out, not at import
+    import requests
+
     try:
-        response = requests.post(API_URL, json=payload)
-        response.raise_for_status() 
-        print("MSSG SENT") # Raise error if HTTP status != 200
+        response = requests.post(API_URL, json=payload, timeout=SMS_API_TIMEOUT_SECONDS)
+        response.raise_for_status()  # Raise error if HTTP status != 200
+        log_sampled(logger, logging.DEBUG, "sms-sent", "SMS sent", fields={"to": to})
         return response.json()
     except requests.RequestException as e:
-        print("Error sending SMS:", e)
+        logger.warning("Error sending SMS: %s", e, extra={"fields": {"to": to}})
         return {"status": "error", "error": str(e)}
 
 
@@ -204,12 +254,10 @@ async def sendAlert(alert: DisasterAlertRequest):
     sends an alert message to all numbers via send_sms.
     """
     msg = f"DISASTERLINKx9040 {alert.disaster_name}\nStay safe and follow instructions."
-    print(alert.numbers)
-    print(alert.disaster_name)
-    results = []
-    for num in alert.numbers:
-        res = send_sms(num, msg)
-        results.append({"number": num, "result": res})
+    logger.info("Sending disaster alert", extra={"fields": {"disaster": alert.disaster_name, "numbers": len(alert.numbers)}})
+    # sends run side by side on the I/O pool instead of one after another on the loop
+    responses = await asyncio.gather(*(run_blocking(send_sms, num, msg) for num in alert.numbers))
+    results = [{"number": num, "result": res} for num, res in zip(alert.numbers, responses)]
 
     return {
         "status": "completed",
@@ -252,11 +300,227 @@ from services import user_service, incident_service
 from routers.users import get_user_by_phone
 
 from routers.victims import update_victim_location, updateStatus
-from routers.rescuers import update_rescuer_location
-from routers.shelters import add_member_to_shelter
+from routers.rescuers import update_rescuer_location, find_rescuer_id_by_phone
+from routers.shelters import admit_to_shelter
+from services.location_buffer import location_buffer
+from services.sos_dedup import sos_dedup
+from utils.change_stamp import stamped
+from config import settings
+from utils.sms_codec import (
+    find_compact_frame,
+    decode_location_frame,
+    OP_VICTIM_LOCATION,
+    OP_RESCUER_LOCATION,
+    OP_SOS,
+)
 # from routers.rescue_ops import sendVictimListToTeamMember
 
 
+# matches from { to end of string
+SMS_PAYLOAD_RE = re.compile(r'\{.*\}$')
+
+
+def parse_sms(body: dict) -> tuple:
+    """
+    Extracts the inner JSON from the 'msg' field of a gateway SMS.
+
+    Returns:
+        tuple: (from_phone, command, payload). command is "" and payload is {}
+        when the message carries no valid JSON.
+    """
+    from_phone = body.get("from", "")
+    match = SMS_PAYLOAD_RE.search(body.get("msg", ""))
+    if not match:
+        log_sampled(logger, logging.INFO, "sms-no-json", "No JSON found in the message", fields={"from": from_phone})
+        return from_phone, "", {}
+    try:
+        payload = json.loads(match.group(0))
+    except ValueError:
+        log_sampled(logger, logging.INFO, "sms-bad-json",
+                    "Invalid command format. Use: COMMAND {\"json\": \"payload\"}", fields={"from": from_phone})
+        return from_phone, "", {}
+    if not isinstance(payload, dict):
+        return from_phone, "", {}
+    return from_phone, payload.get("msg", ""), payload
+
+
+# ---------- JSON command handlers ----------
+# Each handler takes (from_phone, payload) and returns an optional dict for logging.
+
+def _handle_victim_location(from_phone: str, payload: dict):
+    if not from_phone:
+        return None
+    update_victim_location(
+        lat=payload.get("lat"),
+        lon=payload.get("lon"),
+        bat=payload.get("bat"),
+        phone=from_phone
+    )
+
+
+def _handle_rescuer_location(from_phone: str, payload: dict):
+    # trust the registered sender phone over the email in the payload
+    rescuer_id = find_rescuer_id_by_phone(from_phone) or payload.get("rescuer_email")
+    if not rescuer_id:
+        return None
+    update_rescuer_location(
+        lat=payload.get("lat"),
+        lon=payload.get("lon"),
+        id=rescuer_id
+    )
+
+
+def _handle_add_to_shelter(from_phone: str, payload: dict):
+    # the SMS reply needs no member details, so skip enrichment
+    admit_to_shelter(
+        shelterId=payload.get("shelterId"),
+        memberId=from_phone
+    )
+
+
+def _handle_sos(from_phone: str, payload: dict):
+    # create a message in the Messages collection with Type = 101.
+    # Repeats within the dedup window fold into the same document.
+    lat = payload.get("lat")
+    lon = payload.get("lon")
+    location = firestore.GeoPoint(lat, lon)
+    now_ist = datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=5, minutes=30))).isoformat()  # IST timestamp
+
+    messages_ref = db.collection(settings.FIREBASE_COLLECTION_MESSAGES)
+    decision = sos_dedup.register(from_phone, lambda: messages_ref.document().id)
+    message = {
+        "Message": "SOS Alert",
+        "Sender": from_phone,
+        "Type": 101,
+        "Battery": payload.get("bat"),
+        "location": location,
+        "LastTimestamp": now_ist,
+        "RepeatCount": firestore.Increment(1),
+        "updatedAt": int(time.time() * 1000),  # LastTimestamp is display text
+    }
+    if decision.is_new:
+        message["Timestamp"] = now_ist
+    # merge so a repeat racing ahead of the first write still lands correctly
+    messages_ref.document(decision.message_id).set(stamped(message), merge=True)
+
+    if not decision.should_reply:
+        return {"msg": "SOS folded into existing alert", "messageId": decision.message_id}
+
+    # send shelter info reply
+    base_msg = "DISASTERLINKx9040 101 !\n"
+
+    # Construct user location
+    user_loc = firestore.GeoPoint(lat, lon)
+    top3 = get_nearest_shelters(user_loc)
+
+    # Format shelters info as readable plain text
+    shelters_lines = []
+    for shelter in top3:
+        line = f"{shelter['name']} {round(shelter['distance_km'], 2)} km, {shelter.get('latitude','N/A')},{shelter.get('longitude','N/A')}, {shelter.get('contactNumber','N/A')}"
+        shelters_lines.append(line)
+
+    # Combine into final message
+    final_msg = base_msg + "Nearest shelters:\n" + "\n".join(shelters_lines)
+    log_sampled(logger, logging.DEBUG, "sos-reply", "SOS reply: %s", final_msg, fields={"to": from_phone})
+
+    # Send SMS
+    send_sms(from_phone, final_msg)
+
+    # Optionally, return dict for logging
+    return {
+        "msg": base_msg.strip(),
+        "nearest_shelters": top3
+    }
+
+
+def _handle_unconscious(from_phone: str, payload: dict):
+    # get the user using from number and then update the status field to critical
+    updateStatus(phone=from_phone, status="Critical")
+
+
+COMMAND_HANDLERS = {
+    "User Location update": _handle_victim_location,
+    "Rescuer location update": _handle_rescuer_location,
+    "201": _handle_add_to_shelter,  # add member to shelter
+    "sos": _handle_sos,
+    "victim is unconscious": _handle_unconscious,
+}
+
+
+# ---------- Compact frame handlers ----------
+# Each handler takes (from_phone, fixes) where fixes is a list of LocationFix.
+
+def _handle_compact_victim_location(from_phone: str, fixes: list):
+    # only the newest fix changes the document; older ones are superseded
+    fix = max(fixes, key=lambda f: f.timestamp)
+    update_victim_location(
+        lat=fix.latitude,
+        lon=fix.longitude,
+        bat=fix.battery,
+        phone=from_phone,
+        updated_at=fix.timestamp * 1000
+    )
+
+
+def _handle_compact_rescuer_location(from_phone: str, fixes: list):
+    rescuer_id = find_rescuer_id_by_phone(from_phone)
+    if not rescuer_id:
+        log_sampled(logger, logging.WARNING, "sms-unknown-rescuer", "No rescuer registered for sender",
+                    fields={"from": from_phone})
+        return None
+    fix = max(fixes, key=lambda f: f.timestamp)
+    update_rescuer_location(
+        lat=fix.latitude,
+        lon=fix.longitude,
+        id=rescuer_id,
+        updated_at=fix.timestamp * 1000
+    )
+
+
+def _handle_compact_sos(from_phone: str, fixes: list):
+    fix = max(fixes, key=lambda f: f.timestamp)
+    return _handle_sos(from_phone, {"lat": fix.latitude, "lon": fix.longitude, "bat": fix.battery})
+
+
+COMPACT_HANDLERS = {
+    OP_VICTIM_LOCATION: _handle_compact_victim_location,
+    OP_RESCUER_LOCATION: _handle_compact_rescuer_location,
+    OP_SOS: _handle_compact_sos,
+}
+
+
+def dispatch_sms(body: dict) -> tuple:
+    """
+    Routes one gateway SMS to its handler, whether it carries a compact
+    binary frame or a legacy JSON payload.
+
+    Returns:
+        tuple: (handled, result). handled is False for unknown or malformed messages.
+    """
+    from_phone = body.get("from", "")
+    frame = find_compact_frame(body.get("msg", ""))
+    if frame is not None:
+        try:
+            opcode, fixes = decode_location_frame(frame)
+        except ValueError as e:
+            log_sampled(logger, logging.WARNING, "sms-bad-frame", "Invalid compact frame: %s", e,
+                        fields={"from": from_phone})
+            return False, None
+        handler = COMPACT_HANDLERS.get(opcode)
+        if handler is None or not fixes:
+            log_sampled(logger, logging.WARNING, "sms-bad-opcode", "Unknown compact opcode",
+                        fields={"from": from_phone, "opcode": opcode})
+            return False, None
+        return True, handler(from_phone, fixes)
+
+    from_phone, command, payload = parse_sms(body)
+    log_sampled(logger, logging.DEBUG, "sms-command", "SMS command", fields={"from": from_phone, "command": command})
+    handler = COMMAND_HANDLERS.get(command)
+    if handler is None:
+        log_sampled(logger, logging.INFO, "sms-unknown-command", "Unknown command",
+                    fields={"from": from_phone, "command": command})
+        return False, None
+    return True, handler(from_phone, payload)
 
 
 @router.post("/receive_sms")
@@ -265,200 +529,50 @@ def receive_sms(body: dict):
     Parses and routes an incoming SMS command to the correct service.
     Returns the text for the reply SMS.
     """
-    try:
-        print("body:", body)
-        # Extract the inner JSON from the 'msg' field
-        msg_field = body.get("msg", "")
-        match = re.search(r'\{.*\}$', msg_field)
-        if match:
-            inner_json = match.group(0)
-            payload = json.loads(inner_json)
-            command = payload.get("msg", "")
-            print("----------------------------------------------------------")
-            print("command:", command)
-            print(command == "User Location update")
-        else:
-            print("No JSON found in the message.")
-            payload = {}
-            command = ""
-        from_phone = body.get("from", "")
-    except (ValueError, json.JSONDecodeError):
-        print("Invalid command format. Use: COMMAND {\"json\": \"payload\"}")
-
-    # First, identify the user sending the SMS
-    # user = get_user_by_phone(from_phone)
-    # if not user:
-    #     return "Your phone number is not registered with the system. Cannot process request."
-
-    # Route command to the appropriate logic
-    # if command == "USER_STATUS_UPDATE":
-    #     try:
-    #         status = payload["status"]
-    #         location = Location.model_validate(payload["location"])
-    #         user_service.update_user_status_and_location(user['userId'], status, location)
-    #         return f"Success! Your status has been updated to '{status}'."
-    #     except (ValidationError, KeyError) as e:
-    #         return f"Error: Invalid data for STATUS_UPDATE. Details: {e}"
-
-    # elif command == "INCIDENT_REPORT":
-    #     try:
-    #         # Add the user's ID to the incident report
-    #         payload["reportedBy"] = user['userId']
-    #         incident_data = IncidentCreate.model_validate(payload)
-    #         new_incident = incident_service.create_new_incident(incident_data)
-    #         return f"Incident reported successfully. Your incident ID is {new_incident.incidentId}."
-    #     except (ValidationError, KeyError) as e:
-    #         return f"Error: Invalid data for INCIDENT_REPORT. Details: {e}"
-        
-
-    if command == "User Location update":
-        print("inside user location update")
-        # params: update_victim_location(lat: float, lon: float, msg: str, bat: int, time: str, phone: str):            
-        update_victim_location(
-            lat=payload.get("lat"),
-            lon=payload.get("lon"),
-            bat=payload.get("bat"),
-            phone=from_phone
-        )
- 
-    elif command == "Rescuer location update":
-        print("inside rescuer location update")
-        # params: update_rescuer_location(lat: float, lon: float, msg: str, bat: int, time: str, id: str):
-        update_rescuer_location(
-            lat=payload.get("lat"),
-            lon=payload.get("lon"),
-            id=payload.get("rescuer_email")
-
-        )
-
-    elif command == "201": # add member to shelter
-        # params: addUserToShelter(shelterId: str, phone: str):
-        add_member_to_shelter(
-            shelterId=payload.get("shelterId"),
-            memberId=from_phone
-        )
-
-    elif command == "sos": # remove member from shelter
-        # create a message in the Messages collection with Type = 101
-        lat = payload.get("lat")
-        lon = payload.get("lon")
-        location = firestore.GeoPoint(lat, lon)
-        message = {
-            "Message": "SOS Alert",
-            "Sender": from_phone,
-            "Timestamp": datetime.datetime.now(datetime.timezone(datetime.timedelta(hours=5, minutes=30))).isoformat(),  # IST timestamp
-            "Type": 101,
-            "Battery": payload.get("bat"),
-            "location": location
-        }
-
-        # Ensure Firestore client is used
-        firestore_client = firestore.client()
-        firestore_client.collection("Messages").add(message)
-
-        # send shelter info reply
-        # send
-        base_msg = "DISASTERLINKx9040 101 !\n"
-
-        # Construct user location
-        user_loc = firestore.GeoPoint(lat, lon)
-        top3 = get_nearest_shelters(user_loc)
-
-        # Format shelters info as readable plain text
-        shelters_lines = []
-        for shelter in top3:
-            line = f"{shelter['name']} {round(shelter['distance_km'], 2)} km, {shelter.get('latitude','N/A')},{shelter.get('longitude','N/A')}, {shelter.get('contactNumber','N/A')}"
-            shelters_lines.append(line)
-
-        # Combine into final message
-        final_msg = base_msg + "Nearest shelters:\n" + "\n".join(shelters_lines)
-        print(final_msg)
-
-        # Send SMS
-        send_sms(from_phone, final_msg)
-
-        # Optionally, return dict for logging
-        return {
-            "msg": base_msg.strip(),
-            "nearest_shelters": top3
-        }
-    
-    elif command == "victim is unconscious":
-        # get the user using from number and then update the status field to critical
-        # trim leading +
-        updateStatus(phone=from_phone, status="Critical")
-        # if from_phone.startswith("+"):
-        
-
-        
-      
-        
-
-    # elif command == "1":
-        # params: sendVictimListToTeamMember(rescuerId: str):
-        # sendVictimListToTeamMember(
-        #     rescuerId=from_phone
-        # )
-
-    # elif command == "SEND_NEAREST_SHELTER":
-    #     message_text = payload.get("msg", "")
-    #     sender = from_phone
-    #     match = re.search(r'\{.*\}$', message_text)   # matches from { to end of string
-    #     if match:
-    #         json_str = match.group(0)
-    #         data = json.loads(json_str)
-    #         latitude = data['lat']
-    #         longitude = data['lon']
-
-    #         # Create GeoPoint object
-    #         location = firestore.GeoPoint(latitude, longitude) if latitude and longitude else None
-
-    #         # Prepare document data
-    #         doc_data = {
-    #             "Message": data['msg'],
-    #             "Sender": sender,
-    #             "Timestamp": firestore.SERVER_TIMESTAMP,
-    #             "Type": int(data['sos']),
-    #             "Battery": data['bat'],
-    #             "location": location
-    #         }
-
-    #         # Add document to 'Messages' collection
-    #         db.collection("Messages").add(doc_data)
-    #         send_REPLY(sender, latitude, longitude, int(data['sos']))
-    #         return {"status": "received"}
-    #     else:
-    #         print("No JSON found in the message.")
-    #     longitude=data['lon']
-
-    #     # Create GeoPoint object
-    #     location = firestore.GeoPoint(latitude, longitude) if latitude and longitude else None
-
-    #     # Prepare document data
-    #     doc_data = {
-    #         "Message": data['msg'],
-    #         "Sender": sender,
-    #         "Timestamp": firestore.SERVER_TIMESTAMP ,
-    #         "Type": int(data['sos']),
-    #         "Battery": data['bat'],
-    #         "location": location
-    #     }
-
-    #     # Add document to 'Messages' collection
-    #     db.collection("Messages").add(doc_data)
-    #     send_REPLY(sender,latitude,longitude,int(data['sos']))
-    #     return {"status": "received"}
-    # else:
-    #     print("No JSON found in the message.")
+    log_sampled(logger, logging.DEBUG, "sms-received", "SMS received: %s", body)
+    handled, result = dispatch_sms(body)
+    return result
 
 
 
-    
+class SMSBatchRequest(BaseModel):
+    messages: List[dict]  # same {"from": ..., "msg": ...} bodies /receive_sms takes
 
 
-    # SEND NEAREST SHELTER ID, with list of users in that particular area when team is assigned
+@router.post("/receive_sms/batch")
+def receive_sms_batch(batch: SMSBatchRequest):
+    """
+    Accepts a backlog of received SMS replayed by the gateway in one request.
 
+    Messages are dispatched in arrival order. Location updates land in the
+    location buffer, so the newest fix from the same sender (by fix time)
+    replaces older ones, and the buffer is flushed with batched Firestore
+    writes before returning.
+    """
+    processed = 0
+    ignored = 0
+    errors = 0
+
+    for body in batch.messages:
+        try:
+            handled, _ = dispatch_sms(body)
+        except Exception:
+            logger.exception("Error processing batched SMS", extra={"fields": {"from": body.get("from")}})
+            errors += 1
+            continue
+        if handled:
+            processed += 1
+        else:
+            ignored += 1
 
+    written, failed = location_buffer.flush()
 
-    else:
-        print(f"Unknown command: {command}.")
\ No newline at end of file
+    return {
+        "status": "received",
+        "received": len(batch.messages),
+        "commandsProcessed": processed,
+        "ignored": ignored,
+        "errors": errors,
+        "locationUpdatesWritten": written,
+        "locationUpdatesFailed": failed,
+    }
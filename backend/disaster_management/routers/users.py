@@ -1,18 +1,23 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
 from firebase import db
 from config import settings
 from schemas.user import UserCreate, UserResponse
 from utils.common import calculate_age
+from services.identity_index import identity_index, USER
+from services.repository import users_repo, shelters_repo
+from utils.firestore_preconditions import WriteConflict
+from utils.pagination import PageParams, page_params, page_response, project
+from utils.streaming import stream_format, streaming_response
 
 router = APIRouter(prefix="/api/users", tags=["Users"])
 
 @router.post("", response_model=UserResponse)
-def create_user(user: UserCreate):
+async def create_user(user: UserCreate):
     try:
         age = calculate_age(user.dob)
-        doc_ref = db.collection(settings.FIREBASE_COLLECTION_USERS).document()
+        user_id = users_repo.new_id()
         user_data = {
-            "userId": doc_ref.id,
+            "userId": user_id,
             "name": user.name,
             "dob": user.dob,
             "age": age,
@@ -23,72 +28,85 @@ def create_user(user: UserCreate):
             "bloodGroup": user.bloodGroup,
             "location": user.location.dict(),
         }
-        doc_ref.set(user_data)
+        await users_repo.set(user_id, user_data)
+        identity_index.put(USER, user_id, user.contactNo)
         return user_data
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.get("/{userId}", response_model=UserResponse)
-def get_user(userId: str):
-    doc = db.collection(settings.FIREBASE_COLLECTION_USERS).document(userId).get()
-    if not doc.exists:
-        print("inside get user")
+async def get_user(userId: str):
+    user = await users_repo.get(userId)
+    if user is None:
         raise HTTPException(status_code=404, detail="User not found")
-    return doc.to_dict()
+    return user
 
 @router.get("/by-phone/{phone_number}", response_model=UserResponse)
 def get_user_by_phone(phone_number: str):
     users_ref = db.collection(settings.FIREBASE_COLLECTION_USERS)
-    query = users_ref.where("phoneNumber", "==", phone_number).limit(1).stream()
-    user_doc = next(query, None)
-    print(query)
-    print(user_doc.to_dict() if user_doc else "No user found")
-    if user_doc and user_doc.exists:
-        return user_doc.to_dict()
+    user_id = identity_index.resolve(phone_number, USER)
+    if user_id:
+        doc = users_ref.document(user_id).get()
+        if doc.exists:
+            return doc.to_dict()
+        identity_index.remove(USER, user_id)
+    # the index may still be loading; an unknown number is only queried once per IDENTITY_MISS_TTL_SECONDS
+    if not identity_index.recently_missed(phone_number, USER):
+        query = users_ref.where("phoneNumber", "==", phone_number).limit(1).stream()
+        user_doc = next(query, None)
+        if user_doc and user_doc.exists:
+            identity_index.put(USER, user_doc.id, phone_number)
+            return user_doc.to_dict()
+        identity_index.record_miss(phone_number, USER)
     raise HTTPException(status_code=404, detail="User not found")
 
 @router.put("/{userId}")
-def update_user(userId: str, payload: dict):
-    doc_ref = db.collection(settings.FIREBASE_COLLECTION_USERS).document(userId)
-    if not doc_ref.get().exists:
-        print("inside update user")
-        raise HTTPException(status_code=404, detail="User not found")
+async def update_user(userId: str, payload: dict):
     # Update age if dob is present in payload
     if "dob" in payload:
         payload["age"] = calculate_age(payload["dob"])
-    doc_ref.update(payload)
-    return doc_ref.get().to_dict()
+    try:
+        user = await users_repo.update_and_merge(userId, payload)
+    except WriteConflict:
+        raise HTTPException(status_code=409, detail="User was modified concurrently, retry the update")
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    if "contactNo" in payload:
+        identity_index.put(USER, userId, payload["contactNo"])
+    return user
 
 @router.delete("/{userId}")
-def delete_user(userId: str):
-    doc_ref = db.collection(settings.FIREBASE_COLLECTION_USERS).document(userId)
-    if not doc_ref.get().exists:
-        print("inside delete user")
+async def delete_user(userId: str):
+    if not await users_repo.delete(userId):
         raise HTTPException(status_code=404, detail="User not found")
-    doc_ref.delete()
+    identity_index.remove(USER, userId)
     return {"message": "User deleted successfully"}
 
 
 @router.get("", response_model=list[UserResponse])
-def list_users():
-    docs = db.collection(settings.FIREBASE_COLLECTION_USERS).stream()
-    users = [doc.to_dict() for doc in docs]
-    return users
-
-
-
-@router.get("", response_model=list[UserResponse])
-def list_users(shelterId: str | None = None):
-    docs = db.collection(settings.FIREBASE_COLLECTION_USERS).stream()
-    users = [doc.to_dict() for doc in docs]
-
+async def list_users(
+    response: Response,
+    page: PageParams = Depends(page_params),
+    shelterId: str | None = None,
+    status: str | None = Query(None),
+    fmt: str | None = Depends(stream_format),
+):
     if shelterId:
-        # fetch the shelter
-        shelter_doc = db.collection(settings.FIREBASE_COLLECTION_SHELTERS).document(shelterId).get()
-        if not shelter_doc.exists:
+        # a shelter's members are bounded by its capacity, so fetch them directly
+        shelter = await shelters_repo.get(shelterId)
+        if shelter is None:
             raise HTTPException(status_code=404, detail="Shelter not found")
+        fields = page.fields and [*page.fields, "status"]
+        members = await users_repo.get_many(shelter.get("rescuedMembers") or [], fields=fields)
+        users = [project(user, page.fields) for user in members.values() if not status or user.get("status") == status]
+        return page_response(response, users, None, page, model=UserResponse)
 
-        member_ids = shelter_doc.to_dict().get("rescuedMembers", [])
-        users = [u for u in users if u["userId"] in member_ids]
+    where = [("status", "==", status)] if status else []
+    if fmt:
+        async def rows():
+            async for _, user in users_repo.stream(*where, fields=page.fields):
+                yield user
+        return streaming_response(rows(), fmt, None if page.fields else UserResponse)
 
-    return users
+    result = await users_repo.page(*where, limit=page.limit, after=page.after, fields=page.fields)
+    return page_response(response, [user for _, user in result.items], result.next_cursor, page, model=UserResponse)
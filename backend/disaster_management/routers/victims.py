@@ -1,35 +1,73 @@
 # routes/victims.py
-from fastapi import APIRouter, HTTPException
+import logging
+
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
 from typing import List
 from schemas.victims import Victim
 from datetime import datetime, timezone
 from config import settings
 from firebase import db
+from services.location_buffer import location_buffer
+from services.location_index import location_index
+from utils.change_stamp import stamped
+from services.identity_index import identity_index, VICTIM
+from services.repository import victims_repo
+from utils.pagination import PageParams, page_params, page_response, project
+from utils.streaming import stream_format, streaming_response
 
 router = APIRouter(prefix="/api/victims", tags=["Victims"])
 
-# In-memory store for now (replace with DB later)
-victims_db: List[Victim] = []
+logger = logging.getLogger(__name__)
 
 @router.get("", response_model=List[Victim])
-def get_victims():
-    docs = db.collection(settings.FIREBASE_COLLECTION_VICTIMS).stream()
+async def get_victims(
+    response: Response,
+    page: PageParams = Depends(page_params),
+    isActive: bool = Query(True),
+    status: str | None = Query(None),
+    updated_since: int | None = Query(None, description="Only victims updated at or after this epoch-ms time"),
+    fmt: str | None = Depends(stream_format),
+):
+    where = [("isActive", "==", isActive)]
+    if status:
+        where.append(("status", "==", status))
+
+    if fmt:
+        # full export: every matching victim, encoded as it is read
+        if updated_since is None:
+            queries = [where]
+        else:
+            # updatedAt is epoch ms from this server and a Timestamp from the apps, and Firestore compares one type at a time
+            since = datetime.fromtimestamp(updated_since / 1000, timezone.utc)
+            queries = [[*where, ("updatedAt", ">=", updated_since)], [*where, ("updatedAt", ">=", since)]]
+
+        async def rows():
+            for query in queries:
+                async for doc_id, data in victims_repo.stream(*query, fields=page.fields):
+                    victim = location_buffer.overlay(settings.FIREBASE_COLLECTION_VICTIMS, doc_id, data)
+                    if victim.get("isActive", isActive) is isActive:
+                        yield project(victim, page.fields)
+        return streaming_response(rows(), fmt, None if page.fields else Victim)
+
+    if updated_since is None:
+        result = await victims_repo.page(*where, limit=page.limit, after=page.after, fields=page.fields)
+    else:
+        result = await victims_repo.page_since(
+            "updatedAt", updated_since, *where, limit=page.limit, after=page.after, fields=page.fields,
+        )
+
     victims = []
-    for doc in docs:
-        victim = doc.to_dict()
-        if victim.get("isActive") is True:
+    for doc_id, data in result.items:
+        victim = location_buffer.overlay(settings.FIREBASE_COLLECTION_VICTIMS, doc_id, data)
+        # a buffered update may not have reached Firestore's copy of isActive yet
+        if victim.get("isActive", isActive) is isActive:
         #     if "authId" in victim:
         #         victim["victimId"] = victim.pop("authId")
-            victims.append(victim)
+            victims.append(project(victim, page.fields))
 
-    print(victims)
-    print("******************************************************************8")
-    print("******************************************************************8")
-    print("******************************************************************8")
-    print("******************************************************************8")
-    print("******************************************************************8")
+    logger.debug("Returning victims", extra={"fields": {"count": len(victims), "more": bool(result.next_cursor)}})
 
-    return victims
+    return page_response(response, victims, result.next_cursor, page, model=Victim)
 
 
 
@@ -43,44 +81,57 @@ def get_victims():
 
 
 # victim sms:
-from pytz import timezone as pytz_timezone
+import time
 
 
 
-def update_victim_location(lat: float, lon: float, bat: int, phone: str):
-    # get id==phone from victims collection    
-    # update the victim document
-    # trim leading + from phone if present
+def victim_doc_id(phone: str) -> str:
+    """
+    Victim documents are keyed by the phone number without the leading '+'.
+    The identity index maps differently formatted senders to the same document.
+    """
+    doc_id = identity_index.resolve(phone, VICTIM)
+    if doc_id:
+        return doc_id
     if phone.startswith("+"):
         phone = phone[1:]
-    doc_ref = db.collection(settings.FIREBASE_COLLECTION_VICTIMS).document(phone)
-    ist = pytz_timezone('Asia/Kolkata')
-    now_ist = datetime.now(ist)
-    victim_data = {
+    return phone
+
+
+def victim_location_fields(lat: float, lon: float, bat: int, updated_at: int | None = None) -> dict:
+    """Fields written to a victim document for a location update. updated_at is epoch ms, default now."""
+    if updated_at is None:
+        updated_at = int(time.time() * 1000)
+    return {
         "latitude": lat,
         "longitude": lon,
         "battery": bat,
-        "updatedAt": int(now_ist.timestamp() * 1000)
-
+        "updatedAt": updated_at
     }
-    doc_ref.update(victim_data)
+
+
+def update_victim_location(lat: float, lon: float, bat: int, phone: str, updated_at: int | None = None):
+    # get id==phone from victims collection    
+    # queue the update; the location buffer coalesces and flushes it
+    doc_id = victim_doc_id(phone)
+    fields = victim_location_fields(lat, lon, bat, updated_at)
+    # a fix older than one already taken (a delayed SMS, a replayed backlog) is dropped
+    if location_buffer.put(settings.FIREBASE_COLLECTION_VICTIMS, doc_id, fields, fixed_at=fields["updatedAt"]):
+        location_index.update(settings.FIREBASE_COLLECTION_VICTIMS, doc_id, fields)
 
 
 def updateStatus(phone: str, status: str):
     # get id==phone from victims collection    
     # update the victim document
-    # trim leading + from phone if present
-    if phone.startswith("+"):
-        phone = phone[1:]
-    doc_ref = db.collection(settings.FIREBASE_COLLECTION_VICTIMS).document(phone)
-    ist = pytz_timezone('Asia/Kolkata')
-    now_ist = datetime.now(ist)
+    doc_id = victim_doc_id(phone)
+    doc_ref = db.collection(settings.FIREBASE_COLLECTION_VICTIMS).document(doc_id)
     victim_data = {
         "status": status,
-        "updatedAt": int(now_ist.timestamp() * 1000)
+        "updatedAt": int(time.time() * 1000)
 
     }
-    doc_ref.update(victim_data)
+    doc_ref.update(stamped(victim_data))
+    location_index.update(settings.FIREBASE_COLLECTION_VICTIMS, doc_id, victim_data)
 
 
 
@@ -158,7 +209,9 @@ def generate_dummy_victims():
         }
         
         # Add the new victim to the 'victims' collection
-        db.collection(settings.FIREBASE_COLLECTION_VICTIMS).document(doc_id).set(victim_data)
+        db.collection(settings.FIREBASE_COLLECTION_VICTIMS).document(doc_id).set(stamped(victim_data))
+        identity_index.put(VICTIM, doc_id, phone_number_str)
+        location_index.put(settings.FIREBASE_COLLECTION_VICTIMS, doc_id, victim_data)
         created_victims.append(victim_data)
         
     return {
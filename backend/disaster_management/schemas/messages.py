@@ -13,6 +13,8 @@ class MessageBase(BaseModel):
     timestamp: datetime = Field(..., alias="Timestamp")
     message: str = Field(..., alias="Message")
     location: Optional[Location] = None
+    repeatCount: Optional[int] = Field(None, alias="RepeatCount")  # SOS repeats folded into this message
+    lastTimestamp: Optional[datetime] = Field(None, alias="LastTimestamp")
 
     class Config:
         allow_population_by_field_name = True
@@ -21,6 +21,8 @@ class RescueMemberCreate(BaseModel):
     phone: str
     status: Optional[str] = "Free"
     loginAvailable: Optional[bool] = True
+    # SMS payload formats the member's app decodes, e.g. ["DL2"]; others get the plain-text messages
+    smsFormats: List[str] = Field(default_factory=list)
 
 class RescueMemberResponse(BaseModel):
     id: str
@@ -32,6 +34,7 @@ class RescueMemberResponse(BaseModel):
     teamId: Optional[str] = None
     teamName: Optional[str] = None
     location: Optional[Location] = None
+    smsFormats: List[str] = Field(default_factory=list)
 
 
 # --- Team Schemas (NEW STRUCTURE) ---
@@ -1,7 +1,7 @@
 # shelter schema
 
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Union
 import time
 from schemas.user import UserResponse
 
@@ -22,5 +22,6 @@ class ShelterCreate(BaseModel):
 class ShelterResponse(ShelterCreate):
     id: str
     currentOccupancy: int = 0
-    rescuedMembers: List[UserResponse] = []   # ✅ full user details, not just IDs
+    # member ids, or full user details when requested with ?include=members
+    rescuedMembers: Union[List[UserResponse], List[str]] = []
     lastUpdated: int = int(time.time() * 1000)
@@ -0,0 +1,43 @@
+# services/blocking.py
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from config import settings
+
+# Shared pool for blocking Firestore / HTTP calls made from async handlers.
+# Its size caps how many such calls run at once per worker.
+io_executor = ThreadPoolExecutor(
+    max_workers=settings.BLOCKING_IO_THREADS, thread_name_prefix="blocking-io"
+)
+
+
+async def run_blocking(fn, *args, **kwargs):
+    """
+    Runs a blocking callable on the I/O pool so the event loop stays free.
+    The caller's contextvars go with it, so the work is still attributed
+    to the request that asked for it.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(io_executor, functools.partial(context.run, fn, *args, **kwargs))
+
+
+async def fetch_all(query) -> list:
+    """Streams a Firestore query or collection to a list of snapshots off the event loop."""
+    return await run_blocking(lambda: list(query.stream()))
+
+
+def configure_thread_pools():
+    """
+    Sizes the pools blocking work runs on. Must be called from the running loop.
+
+    Sync (`def`) endpoints run on anyio's worker threads, and
+    `loop.run_in_executor(None, ...)` uses the loop's default executor;
+    both are pointed at settings.BLOCKING_IO_THREADS.
+    """
+    import anyio.to_thread
+
+    anyio.to_thread.current_default_thread_limiter().total_tokens = settings.BLOCKING_IO_THREADS
+    asyncio.get_running_loop().set_default_executor(io_executor)
@@ -0,0 +1,205 @@
+# services/columnar.py
+"""
+Column-per-field storage for in-memory indexes.
+
+A `Layer` keeps one NumPy array per numeric field and one list per text
+field, with a row per document, so a million records cost a few bytes per
+field rather than a dict and boxed values each. Rows freed by `remove`
+are reused by the next insert. Row numbers are only stable while the
+owner's lock is held; anything handed to callers is copied out.
+
+NumPy is imported when the first layer is built, not with this module.
+"""
+import math
+import sys
+
+EARTH_RADIUS_KM = 6371.0
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(lat: float, lon: float, lats, lons):
+    """Great-circle distance in km from one point to arrays of points."""
+    import numpy as np
+
+    lat1, lon1 = math.radians(lat), math.radians(lon)
+    lat2, lon2 = np.radians(lats), np.radians(lons)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+
+class Codes:
+    """
+    Interns a small vocabulary (statuses, genders) as int8 codes. 0 means
+    missing; values beyond the 127th distinct one are stored as missing.
+    """
+
+    def __init__(self):
+        self.values = [None]
+        self._codes = {}
+
+    def code(self, value) -> int:
+        if value is None:
+            return 0
+        code = self._codes.get(value)
+        if code is None:
+            if len(self.values) > 127:
+                return 0
+            code = len(self.values)
+            self.values.append(sys.intern(str(value)))
+            self._codes[value] = code
+        return code
+
+    def value(self, code: int):
+        return self.values[code]
+
+
+def _text_column(values: list):
+    import numpy as np
+
+    encoded = [(value or "").encode() for value in values]
+    return np.array(encoded, dtype=f"S{max(map(len, encoded), default=1)}")
+
+
+class Layer:
+    """Latitude, longitude and last update (epoch ms) per document; subclasses add fields."""
+
+    # (name, dtype, value of an empty row)
+    columns = (("lat", "<f8", math.nan), ("lon", "<f8", math.nan), ("updated", "<i8", 0))
+    # fields held as Python strings, interned
+    text_columns = ()
+    # int8 columns whose codes are stored as text in snapshots: name -> Codes
+    coded_columns = {}
+    # document fields `write` reads beyond position and update time
+    extra_fields = ()
+
+    def __init__(self, capacity: int = 1024):
+        import numpy as np
+
+        self.ids = []    # row -> doc id, None when free
+        self.rows = {}   # doc id -> row
+        self.free = []
+        for name, dtype, empty in self.columns:
+            setattr(self, name, np.full(capacity, empty, dtype=dtype))
+        for name in self.text_columns:
+            setattr(self, name, [])
+
+    def _grow(self, size: int):
+        import numpy as np
+
+        capacity = max(size, 2 * len(self.lat))
+        for name, dtype, empty in self.columns:
+            old = getattr(self, name)
+            new = np.full(capacity, empty, dtype=dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    def _reset(self, row: int):
+        for name, _, empty in self.columns:
+            getattr(self, name)[row] = empty
+        for name in self.text_columns:
+            getattr(self, name)[row] = None
+
+    def _allocate(self, doc_id: str) -> int:
+        if self.free:
+            row = self.free.pop()
+            self.ids[row] = doc_id
+        else:
+            row = len(self.ids)
+            if row >= len(self.lat):
+                self._grow(row + 1)
+            self.ids.append(doc_id)
+            for name in self.text_columns:
+                getattr(self, name).append(None)
+        self.rows[doc_id] = row
+        self._reset(row)
+        return row
+
+    def put(self, doc_id: str, lat: float, lon: float, updated: int | None, data: dict | None = None):
+        row = self.rows.get(doc_id)
+        if row is None:
+            row = self._allocate(doc_id)
+        self.lat[row] = lat
+        self.lon[row] = lon
+        if updated is not None:
+            self.updated[row] = updated
+        if data:
+            self.write(row, data)
+
+    def write(self, row: int, data: dict):
+        """Copies the fields in `data` that this layer keeps into `row`; absent fields are left alone."""
+
+    def remove(self, doc_id: str):
+        row = self.rows.pop(doc_id, None)
+        if row is None:
+            return
+        self.ids[row] = None
+        self._reset(row)
+        self.free.append(row)
+
+    def rows_within(self, lat: float, lon: float, radius_km: float) -> tuple:
+        """(rows, distances) for every row within radius_km, nearest first."""
+        import numpy as np
+
+        n = len(self.ids)
+        lats, lons = self.lat[:n], self.lon[:n]
+        # a bounding-box pass first, so the trigonometry only runs on nearby rows
+        dlat = radius_km / KM_PER_DEGREE
+        dlon = dlat / max(math.cos(math.radians(lat)), 0.01)
+        candidates = np.flatnonzero((np.abs(lats - lat) <= dlat) & (np.abs(lons - lon) <= dlon))
+        distances = haversine_km(lat, lon, lats[candidates], lons[candidates])
+        inside = distances <= radius_km
+        rows, distances = candidates[inside], distances[inside]
+        order = np.argsort(distances, kind="stable")
+        return rows[order].tolist(), distances[order].tolist()
+
+    def nearest_rows(self, lat: float, lon: float, limit: int) -> tuple:
+        """(rows, distances) for the `limit` closest rows, nearest first."""
+        import numpy as np
+
+        n = len(self.ids)
+        distances = haversine_km(lat, lon, self.lat[:n], self.lon[:n])
+        rows = np.flatnonzero(~np.isnan(distances))
+        if len(rows) > limit:
+            rows = rows[np.argpartition(distances[rows], limit - 1)[:limit]]
+        rows = rows[np.argsort(distances[rows], kind="stable")]
+        return rows.tolist(), distances[rows].tolist()
+
+    def to_array(self):
+        """The live rows as one structured array, ready for np.save."""
+        import numpy as np
+
+        ids = list(self.rows)
+        rows = np.fromiter(self.rows.values(), dtype=np.int64, count=len(ids))
+        fields = {"id": _text_column(ids)}
+        for name, _, _ in self.columns:
+            column = getattr(self, name)[rows]
+            codes = self.coded_columns.get(name)
+            fields[name] = _text_column([codes.value(c) for c in column.tolist()]) if codes else column
+        for name in self.text_columns:
+            column = getattr(self, name)
+            fields[name] = _text_column([column[row] for row in rows.tolist()])
+        array = np.empty(len(ids), dtype=[(name, values.dtype) for name, values in fields.items()])
+        for name, values in fields.items():
+            array[name] = values
+        return array
+
+    @classmethod
+    def from_array(cls, array) -> "Layer":
+        import numpy as np
+
+        n = len(array)
+        layer = cls(capacity=max(1024, 2 * n))
+        layer.ids = [doc_id.decode() for doc_id in array["id"].tolist()]
+        layer.rows = {doc_id: row for row, doc_id in enumerate(layer.ids)}
+        for name, _, _ in cls.columns:
+            codes = cls.coded_columns.get(name)
+            if codes:
+                # one lookup per distinct value rather than per row
+                values, inverse = np.unique(array[name], return_inverse=True)
+                table = np.array([codes.code(v.decode() or None) for v in values.tolist()], dtype=np.int8)
+                getattr(layer, name)[:n] = table[inverse] if n else 0
+            else:
+                getattr(layer, name)[:n] = array[name]
+        for name in cls.text_columns:
+            setattr(layer, name, [sys.intern(v.decode()) if v else None for v in array[name].tolist()])
+        return layer
@@ -0,0 +1,195 @@
+# services/firestore_accounting.py
+"""
+Per-request Firestore operation accounting.
+
+Both Firestore clients send every RPC through one GAPIC API object.
+`instrument_client` wraps that object, so each document read, written or
+queried is counted no matter which router or helper issued it, sync or
+async. Counts go to the `FirestoreOps` of the current request, a
+contextvar set by `FirestoreAccountingMiddleware`; calls made outside a
+request (background flushes, startup) are not attributed to anything.
+
+The middleware logs every request whose reads exceed
+settings.FIRESTORE_READ_BUDGET, records reads per request by route, and
+with settings.FIRESTORE_OPS_HEADERS adds X-Firestore-Reads / -Writes /
+-Queries response headers. Headers go out with the response start, so a
+streamed response reports what was read before its first byte.
+"""
+import contextvars
+import logging
+import threading
+
+from config import settings
+from services.metrics import registry, Histogram
+
+logger = logging.getLogger(__name__)
+
+firestore_reads_per_request = registry.register(Histogram(
+    "firestore_reads_per_request", "Documents read per request by route", ("route",),
+    buckets=(0, 1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)))
+
+
+class FirestoreOps:
+    __slots__ = ("reads", "writes", "queries", "_lock")
+
+    def __init__(self):
+        self.reads = 0
+        self.writes = 0
+        self.queries = 0
+        # handlers fan work out to the I/O pool, so several threads may count at once
+        self._lock = threading.Lock()
+
+    def add(self, reads: int = 0, writes: int = 0, queries: int = 0):
+        with self._lock:
+            self.reads += reads
+            self.writes += writes
+            self.queries += queries
+
+
+_current_ops = contextvars.ContextVar("firestore_ops", default=None)
+
+
+def current_ops() -> FirestoreOps | None:
+    return _current_ops.get()
+
+
+def _count(reads: int = 0, writes: int = 0, queries: int = 0):
+    ops = _current_ops.get()
+    if ops is not None:
+        ops.add(reads, writes, queries)
+
+
+def _request_field(request, name: str):
+    # the client builds requests as dicts; generated code may pass messages
+    if isinstance(request, dict):
+        return request.get(name)
+    return getattr(request, name, None)
+
+
+def _is_document(response, fields: tuple) -> bool:
+    return any(field in response for field in fields)
+
+
+# batch_get_documents answers with found or missing per requested document; both are billed reads
+_GET_RESULT_FIELDS = ("found", "missing")
+_QUERY_RESULT_FIELDS = ("document",)
+
+
+class _AccountingApi:
+    """Wraps the sync GAPIC FirestoreClient; anything not counted passes straight through."""
+
+    def __init__(self, api):
+        self._api = api
+
+    def __getattr__(self, name):
+        return getattr(self._api, name)
+
+    def _count_stream(self, responses, fields: tuple):
+        for response in responses:
+            if _is_document(response, fields):
+                _count(reads=1)
+            yield response
+
+    def batch_get_documents(self, request=None, **kwargs):
+        return self._count_stream(self._api.batch_get_documents(request=request, **kwargs), _GET_RESULT_FIELDS)
+
+    def run_query(self, request=None, **kwargs):
+        _count(queries=1)
+        return self._count_stream(self._api.run_query(request=request, **kwargs), _QUERY_RESULT_FIELDS)
+
+    def run_aggregation_query(self, request=None, **kwargs):
+        _count(queries=1, reads=1)
+        return self._api.run_aggregation_query(request=request, **kwargs)
+
+    def commit(self, request=None, **kwargs):
+        _count(writes=len(_request_field(request, "writes") or ()))
+        return self._api.commit(request=request, **kwargs)
+
+    def batch_write(self, request=None, **kwargs):
+        _count(writes=len(_request_field(request, "writes") or ()))
+        return self._api.batch_write(request=request, **kwargs)
+
+
+class _AsyncAccountingApi(_AccountingApi):
+    """Same for the asyncio GAPIC client, whose methods are coroutines."""
+
+    async def _count_stream(self, responses, fields: tuple):
+        async for response in await responses:
+            if _is_document(response, fields):
+                _count(reads=1)
+            yield response
+
+    async def batch_get_documents(self, request=None, **kwargs):
+        return self._count_stream(self._api.batch_get_documents(request=request, **kwargs), _GET_RESULT_FIELDS)
+
+    async def run_query(self, request=None, **kwargs):
+        _count(queries=1)
+        return self._count_stream(self._api.run_query(request=request, **kwargs), _QUERY_RESULT_FIELDS)
+
+    async def run_aggregation_query(self, request=None, **kwargs):
+        _count(queries=1, reads=1)
+        return await self._api.run_aggregation_query(request=request, **kwargs)
+
+    async def commit(self, request=None, **kwargs):
+        _count(writes=len(_request_field(request, "writes") or ()))
+        return await self._api.commit(request=request, **kwargs)
+
+    async def batch_write(self, request=None, **kwargs):
+        _count(writes=len(_request_field(request, "writes") or ()))
+        return await self._api.batch_write(request=request, **kwargs)
+
+
+def instrument_client(client, is_async: bool = False):
+    """
+    Routes a Firestore Client's (or AsyncClient's) RPCs through the
+    accounting wrapper. Relies on the client caching its GAPIC API in
+    `_firestore_api_internal`; if that changes, accounting is skipped.
+    """
+    if not hasattr(client, "_firestore_api_internal"):
+        logger.warning("Firestore client layout changed, per-request accounting disabled")
+        return client
+    api = client._firestore_api
+    if not isinstance(api, _AccountingApi):
+        client._firestore_api_internal = (_AsyncAccountingApi if is_async else _AccountingApi)(api)
+    return client
+
+
+class FirestoreAccountingMiddleware:
+    """ASGI middleware giving each request its own FirestoreOps."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        ops = FirestoreOps()
+        token = _current_ops.set(ops)
+
+        async def send_with_counts(message):
+            if message["type"] == "http.response.start" and settings.FIRESTORE_OPS_HEADERS:
+                message.setdefault("headers", [])
+                message["headers"] = [
+                    *message["headers"],
+                    (b"x-firestore-reads", str(ops.reads).encode()),
+                    (b"x-firestore-writes", str(ops.writes).encode()),
+                    (b"x-firestore-queries", str(ops.queries).encode()),
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_counts)
+        finally:
+            _current_ops.reset(token)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            firestore_reads_per_request.labels(route).observe(ops.reads)
+            if ops.reads > settings.FIRESTORE_READ_BUDGET:
+                logger.warning(
+                    "Request exceeded the Firestore read budget",
+                    extra={"fields": {
+                        "method": scope["method"], "route": route, "path": scope["path"],
+                        "reads": ops.reads, "writes": ops.writes, "queries": ops.queries,
+                        "budget": settings.FIRESTORE_READ_BUDGET,
+                    }},
+                )
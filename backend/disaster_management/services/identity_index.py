@@ -0,0 +1,220 @@
+# services/identity_index.py
+"""
+Resident map from normalized phone number to the user, victim and rescuer
+documents it belongs to, so an inbound SMS resolves its sender without a
+Firestore query.
+
+Loading and staying current:
+- `start` scans the three collections (phone fields only) on a background
+  thread, so startup does not wait on collection size; until it is done,
+  lookups miss and callers fall back to their own query;
+- write paths in this process call `put` / `remove`;
+- the same thread catches up every IDENTITY_REFRESH_SECONDS on victims and
+  rescuers written since its watermark (by `syncedAt` or `updatedAt`, as in
+  services/location_index.py), which covers what the apps write directly;
+- users carry no update time and deletions leave none behind, so both are
+  picked up by a full rescan every IDENTITY_FULL_SCAN_SECONDS.
+
+Callers that do fall back to a query record a miss, and skip the query for
+the same phone and kind for IDENTITY_MISS_TTL_SECONDS, so an unknown or
+spoofed sender costs one query per window rather than one per SMS.
+"""
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import NamedTuple
+
+from firebase import db
+from config import settings
+from services.metrics import track_firestore
+from services.state_backend import InProcessTTLMap
+from utils.change_stamp import SYNCED_AT, now_ms
+from utils.phone import normalize_phone
+
+logger = logging.getLogger(__name__)
+
+USER = "user"
+VICTIM = "victim"
+RESCUER = "rescuer"
+
+# the watermark trails the catch-up start by this much, as in services/location_index.py
+CATCH_UP_OVERLAP_MS = 60_000
+
+
+class _Source(NamedTuple):
+    collection: str
+    phone_fields: tuple         # tried in order
+    updated_field: str | None   # None: only full rescans see writes made elsewhere
+
+
+_SOURCES = {
+    USER: _Source(settings.FIREBASE_COLLECTION_USERS, ("contactNo", "phoneNumber"), None),
+    VICTIM: _Source(settings.FIREBASE_COLLECTION_VICTIMS, ("phoneNumber",), "updatedAt"),
+    RESCUER: _Source(settings.FIREBASE_COLLECTION_RESCUERS, ("phone",), "updatedAt"),
+}
+
+
+class IdentityIndex:
+    """Phone -> {kind: doc_id}; `ready` once the first full scan has finished."""
+
+    def __init__(self, refresh_interval: float, full_scan_interval: float, miss_ttl: float):
+        self.refresh_interval = refresh_interval
+        self.full_scan_interval = full_scan_interval
+        self.miss_ttl = miss_ttl
+        self.ready = False
+        self._by_phone = {}  # normalized phone -> {kind: doc_id}
+        self._by_doc = {}    # (kind, doc_id) -> normalized phone
+        self._misses = InProcessTTLMap()  # "kind:normalized phone" -> True
+        self._watermarks = {}  # kind -> epoch ms, server clock
+        self._last_full_scan = 0.0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def put(self, kind: str, doc_id: str, phone) -> str | None:
+        """Indexes (or re-indexes) a document under its phone. Returns the normalized phone."""
+        normalized = normalize_phone(phone)
+        with self._lock:
+            self._unlink(kind, doc_id)
+            if normalized:
+                self._by_phone.setdefault(normalized, {})[kind] = doc_id
+                self._by_doc[(kind, doc_id)] = normalized
+        if normalized:
+            self._misses.delete(f"{kind}:{normalized}")
+        return normalized
+
+    def remove(self, kind: str, doc_id: str):
+        with self._lock:
+            self._unlink(kind, doc_id)
+
+    def _unlink(self, kind: str, doc_id: str):
+        old = self._by_doc.pop((kind, doc_id), None)
+        if old is None:
+            return
+        kinds = self._by_phone.get(old)
+        if kinds and kinds.get(kind) == doc_id:
+            del kinds[kind]
+            if not kinds:
+                del self._by_phone[old]
+
+    def resolve(self, phone, kind: str) -> str | None:
+        """Returns the doc id of the given kind registered to this phone, if any."""
+        normalized = normalize_phone(phone)
+        if not normalized:
+            return None
+        kinds = self._by_phone.get(normalized)
+        return kinds.get(kind) if kinds else None
+
+    def identities(self, phone) -> dict:
+        """Returns every {kind: doc_id} registered to this phone."""
+        normalized = normalize_phone(phone)
+        with self._lock:
+            return dict(self._by_phone.get(normalized, {})) if normalized else {}
+
+    def recently_missed(self, phone, kind: str) -> bool:
+        """True if a query for this phone and kind found nothing within the last miss TTL."""
+        normalized = normalize_phone(phone)
+        return bool(normalized) and self._misses.get(f"{kind}:{normalized}") is not None
+
+    def record_miss(self, phone, kind: str):
+        normalized = normalize_phone(phone)
+        if normalized:
+            self._misses.set(f"{kind}:{normalized}", True, self.miss_ttl)
+
+    def __len__(self):
+        return len(self._by_doc)
+
+    # ---------- loading ----------
+    def _index(self, kind: str, doc) -> str:
+        fields = _SOURCES[kind].phone_fields
+        data = doc.to_dict() or {}
+        phone = next((data[f] for f in fields if data.get(f)), None)
+        if phone is None and kind == VICTIM:
+            phone = doc.id  # victims are keyed by their phone number
+        self.put(kind, doc.id, phone)
+        return doc.id
+
+    def catch_up(self, kind: str, full: bool = False) -> int:
+        """
+        Indexes the documents of one kind written since its watermark (or all
+        of them; a full scan also drops documents that no longer exist).
+        Returns the number of documents read.
+        """
+        source = _SOURCES[kind]
+        if not full and source.updated_field is None:
+            return 0
+        started = now_ms()
+        query = db.collection(source.collection).select(list(source.phone_fields))
+        if full:
+            queries = [query]
+        else:
+            since = self._watermarks.get(kind, 0)
+            # Firestore only compares values of the same type, so ints and timestamps are asked for separately
+            queries = [
+                query.where(SYNCED_AT, ">=", since),
+                query.where(source.updated_field, ">=", since),
+                query.where(source.updated_field, ">=", datetime.fromtimestamp(since / 1000, timezone.utc)),
+            ]
+        read, seen = 0, set()
+        for q in queries:
+            with track_firestore(source.collection, "identity_catch_up"):
+                docs = list(q.stream())
+            seen.update(self._index(kind, doc) for doc in docs)
+            read += len(docs)
+        with self._lock:
+            if full:
+                # anything written here during the scan is at or after `started`, so the next catch-up restores it
+                for gone in [doc_id for (k, doc_id) in self._by_doc if k == kind and doc_id not in seen]:
+                    self._unlink(kind, gone)
+            self._watermarks[kind] = started - CATCH_UP_OVERLAP_MS
+        return read
+
+    def load(self):
+        """Builds the index from a full scan of every source, reading only the phone fields."""
+        start = time.monotonic()
+        read = sum(self.catch_up(kind, full=True) for kind in _SOURCES)
+        self._last_full_scan = time.monotonic()
+        self.ready = True
+        logger.info("Identity index loaded", extra={"fields": {
+            "entries": len(self), "docs_read": read, "seconds": round(time.monotonic() - start, 2),
+        }})
+
+    # ---------- background refresh ----------
+    def _run(self):
+        try:
+            self.load()
+        except Exception:
+            logger.exception("Identity index load failed; retrying on the next refresh")
+        if self.refresh_interval <= 0:
+            return
+        while not self._stopped.wait(self.refresh_interval):
+            try:
+                if not self.ready or time.monotonic() - self._last_full_scan >= self.full_scan_interval:
+                    self.load()
+                else:
+                    for kind in _SOURCES:
+                        self.catch_up(kind)
+            except Exception:
+                logger.exception("Identity index refresh failed")
+
+    def start(self):
+        """Loads the index and keeps it current on a background thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="identity-index-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+
+identity_index = IdentityIndex(
+    refresh_interval=settings.IDENTITY_REFRESH_SECONDS,
+    full_scan_interval=settings.IDENTITY_FULL_SCAN_SECONDS,
+    miss_ttl=settings.IDENTITY_MISS_TTL_SECONDS,
+)
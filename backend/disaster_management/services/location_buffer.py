@@ -0,0 +1,188 @@
+# services/location_buffer.py
+import logging
+import threading
+import time
+
+from firebase import db
+from config import settings
+from utils.firestore_batch import commit_updates
+from utils.change_stamp import stamped
+
+logger = logging.getLogger(__name__)
+
+
+class LocationWriteBuffer:
+    """
+    Newest-fix-wins coalescing buffer for location updates.
+
+    Chatty devices send many fixes per minute; instead of one Firestore
+    update per SMS, the newest fields per (collection, doc id) are kept in
+    memory and flushed in WriteBatch chunks every `flush_interval` seconds.
+    "Newest" is by fix time, not arrival: a delayed SMS or a replayed
+    backlog can deliver an older fix after a newer one, and it is dropped.
+    Readers call `overlay` so they see a pending fix before it is flushed,
+    and while its batch is being committed.
+
+    Updates that fail for a reason other than a missing document are
+    retried on later flushes, backing off from `flush_interval` and doubling
+    each time, and dropped (with a warning) after `max_attempts` failures.
+    """
+
+    def __init__(self, flush_interval: float, max_pending: int, max_attempts: int):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self._pending = {}  # (collection, doc_id) -> fields
+        self._in_flight = {}  # what the running flush is committing, same shape
+        # newest fix time (epoch ms) accepted per document, kept after the flush so a late,
+        # older fix cannot overwrite what was written; one int per device that has reported
+        self._fixed_at = {}
+        self._retries = {}  # (collection, doc_id) -> (failed attempts, monotonic time of the next try)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()  # one flush at a time, so _in_flight is that flush's
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def put(self, collection: str, doc_id: str, fields: dict, fixed_at: int | None = None) -> bool:
+        """
+        Records an update, merging it over any pending one for the same
+        document. With `fixed_at` (epoch ms), an update older than the newest
+        fix already accepted for the document is dropped. Returns whether the
+        update was kept.
+        """
+        key = (collection, doc_id)
+        with self._lock:
+            newest = self._fixed_at.get(key)
+            if fixed_at is not None and newest is not None and fixed_at < newest:
+                return False
+            if fixed_at is not None:
+                self._fixed_at[key] = fixed_at
+            self._pending.setdefault(key, {}).update(fields)
+            pending = len(self._pending)
+
+        if self.flush_interval <= 0:
+            self.flush()
+        elif pending >= self.max_pending:
+            self._wakeup.set()
+        return True
+
+    def get(self, collection: str, doc_id: str) -> dict | None:
+        """Returns a copy of the pending fields for a document, if any."""
+        key = (collection, doc_id)
+        with self._lock:
+            in_flight, pending = self._in_flight.get(key), self._pending.get(key)
+            if not in_flight and not pending:
+                return None
+            return {**(in_flight or {}), **(pending or {})}
+
+    def overlay(self, collection: str, doc_id: str, data: dict) -> dict:
+        """Merges any pending fields over data read from Firestore."""
+        fields = self.get(collection, doc_id)
+        if fields:
+            data.update(fields)
+        return data
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self) -> tuple:
+        """
+        Writes every pending document now, except those still backing off
+        after a failure.
+
+        Returns:
+            tuple: (number of documents written, list of doc ids dropped
+            because the document does not exist)
+        """
+        with self._flush_lock:
+            now = time.monotonic()
+            with self._lock:
+                pending = {
+                    key: fields for key, fields in self._pending.items()
+                    if key not in self._retries or self._retries[key][1] <= now
+                }
+                for key in pending:
+                    del self._pending[key]
+                self._in_flight = pending
+            if not pending:
+                return 0, []
+
+            # stamped at send time: readers resuming from a watermark must see fixes that arrive late
+            updates = [
+                (db.collection(collection).document(doc_id), stamped(fields))
+                for (collection, doc_id), fields in pending.items()
+            ]
+            transient = []
+            try:
+                written, failed = commit_updates(updates, transient=transient)
+            except Exception:
+                transient = updates
+                raise
+            finally:
+                retried, dropped = self._requeue(pending, transient, now)
+        if failed:
+            logger.warning("Dropped location updates for missing documents", extra={"fields": {"docs": failed}})
+        if retried:
+            logger.warning("Location updates failed, retrying with backoff", extra={"fields": {"docs": retried}})
+        if dropped:
+            logger.warning("Dropped location updates after repeated failures", extra={"fields": {
+                "docs": dropped, "attempts": self.max_attempts,
+            }})
+        return written, failed
+
+    def _requeue(self, flushed: dict, transient: list, now: float) -> tuple:
+        """Queues failed updates again, or drops them past max_attempts. Returns (retried, dropped) doc ids."""
+        retried, dropped = [], []
+        with self._lock:
+            self._in_flight = {}
+            failed_keys = set()
+            for doc_ref, fields in transient:
+                key = (doc_ref.parent.id, doc_ref.id)
+                failed_keys.add(key)
+                attempts = self._retries.get(key, (0, 0.0))[0] + 1
+                if attempts >= self.max_attempts:
+                    self._retries.pop(key, None)
+                    dropped.append(doc_ref.id)
+                    continue
+                self._retries[key] = (attempts, now + max(self.flush_interval, 1.0) * 2 ** (attempts - 1))
+                # a fix that arrived meanwhile is newer, so its fields win
+                self._pending[key] = {**fields, **self._pending.get(key, {})}
+                retried.append(doc_ref.id)
+            for key in flushed.keys() - failed_keys:
+                self._retries.pop(key, None)
+        return retried, dropped
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Location buffer flush failed")
+
+    def start(self):
+        """Starts the background flusher (no-op in write-through mode)."""
+        if self.flush_interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name="location-buffer-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background flusher and writes whatever is still pending."""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+
+location_buffer = LocationWriteBuffer(
+    flush_interval=settings.LOCATION_FLUSH_INTERVAL_SECONDS,
+    max_pending=settings.LOCATION_BUFFER_MAX_PENDING,
+    max_attempts=settings.LOCATION_FLUSH_MAX_ATTEMPTS,
+)
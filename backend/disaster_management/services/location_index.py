@@ -0,0 +1,356 @@
+# services/location_index.py
+"""
+Resident positions of victims, shelters and assigned teams, so radius and
+nearest-neighbour lookups do not scan a collection.
+
+Each collection is a services.columnar Layer (doc id, latitude, longitude,
+last update in epoch ms; victims carry more, see services/victim_store.py)
+and a query is one vectorized pass.
+Layers are snapshotted to settings.INDEX_SNAPSHOT_DIR as NumPy structured
+arrays, one .npy file per layer, with a .json beside it holding the
+layer's watermark and the time of its last full scan. On startup the
+snapshot is memory-mapped and only documents written since the watermark
+are read from Firestore, instead of a full scan of every collection.
+
+The watermark is this server's clock when the last catch-up started, less
+CATCH_UP_OVERLAP_MS; it is never taken from document fields, which may
+carry a phone's clock. A catch-up reads documents whose `syncedAt` (this
+server's writes, see utils/change_stamp.py) or update field (the apps'
+writes) is at or after it.
+
+Staying current:
+- write paths in this process call `put`, `update` and `remove`;
+- a background thread repeats the catch-up every INDEX_REFRESH_SECONDS,
+  for writes made elsewhere (the apps write to Firestore directly), and
+  rewrites the snapshot every INDEX_SNAPSHOT_INTERVAL_SECONDS;
+- documents deleted elsewhere leave no update time behind, so they are
+  only dropped by a full scan, which runs once the last one is older than
+  INDEX_SNAPSHOT_MAX_AGE_SECONDS, on load or in the background.
+
+NumPy is imported when the index is first loaded, not with this module.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import NamedTuple
+
+from firebase import db
+from config import settings
+from services.location_buffer import location_buffer
+from services.metrics import track_firestore
+from services.columnar import Layer
+from services.victim_store import VictimLayer
+from utils.change_stamp import SYNCED_AT, now_ms
+
+logger = logging.getLogger(__name__)
+
+# the watermark trails the catch-up start by this much, so a write sent just before it
+# and committed just after is still read next time
+CATCH_UP_OVERLAP_MS = 60_000
+
+
+class _Source(NamedTuple):
+    lat_field: str
+    lon_field: str
+    updated_field: str
+    active_field: str | None  # documents where this is not True are left out
+    layer: type = Layer
+
+    @property
+    def fields(self) -> list:
+        position = (self.lat_field, self.lon_field, self.updated_field, self.active_field)
+        return [f for f in position if f] + list(self.layer.extra_fields)
+
+
+# layers by collection
+_SOURCES = {
+    settings.FIREBASE_COLLECTION_VICTIMS: _Source("latitude", "longitude", "updatedAt", "isActive", VictimLayer),
+    settings.FIREBASE_COLLECTION_SHELTERS: _Source("latitude", "longitude", "lastUpdated", None),
+    settings.FIREBASE_COLLECTION_RESCUE_TEAMS: _Source("assignedLatitude", "assignedLongitude", "updatedAt", None),
+}
+
+
+def _epoch_ms(value) -> int | None:
+    # writers store epoch-ms ints; older documents carry Firestore timestamps
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, datetime):
+        return int(value.timestamp() * 1000)
+    return None
+
+
+class LocationIndex:
+    """One layer per collection in _SOURCES; `ready` once load() has run."""
+
+    def __init__(self, snapshot_dir: str, refresh_interval: float, snapshot_interval: float, max_snapshot_age: float):
+        self.snapshot_dir = snapshot_dir
+        self.refresh_interval = refresh_interval
+        self.snapshot_interval = snapshot_interval
+        self.max_snapshot_age = max_snapshot_age
+        self.ready = False
+        self._layers = {}
+        self._watermarks = {}  # collection -> epoch ms, server clock
+        self._full_scans = {}  # collection -> epoch ms of the last full scan
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._last_snapshot = 0.0
+
+    def _layer(self, collection: str) -> Layer:
+        layer = self._layers.get(collection)
+        if layer is None:
+            layer = self._layers[collection] = _SOURCES[collection].layer()
+        return layer
+
+    # ---------- writes ----------
+    def put(self, collection: str, doc_id: str, data: dict):
+        """Indexes a document from its fields, or drops it if it has no position or is inactive."""
+        source = _SOURCES[collection]
+        lat, lon = data.get(source.lat_field), data.get(source.lon_field)
+        if lat is None or lon is None or (source.active_field and data.get(source.active_field) is not True):
+            self.remove(collection, doc_id)
+            return
+        with self._lock:
+            self._layer(collection).put(doc_id, float(lat), float(lon), _epoch_ms(data.get(source.updated_field)), data)
+
+    def update(self, collection: str, doc_id: str, fields: dict):
+        """
+        Applies a partial update to a document that is already indexed, as
+        written with Firestore's update(). Deactivating it drops it.
+        """
+        source = _SOURCES[collection]
+        if source.active_field in fields and fields[source.active_field] is not True:
+            self.remove(collection, doc_id)
+            return
+        with self._lock:
+            layer = self._layers.get(collection)
+            row = layer.rows.get(doc_id) if layer is not None else None
+            if row is None:
+                return
+            lat, lon = fields.get(source.lat_field), fields.get(source.lon_field)
+            if lat is not None and lon is not None:
+                layer.lat[row] = lat
+                layer.lon[row] = lon
+            updated = _epoch_ms(fields.get(source.updated_field))
+            if updated is not None:
+                layer.updated[row] = updated
+            layer.write(row, fields)
+
+    def remove(self, collection: str, doc_id: str):
+        with self._lock:
+            layer = self._layers.get(collection)
+            if layer is not None:
+                layer.remove(doc_id)
+
+    # ---------- queries ----------
+    def within(self, collection: str, lat: float, lon: float, radius_km: float) -> list:
+        """[(doc_id, km)] for every document within radius_km, nearest first."""
+        self.ensure_loaded()
+        with self._lock:
+            layer = self._layers.get(collection)
+            if layer is None:
+                return []
+            rows, distances = layer.rows_within(lat, lon, radius_km)
+            return [(layer.ids[row], distance) for row, distance in zip(rows, distances)]
+
+    def nearest(self, collection: str, lat: float, lon: float, limit: int = 1) -> list:
+        """[(doc_id, km)] for the `limit` closest documents, nearest first."""
+        self.ensure_loaded()
+        with self._lock:
+            layer = self._layers.get(collection)
+            if layer is None or not layer.rows:
+                return []
+            rows, distances = layer.nearest_rows(lat, lon, limit)
+            return [(layer.ids[row], distance) for row, distance in zip(rows, distances)]
+
+    def positions(self, collection: str) -> list:
+        """[(doc_id, lat, lon)] for every indexed document."""
+        self.ensure_loaded()
+        with self._lock:
+            layer = self._layers.get(collection)
+            if layer is None:
+                return []
+            return [(doc_id, float(layer.lat[row]), float(layer.lon[row])) for doc_id, row in layer.rows.items()]
+
+    def victims_within(self, lat: float, lon: float, radius_km: float) -> list:
+        """VictimRows for every active victim within radius_km, nearest first."""
+        self.ensure_loaded()
+        with self._lock:
+            layer = self._layers.get(settings.FIREBASE_COLLECTION_VICTIMS)
+            return layer.views(*layer.rows_within(lat, lon, radius_km)) if layer is not None else []
+
+    def victim_ids(self) -> list:
+        self.ensure_loaded()
+        with self._lock:
+            layer = self._layers.get(settings.FIREBASE_COLLECTION_VICTIMS)
+            return list(layer.rows) if layer is not None else []
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(layer.rows) for layer in self._layers.values())
+
+    # ---------- loading ----------
+    def _snapshot_path(self, collection: str) -> str:
+        return os.path.join(self.snapshot_dir, f"{collection}.npy")
+
+    def _meta_path(self, collection: str) -> str:
+        return os.path.join(self.snapshot_dir, f"{collection}.json")
+
+    def _full_scan_due(self, collection: str) -> bool:
+        return now_ms() - self._full_scans.get(collection, 0) > self.max_snapshot_age * 1000
+
+    def _restore(self, collection: str) -> bool:
+        import numpy as np
+
+        path = self._snapshot_path(collection)
+        try:
+            with open(self._meta_path(collection)) as f:
+                meta = json.load(f)
+            watermark, full_scan = int(meta["watermark"]), int(meta["full_scan_at"])
+            if now_ms() - full_scan > self.max_snapshot_age * 1000:
+                return False
+            array = np.load(path, mmap_mode="r")
+            layer = _SOURCES[collection].layer.from_array(array)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            # snapshots from before a column or the metadata was added fail here too and are rebuilt
+            if not isinstance(e, FileNotFoundError):
+                logger.warning("Ignoring unreadable location snapshot", extra={"fields": {"path": path, "error": e}})
+            return False
+        with self._lock:
+            self._layers[collection] = layer
+            self._watermarks[collection] = watermark
+            self._full_scans[collection] = full_scan
+        return True
+
+    def catch_up(self, collection: str, full: bool = False) -> int:
+        """
+        Reads the documents of one layer written since its watermark (or all
+        of them) and indexes them. A full scan also drops documents that no
+        longer exist. Returns the number of documents read.
+        """
+        source = _SOURCES[collection]
+        started = now_ms()
+        query = db.collection(collection).select(source.fields)
+        if full:
+            queries = [query]
+        else:
+            since = self._watermarks.get(collection, 0)
+            # Firestore only compares values of the same type, so ints and timestamps are asked for separately
+            queries = [
+                query.where(SYNCED_AT, ">=", since),
+                query.where(source.updated_field, ">=", since),
+                query.where(source.updated_field, ">=", datetime.fromtimestamp(since / 1000, timezone.utc)),
+            ]
+        read, seen = 0, set()
+        for q in queries:
+            with track_firestore(collection, "index_catch_up"):
+                docs = list(q.stream())
+            for doc in docs:
+                # a buffered fix is newer than what Firestore has
+                self.put(collection, doc.id, location_buffer.overlay(collection, doc.id, doc.to_dict() or {}))
+                seen.add(doc.id)
+            read += len(docs)
+        with self._lock:
+            if full:
+                # anything written here during the scan is at or after `started`, so the next catch-up restores it
+                layer = self._layer(collection)
+                for doc_id in [doc_id for doc_id in layer.rows if doc_id not in seen]:
+                    layer.remove(doc_id)
+                self._full_scans[collection] = started
+            self._watermarks[collection] = started - CATCH_UP_OVERLAP_MS
+        return read
+
+    def ensure_loaded(self):
+        """Loads the index on first use when the startup hook has not (scripts, tests)."""
+        if not self.ready:
+            with self._load_lock:
+                if not self.ready:
+                    self.load()
+
+    def load(self):
+        """Restores each layer from its snapshot and catches up, or scans the collection when there is none."""
+        start = time.monotonic()
+        restored, read = [], 0
+        for collection in _SOURCES:
+            from_snapshot = self._restore(collection)
+            if from_snapshot:
+                restored.append(collection)
+            read += self.catch_up(collection, full=not from_snapshot)
+        self.ready = True
+        logger.info("Location index loaded", extra={"fields": {
+            "entries": len(self), "from_snapshot": ",".join(restored) or "none",
+            "docs_read": read, "seconds": round(time.monotonic() - start, 2),
+        }})
+
+    def save_snapshot(self):
+        """Writes every layer to its snapshot file; each file is replaced atomically."""
+        import numpy as np
+
+        if not self.ready:
+            return
+        with self._lock:
+            snapshots = {
+                collection: (layer.to_array(), {
+                    "watermark": self._watermarks.get(collection, 0),
+                    "full_scan_at": self._full_scans.get(collection, 0),
+                })
+                for collection, layer in self._layers.items()
+            }
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        for collection, (array, meta) in snapshots.items():
+            # the array goes first: a crash in between leaves the older, lower watermark, which only re-reads more
+            path = self._snapshot_path(collection)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                np.save(f, array)
+            os.replace(tmp, path)
+            meta_path = self._meta_path(collection)
+            tmp = f"{meta_path}.{os.getpid()}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(meta, f)
+            os.replace(tmp, meta_path)
+        self._last_snapshot = time.monotonic()
+
+    # ---------- background refresh ----------
+    def _run(self):
+        while not self._stopped.wait(self.refresh_interval):
+            try:
+                for collection in _SOURCES:
+                    self.catch_up(collection, full=self._full_scan_due(collection))
+                if time.monotonic() - self._last_snapshot >= self.snapshot_interval:
+                    self.save_snapshot()
+            except Exception:
+                logger.exception("Location index refresh failed")
+
+    def start(self):
+        if self.refresh_interval <= 0 or (self._thread and self._thread.is_alive()):
+            return
+        self._stopped.clear()
+        self._last_snapshot = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="location-index-refresh", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the refresher and leaves a current snapshot for the next start."""
+        self._stopped.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+        try:
+            self.save_snapshot()
+        except OSError:
+            logger.exception("Could not write the location index snapshot")
+
+
+location_index = LocationIndex(
+    snapshot_dir=settings.INDEX_SNAPSHOT_DIR,
+    refresh_interval=settings.INDEX_REFRESH_SECONDS,
+    snapshot_interval=settings.INDEX_SNAPSHOT_INTERVAL_SECONDS,
+    max_snapshot_age=settings.INDEX_SNAPSHOT_MAX_AGE_SECONDS,
+)
@@ -0,0 +1,88 @@
+# services/loop_monitor.py
+import asyncio
+import logging
+import sys
+import threading
+import time
+import traceback
+
+from config import settings
+from services.metrics import loop_lag
+
+logger = logging.getLogger(__name__)
+
+
+class LoopLagMonitor:
+    """
+    Detects event-loop stalls.
+
+    A coroutine on the loop records a heartbeat every `interval` seconds.
+    A watchdog thread checks that heartbeat; once it is older than
+    `threshold`, the loop is blocked, so the watchdog captures the loop
+    thread's current stack (the code doing the blocking) and reports it
+    once per stall. The lag seen by the heartbeat itself is kept for
+    reporting as well.
+    """
+
+    def __init__(self, interval: float, threshold: float):
+        self.interval = interval
+        self.threshold = threshold
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.stalls = 0
+        self._beat = time.monotonic()
+        self._loop_thread_id = None
+        self._task = None
+        self._stopped = threading.Event()
+        self._watchdog = None
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self._beat = now
+            self.last_lag = max(0.0, now - expected)
+            self.max_lag = max(self.max_lag, self.last_lag)
+            loop_lag.observe(self.last_lag)
+
+    def _watch(self):
+        reported_beat = None
+        while not self._stopped.wait(self.interval):
+            beat = self._beat
+            blocked_for = time.monotonic() - beat
+            if blocked_for < self.threshold or beat == reported_beat:
+                continue
+            reported_beat = beat
+            self.stalls += 1
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame else "<loop thread stack unavailable>\n"
+            logger.warning(
+                "Event loop blocked for %.0f ms, loop thread is at:\n%s", blocked_for * 1000, stack.rstrip(),
+                extra={"fields": {"blocked_ms": round(blocked_for * 1000)}},
+            )
+
+    def start(self):
+        """Starts monitoring the running loop. Call from a coroutine on that loop."""
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        self._task = None
+        self._stopped.set()
+        self._watchdog.join()
+
+
+loop_monitor = LoopLagMonitor(
+    interval=settings.LOOP_LAG_CHECK_INTERVAL_SECONDS,
+    threshold=settings.LOOP_LAG_THRESHOLD_SECONDS,
+)
@@ -0,0 +1,310 @@
+# services/metrics.py
+"""
+Process metrics in the Prometheus text format, served at GET /metrics.
+
+Recording is cheap enough for the hot path: every labelled series keeps
+one shard of counters per thread, so `inc` and `observe` never take a
+lock, and histogram buckets are preallocated, so an observation is a
+bisect and two additions. Shards are only summed when /metrics is
+scraped. Values that already live elsewhere (queue depth, loop lag) are
+read by callback at scrape time instead of being pushed.
+
+With several uvicorn workers each process reports its own series.
+"""
+import threading
+import time
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# seconds; tuned for Firestore/HTTP round-trips from tens of ms to seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Sharded:
+    """Per-thread shards of a fixed-size list of numbers; summed on read."""
+
+    def __init__(self, size: int):
+        self._size = size
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()  # only taken when a thread records for the first time
+
+    def shard(self) -> list:
+        shard = getattr(self._local, "values", None)
+        if shard is None:
+            shard = [0] * self._size
+            with self._lock:
+                self._shards.append(shard)
+            self._local.values = shard
+        return shard
+
+    def totals(self) -> list:
+        with self._lock:
+            shards = list(self._shards)
+        totals = [0] * self._size
+        for shard in shards:
+            for i, value in enumerate(shard):
+                totals[i] += value
+        return totals
+
+
+class _CounterChild(_Sharded):
+    def __init__(self):
+        super().__init__(1)
+
+    def inc(self, amount: float = 1):
+        self.shard()[0] += amount
+
+    def value(self) -> float:
+        return self.totals()[0]
+
+
+class _GaugeChild:
+    # a gauge is set, not accumulated, so one value is enough
+    def __init__(self):
+        self._value = 0
+
+    def set(self, value: float):
+        self._value = value
+
+    def inc(self, amount: float = 1):
+        self._value += amount
+
+    def dec(self, amount: float = 1):
+        self._value -= amount
+
+    def value(self) -> float:
+        return self._value
+
+
+class _HistogramChild(_Sharded):
+    def __init__(self, buckets: tuple):
+        # one slot per bucket plus +Inf, then sum and count
+        super().__init__(len(buckets) + 3)
+        self._buckets = buckets
+
+    def observe(self, value: float):
+        shard = self.shard()
+        shard[bisect_left(self._buckets, value)] += 1
+        shard[-2] += value
+        shard[-1] += 1
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._children = {}
+        self._lock = threading.Lock()
+        if not self.label_names:
+            self._unlabelled = self.labels()
+
+    @abstractmethod
+    def _new_child(self):
+        """A new series for one combination of label values."""
+
+    def labels(self, *values):
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    @abstractmethod
+    def _samples(self):
+        """The exposition lines for every series."""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1):
+        self._unlabelled.inc(amount)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            yield f"{self.name}{_label_text(self.label_names, values)} {child.value()}"
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value: float):
+        self._unlabelled.set(value)
+
+    def inc(self, amount: float = 1):
+        self._unlabelled.inc(amount)
+
+    def dec(self, amount: float = 1):
+        self._unlabelled.dec(amount)
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            yield f"{self.name}{_label_text(self.label_names, values)} {child.value()}"
+
+
+class CallbackGauge(_Metric):
+    """A gauge (or counter, with kind="counter") read from fn() at scrape time."""
+
+    def __init__(self, name: str, help: str, fn, kind: str = "gauge"):
+        self.fn = fn
+        self.kind = kind
+        super().__init__(name, help)
+
+    def _new_child(self):
+        return None
+
+    def _samples(self):
+        try:
+            value = self.fn()
+        except Exception:
+            return
+        yield f"{self.name} {value}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labels)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._unlabelled.observe(value)
+
+    def time(self):
+        return self._unlabelled.time()
+
+    def _samples(self):
+        for values, child in list(self._children.items()):
+            totals = child.totals()
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), totals):
+                cumulative += count
+                le = f'le="{bound}"'
+                yield f"{self.name}_bucket{_label_text(self.label_names, values, le)} {cumulative}"
+            labels = _label_text(self.label_names, values)
+            yield f"{self.name}_sum{labels} {totals[-2]}"
+            yield f"{self.name}_count{labels} {totals[-1]}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+registry = Registry()
+
+# ---------- HTTP ----------
+http_requests_in_flight = registry.register(Gauge(
+    "http_requests_in_flight", "Requests currently being handled"))
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Request latency by route template", ("method", "route", "status")))
+
+# ---------- Firestore ----------
+firestore_calls = registry.register(Counter(
+    "firestore_calls_total", "Firestore calls by collection and operation", ("collection", "op", "outcome")))
+firestore_duration = registry.register(Histogram(
+    "firestore_call_duration_seconds", "Firestore call latency by collection and operation", ("collection", "op")))
+
+
+@contextmanager
+def track_firestore(collection: str, op: str):
+    """Counts and times one Firestore call (or one streamed query)."""
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        firestore_duration.labels(collection, op).observe(time.perf_counter() - start)
+        firestore_calls.labels(collection, op, outcome).inc()
+
+
+# ---------- geocoding ----------
+# cache hits and misses are read from the lookup cache itself, see routers/metrics.py
+geocode_duration = registry.register(Histogram(
+    "geocode_duration_seconds", "Nominatim reverse-geocoding latency (cache misses only)"))
+
+# ---------- outgoing SMS ----------
+sms_dispatch_latency = registry.register(Histogram(
+    "sms_dispatch_latency_seconds", "Time from queueing an SMS to the gateway collecting it",
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)))
+
+# ---------- event loop ----------
+loop_lag = registry.register(Histogram(
+    "event_loop_lag_seconds", "How late the event loop heartbeat woke up",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)))
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording in-flight requests and latency per route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            http_requests_in_flight.dec()
+            # the matched route's template, so /api/users/{userId} is one series
+            route = getattr(scope.get("route"), "path", "unmatched")
+            http_request_duration.labels(scope["method"], route, str(status)).observe(time.perf_counter() - start)
@@ -0,0 +1,84 @@
+# services/otp_store.py
+import hashlib
+import hmac
+import secrets
+import time
+
+from config import settings
+from services.state_backend import state_backend
+
+# verify() outcomes
+OTP_OK = "ok"
+OTP_MISSING = "missing"  # never requested, already used, or expired
+OTP_INVALID = "invalid"
+OTP_LOCKED = "locked"    # too many wrong attempts; a new OTP must be requested
+
+
+class OtpThrottled(Exception):
+    def __init__(self, retry_after: float):
+        super().__init__(f"OTP requested too recently, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def _digest(phone: str, otp: str) -> str:
+    return hashlib.sha256(f"{phone}:{otp}".encode()).hexdigest()
+
+
+class OtpStore:
+    """
+    One-time passwords keyed by phone number.
+
+    Records live in a TTL map, so expired OTPs are dropped by the map
+    rather than waiting for someone to verify them. Only a hash of the OTP
+    is stored. Each OTP allows `max_attempts` wrong guesses before it is
+    locked, and a phone cannot request a new one within `resend_interval`.
+    """
+
+    def __init__(self, ttl_map, ttl: float, max_attempts: int, resend_interval: float):
+        self._records = ttl_map
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+        self.resend_interval = resend_interval
+
+    def issue(self, phone: str) -> str:
+        """Creates and stores a new 6-digit OTP. Raises OtpThrottled on rapid re-requests."""
+        otp = f"{secrets.randbelow(900000) + 100000}"
+        now = time.time()
+
+        def replace(record):
+            if record and now - record["issued"] < self.resend_interval:
+                return record, self.resend_interval - (now - record["issued"])
+            return {"hash": _digest(phone, otp), "issued": now, "expires": now + self.ttl, "attempts": 0}, None
+
+        # a throttled request rewrites the old record too, which only pushes
+        # out when the map drops it; the record's own "expires" still applies
+        retry_after = self._records.update(phone, replace, ttl=self.ttl)
+        if retry_after is not None:
+            raise OtpThrottled(retry_after)
+        return otp
+
+    def verify(self, phone: str, otp: str) -> str:
+        """Checks an OTP. A correct one is consumed (one-time use)."""
+        candidate = _digest(phone, otp)
+        now = time.time()
+
+        def check(record):
+            # the map may keep a record slightly past its expiry (see issue)
+            if record is None or now > record["expires"]:
+                return None, OTP_MISSING
+            if record["attempts"] >= self.max_attempts:
+                return record, OTP_LOCKED
+            if hmac.compare_digest(record["hash"], candidate):
+                return None, OTP_OK
+            record = {**record, "attempts": record["attempts"] + 1}
+            return record, OTP_INVALID
+
+        return self._records.update(phone, check)
+
+
+otp_store = OtpStore(
+    state_backend.ttl_map("otp"),
+    ttl=settings.OTP_TTL_SECONDS,
+    max_attempts=settings.OTP_MAX_ATTEMPTS,
+    resend_interval=settings.OTP_RESEND_INTERVAL_SECONDS,
+)
@@ -0,0 +1,251 @@
+# services/profiler.py
+"""
+Sampling profiler for diagnosing a live process.
+
+A background thread wakes every `interval` seconds and records:
+- the Python stack of every thread that is doing work. Threads parked in
+  an idle wait (an empty executor queue, the selector, an Event) are
+  skipped, so samples show where CPU and blocking I/O go.
+- for every in-flight request task that is suspended in an await, its
+  coroutine chain. This is the async frame stack that thread stacks cannot
+  show, so time spent waiting on Firestore or HTTP appears under the
+  handler that awaited it.
+
+Samples are aggregated by stack and exported as collapsed stacks
+(flamegraph.pl / speedscope) or as a speedscope JSON profile. Nothing is
+installed in the interpreter: when no profile is running there is no
+overhead beyond ProfilingMiddleware tracking which tasks are requests.
+"""
+import asyncio
+import os
+import sys
+import threading
+import time
+import weakref
+from collections import Counter
+
+# (file name, function) of a thread's innermost Python frame while it is parked
+_IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),     # ThreadPoolExecutor worker waiting for work
+    ("queue.py", "get"),
+    ("handlers.py", "dequeue"),  # logging QueueListener
+}
+
+# request tasks currently being handled -> their path, kept by ProfilingMiddleware
+_request_tasks = weakref.WeakKeyDictionary()
+
+
+def _frame_key(code) -> tuple:
+    return (getattr(code, "co_qualname", code.co_name), code.co_filename, code.co_firstlineno)
+
+
+def _thread_stack(frame) -> list:
+    stack = []
+    while frame is not None:
+        stack.append(_frame_key(frame.f_code))
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _is_idle(frame) -> bool:
+    return (os.path.basename(frame.f_code.co_filename), frame.f_code.co_name) in _IDLE_LEAVES
+
+
+def _await_stack(task) -> list:
+    """The coroutine chain a suspended task is waiting in, outermost first."""
+    stack = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = (getattr(awaitable, "cr_frame", None) or getattr(awaitable, "ag_frame", None)
+                 or getattr(awaitable, "gi_frame", None))
+        if frame is not None:
+            stack.append(_frame_key(frame.f_code))
+        next_awaitable = (getattr(awaitable, "cr_await", None) or getattr(awaitable, "ag_await", None)
+                          or getattr(awaitable, "gi_yieldfrom", None))
+        if next_awaitable is None and frame is None:
+            # a Future or other object at the bottom of the chain
+            stack.append((f"<await {type(awaitable).__name__}>", "", 0))
+        awaitable = next_awaitable
+    return stack
+
+
+class Profile:
+    def __init__(self, samples: Counter, interval: float, duration: float, name: str):
+        self.samples = samples    # stack (tuple of frame keys) -> sample count
+        self.interval = interval
+        self.duration = duration
+        self.name = name
+
+    @property
+    def sample_count(self) -> int:
+        return sum(self.samples.values())
+
+    def collapsed(self) -> str:
+        """One "frame;frame;frame count" line per distinct stack."""
+        lines = []
+        for stack, count in self.samples.most_common():
+            names = ";".join(f"{name} ({os.path.basename(path)}:{line})" if path else name
+                             for name, path, line in stack)
+            lines.append(f"{names} {count}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self) -> dict:
+        frames = []
+        index = {}
+        samples = []
+        weights = []
+        for stack, count in self.samples.most_common():
+            sample = []
+            for key in stack:
+                if key not in index:
+                    index[key] = len(frames)
+                    name, path, line = key
+                    frames.append({"name": name, "file": path, "line": line} if path else {"name": name})
+                sample.append(index[key])
+            samples.append(sample)
+            weights.append(round(count * self.interval, 6))
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": self.name,
+            "exporter": "disaster-management-api",
+            "activeProfileIndex": 0,
+            "shared": {"frames": frames},
+            "profiles": [{
+                "type": "sampled",
+                "name": self.name,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": round(self.duration, 6),
+                "samples": samples,
+                "weights": weights,
+            }],
+        }
+
+
+class SamplingProfiler:
+    """
+    Samples thread stacks and the await chains of request tasks on `loop`.
+    With `only_task`, loop-thread samples are kept only while that task is
+    running and only its await chain is recorded; other threads are still
+    sampled, since work handed to the I/O pool is not tagged with its task.
+    """
+
+    def __init__(self, loop, loop_thread_id: int, interval: float, only_task=None, name: str = "profile"):
+        self.loop = loop
+        self.loop_thread_id = loop_thread_id
+        self.interval = interval
+        self.only_task = only_task
+        self.name = name
+        self._samples = Counter()
+        self._stopped = threading.Event()
+        self._thread = None
+        self._started = 0.0
+
+    def _sample(self):
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own or _is_idle(frame):
+                continue
+            if thread_id == self.loop_thread_id:
+                if self.only_task is not None and asyncio.current_task(self.loop) is not self.only_task:
+                    continue
+                root = ("event loop", "", 0)
+            else:
+                root = (f"thread {names.get(thread_id, thread_id)}", "", 0)
+            self._samples[(root, *_thread_stack(frame))] += 1
+
+        tasks = [self.only_task] if self.only_task is not None else list(_request_tasks.keys())
+        for task in tasks:
+            # a running task is already in the loop thread's stack
+            coro = task.get_coro()
+            if task.done() or getattr(coro, "cr_running", False):
+                continue
+            stack = _await_stack(task)
+            if stack:
+                self._samples[(("awaiting", "", 0), *stack)] += 1
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self._sample()
+            except RuntimeError:
+                # a task set or frame changed while being walked; skip this tick
+                continue
+
+    def start(self):
+        self._started = time.monotonic()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> Profile:
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        return Profile(self._samples, self.interval, time.monotonic() - self._started, self.name)
+
+
+class RequestTarget:
+    """A profile armed for the next request whose path starts with `path`."""
+
+    def __init__(self, path: str, interval: float):
+        self.path = path
+        self.interval = interval
+        self.done = asyncio.Event()
+        self.profile = None
+        self.claimed = False
+
+
+_targets = []
+
+
+def arm_request_profile(path: str, interval: float) -> RequestTarget:
+    target = RequestTarget(path, interval)
+    _targets.append(target)
+    return target
+
+
+def disarm(target: RequestTarget):
+    if target in _targets:
+        _targets.remove(target)
+
+
+def _claim_target(path: str):
+    for target in _targets:
+        if not target.claimed and path.startswith(target.path):
+            target.claimed = True
+            _targets.remove(target)
+            return target
+    return None
+
+
+class ProfilingMiddleware:
+    """Tracks request tasks for the sampler and profiles requests an admin has armed a target for."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        task = asyncio.current_task()
+        _request_tasks[task] = scope["path"]
+        target = _claim_target(scope["path"]) if _targets else None
+        profiler = None
+        if target is not None:
+            profiler = SamplingProfiler(
+                asyncio.get_running_loop(), threading.get_ident(), target.interval,
+                only_task=task, name=f"{scope['method']} {scope['path']}",
+            ).start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _request_tasks.pop(task, None)
+            if profiler is not None:
+                target.profile = profiler.stop()
+                target.done.set()
@@ -0,0 +1,249 @@
+# services/repository.py
+"""
+Async Firestore data access.
+
+Routers await these repositories instead of calling the synchronous
+`firebase.db` client from a worker thread, so a request no longer holds a
+thread for its chain of round-trips and independent reads can be issued
+together with asyncio.gather.
+"""
+# Repository.list shadows the builtin inside the class body, so keep annotations unevaluated
+from __future__ import annotations
+
+import threading
+from datetime import datetime, timezone
+from typing import NamedTuple
+
+import firebase
+from config import settings
+from utils.firestore_preconditions import WriteConflict, merge_update
+from utils.pagination import encode_cursor, decode_cursor
+from services.metrics import track_firestore
+from services.firestore_accounting import instrument_client
+from services.tombstones import tombstone, tombstone_id
+
+# _DOCUMENT_ID, spelled out so importing this module does not load google.cloud.firestore
+_DOCUMENT_ID = "__name__"
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_async_client():
+    """Builds the AsyncClient on first use, from the same service account as `firebase.db`."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from google.cloud.firestore import AsyncClient
+
+                cred = firebase.get_credentials()
+                _client = instrument_client(
+                    AsyncClient(project=cred.project_id, credentials=cred.get_credential()), is_async=True
+                )
+    return _client
+
+
+class Page(NamedTuple):
+    items: list               # [(doc_id, data)]
+    next_cursor: str | None   # pass as `after` to get the following page; None on the last page
+
+
+class Repository:
+    """
+    Reads and writes one Firestore collection. Documents come back as plain
+    dicts. With `tombstones`, every delete also records a tombstone for the
+    change feed.
+    """
+
+    def __init__(self, collection: str, tombstones: bool = False):
+        self.collection = collection
+        self.tombstones = tombstones
+
+    def ref(self):
+        return get_async_client().collection(self.collection)
+
+    async def get(self, doc_id: str) -> dict | None:
+        with track_firestore(self.collection, "get"):
+            snapshot = await self.ref().document(doc_id).get()
+        return snapshot.to_dict() if snapshot.exists else None
+
+    async def get_many(self, doc_ids, fields: list | None = None) -> dict:
+        """
+        Fetches several documents in one round-trip. Returns {doc_id: data}
+        for those that exist; `fields` limits what is read from each.
+        """
+        doc_ids = list(dict.fromkeys(i for i in doc_ids if i))
+        if not doc_ids:
+            return {}
+        refs = [self.ref().document(doc_id) for doc_id in doc_ids]
+        found = {}
+        with track_firestore(self.collection, "get_all"):
+            async for snapshot in get_async_client().get_all(refs, field_paths=fields):
+                if snapshot.exists:
+                    found[snapshot.id] = snapshot.to_dict()
+        return found
+
+    async def list(self, *where) -> list:
+        """
+        Returns [(doc_id, data)] for the collection, optionally filtered by
+        (field, op, value) conditions.
+        """
+        query = self.ref()
+        for field, op, value in where:
+            query = query.where(field, op, value)
+        with track_firestore(self.collection, "query"):
+            return [(snapshot.id, snapshot.to_dict()) async for snapshot in query.stream()]
+
+    async def page(self, *where, limit: int, after: str | None = None,
+                   fields: list | None = None, order_by: str | None = None) -> Page:
+        """
+        Returns one page of [(doc_id, data)], ordered by `order_by` (if any)
+        and then document id. `after` is the cursor from the previous page
+        and `fields` projects each document to those fields.
+
+        A range filter (e.g. updated-since) must be on the `order_by` field.
+        """
+        query = self.ref()
+        for field, op, value in where:
+            query = query.where(field, op, value)
+        orders = [order_by] if order_by else []
+        for field in orders:
+            query = query.order_by(field)
+        query = query.order_by(_DOCUMENT_ID)
+        if fields:
+            # the cursor needs the order fields even when the caller didn't ask for them
+            query = query.select(list(dict.fromkeys([*fields, *orders])))
+        if after:
+            values = decode_cursor(after, len(orders) + 1)
+            query = query.start_after(values)
+
+        # one extra document tells us whether another page follows
+        with track_firestore(self.collection, "query"):
+            items = [(snapshot.id, snapshot.to_dict()) async for snapshot in query.limit(limit + 1).stream()]
+        if len(items) <= limit:
+            return Page(items, None)
+        items = items[:limit]
+        last_id, last = items[-1]
+        return Page(items, encode_cursor([*(last.get(field) for field in orders), last_id]))
+
+    async def page_since(self, field: str, since: int, *where, limit: int, after: str | None = None,
+                         fields: list | None = None) -> Page:
+        """
+        Like `page`, for documents whose `field` is at or after `since`
+        (epoch ms), ordered by it. The apps store update times as Firestore
+        Timestamps and this server as epoch-ms integers, and Firestore only
+        compares values of one type, so the integers are read first and the
+        Timestamps after them; the type of the cursor's value says which.
+        """
+        after_timestamps = after is not None and isinstance(decode_cursor(after, 2)[0], datetime)
+        items = []
+        if not after_timestamps:
+            page = await self.page(*where, (field, ">=", since), limit=limit, after=after, fields=fields, order_by=field)
+            if page.next_cursor:
+                return page
+            if len(page.items) == limit:
+                # no room left for Timestamps; the next call finds the integers done and moves on
+                last_id, last = page.items[-1]
+                return Page(page.items, encode_cursor([last.get(field), last_id]))
+            items, after = page.items, None
+        page = await self.page(
+            *where, (field, ">=", datetime.fromtimestamp(since / 1000, timezone.utc)),
+            limit=limit - len(items), after=after, fields=fields, order_by=field,
+        )
+        return Page(items + page.items, page.next_cursor)
+
+    async def stream(self, *where, fields: list | None = None, batch_size: int = settings.STREAM_BATCH_SIZE):
+        """
+        Yields (doc_id, data) for every matching document, in document id
+        order. Reads one bounded batch at a time, so an export of the whole
+        collection neither holds it in memory nor depends on one long RPC.
+        """
+        query = self.ref()
+        for field, op, value in where:
+            query = query.where(field, op, value)
+        query = query.order_by(_DOCUMENT_ID)
+        if fields:
+            query = query.select(fields)
+        last = None
+        while True:
+            batch = query.start_after(last) if last is not None else query
+            # read the batch before yielding, so the timing covers Firestore and not the consumer
+            with track_firestore(self.collection, "query"):
+                snapshots = [snapshot async for snapshot in batch.limit(batch_size).stream()]
+            count = len(snapshots)
+            for snapshot in snapshots:
+                last = snapshot
+                yield snapshot.id, snapshot.to_dict()
+            if count < batch_size:
+                return
+
+    async def set(self, doc_id: str, data: dict, merge: bool = False):
+        with track_firestore(self.collection, "set"):
+            await self.ref().document(doc_id).set(data, merge=merge)
+
+    async def update(self, doc_id: str, fields: dict) -> bool:
+        """Updates an existing document in one round-trip. Returns False if it does not exist."""
+        from google.api_core.exceptions import NotFound
+
+        try:
+            with track_firestore(self.collection, "update"):
+                await self.ref().document(doc_id).update(fields)
+        except NotFound:
+            return False
+        return True
+
+    async def update_and_merge(self, doc_id: str, fields: dict) -> dict | None:
+        """
+        Updates a document and returns its new state without reading it back:
+        the read happens first and the write is conditioned on it, so the
+        merged result is exactly what was stored. Returns None if the
+        document does not exist; raises WriteConflict on a concurrent write.
+        """
+        from google.api_core.exceptions import FailedPrecondition, NotFound
+
+        doc_ref = self.ref().document(doc_id)
+        with track_firestore(self.collection, "get"):
+            snapshot = await doc_ref.get()
+        if not snapshot.exists:
+            return None
+        option = get_async_client().write_option(last_update_time=snapshot.update_time)
+        try:
+            with track_firestore(self.collection, "update"):
+                await doc_ref.update(fields, option=option)
+        except (FailedPrecondition, NotFound) as e:
+            raise WriteConflict(str(e)) from e
+        return merge_update(snapshot.to_dict(), fields)
+
+    async def delete(self, doc_id: str) -> bool:
+        """Deletes an existing document in one round-trip. Returns False if it does not exist."""
+        from google.api_core.exceptions import NotFound
+
+        client = get_async_client()
+        option = client.write_option(exists=True)
+        try:
+            with track_firestore(self.collection, "delete"):
+                if not self.tombstones:
+                    await self.ref().document(doc_id).delete(option=option)
+                else:
+                    # one commit, so the tombstone exists exactly when the delete happened
+                    batch = client.batch()
+                    batch.delete(self.ref().document(doc_id), option=option)
+                    tombstones_ref = client.collection(settings.FIREBASE_COLLECTION_TOMBSTONES)
+                    batch.set(tombstones_ref.document(tombstone_id(self.collection, doc_id)), tombstone(self.collection, doc_id))
+                    await batch.commit()
+        except NotFound:
+            return False
+        return True
+
+    def new_id(self) -> str:
+        return self.ref().document().id
+
+
+users_repo = Repository(settings.FIREBASE_COLLECTION_USERS)
+victims_repo = Repository(settings.FIREBASE_COLLECTION_VICTIMS)
+rescuers_repo = Repository(settings.FIREBASE_COLLECTION_RESCUERS, tombstones=True)
+teams_repo = Repository(settings.FIREBASE_COLLECTION_RESCUE_TEAMS, tombstones=True)
+shelters_repo = Repository(settings.FIREBASE_COLLECTION_SHELTERS, tombstones=True)
+messages_repo = Repository(settings.FIREBASE_COLLECTION_MESSAGES, tombstones=True)
+tombstones_repo = Repository(settings.FIREBASE_COLLECTION_TOMBSTONES)
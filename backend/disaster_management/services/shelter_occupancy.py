@@ -0,0 +1,199 @@
+# services/shelter_occupancy.py
+"""
+Shelter admissions.
+
+Check-ins change `rescuedMembers` with ArrayUnion / ArrayRemove and keep
+`currentOccupancy` in step inside a transaction that enforces `capacity`,
+so concurrent arrivals can neither overwrite each other nor overfill a
+shelter. Shelters whose `rescuedMembers` is a {phone: name} map (from
+older SMS check-ins) keep that shape: members are set and deleted one
+field at a time, with the name taken from the victim document.
+
+A busy shelter gets many check-ins at once, and transactions on one
+document retry against each other. Admissions to the same shelter are
+therefore group-committed per process: while one transaction is in
+flight, later arrivals queue up and the next transaction admits all of
+them together, so throughput is one transaction per round-trip however
+many people arrive. The transaction still guards against other workers.
+"""
+import threading
+import time
+
+from firebase import db, firestore
+from config import settings
+from services.metrics import track_firestore
+from utils.change_stamp import stamped
+
+
+class ShelterNotFound(Exception):
+    pass
+
+
+class AlreadyAdmitted(Exception):
+    pass
+
+
+class NotAdmitted(Exception):
+    pass
+
+
+class ShelterFull(Exception):
+    pass
+
+
+class _Ticket:
+    __slots__ = ("member_id", "done", "result", "error")
+
+    def __init__(self, member_id: str):
+        self.member_id = member_id
+        self.done = False
+        self.result = None
+        self.error = None
+
+
+def _shelter_ref(shelter_id: str):
+    return db.collection(settings.FIREBASE_COLLECTION_SHELTERS).document(shelter_id)
+
+
+def _members(shelter: dict) -> list:
+    return list(shelter.get("rescuedMembers") or [])
+
+
+def _is_map(shelter: dict) -> bool:
+    return isinstance(shelter.get("rescuedMembers"), dict)
+
+
+def _member_path(member_id: str) -> str:
+    # phone keys start with '+' or a digit, so the segment needs quoting
+    from google.cloud.firestore_v1.field_path import FieldPath
+
+    return FieldPath("rescuedMembers", member_id).to_api_repr()
+
+
+def _victim_names(transaction, member_ids: list) -> dict:
+    """{member_id: name} from the victims collection, "Unknown" where there is none."""
+    victims = db.collection(settings.FIREBASE_COLLECTION_VICTIMS)
+    refs = [victims.document(member_id) for member_id in member_ids]
+    names = {
+        snap.id: (snap.to_dict() or {}).get("name")
+        for snap in db.get_all(refs, field_paths=["name"], transaction=transaction) if snap.exists
+    }
+    return {member_id: names.get(member_id) or "Unknown" for member_id in member_ids}
+
+
+class ShelterAdmissions:
+    # more attempts than the default 5: other workers may be admitting to the same shelter
+    TRANSACTION_ATTEMPTS = 20
+
+    def __init__(self):
+        self._guard = threading.Lock()
+        self._locks = {}    # shelter_id -> lock held while a transaction for it is in flight
+        self._pending = {}  # shelter_id -> [_Ticket] waiting for the next transaction
+
+    def admit(self, shelter_id: str, member_id: str) -> dict:
+        """
+        Adds member_id to the shelter and returns the shelter's new state.
+        Raises ShelterNotFound, AlreadyAdmitted or ShelterFull.
+        """
+        ticket = _Ticket(member_id)
+        with self._guard:
+            self._pending.setdefault(shelter_id, []).append(ticket)
+            lock = self._locks.setdefault(shelter_id, threading.Lock())
+
+        with lock:
+            # an earlier lock holder may already have admitted us along with its own batch
+            if not ticket.done:
+                with self._guard:
+                    batch = self._pending.pop(shelter_id, [])
+                self._admit_batch(shelter_id, batch)
+
+        if ticket.error is not None:
+            raise ticket.error
+        return ticket.result
+
+    def _admit_batch(self, shelter_id: str, batch: list):
+        @firestore.transactional
+        def apply(transaction):
+            snapshot = _shelter_ref(shelter_id).get(transaction=transaction)
+            if not snapshot.exists:
+                return None, {}
+            shelter = snapshot.to_dict()
+            members = _members(shelter)
+            present = set(members)
+            capacity = shelter.get("capacity")
+            admitted, errors = [], {}
+            for ticket in batch:
+                if ticket.member_id in present:
+                    errors[ticket.member_id] = AlreadyAdmitted(ticket.member_id)
+                elif capacity is not None and len(present) >= capacity:
+                    errors[ticket.member_id] = ShelterFull(shelter_id)
+                else:
+                    present.add(ticket.member_id)
+                    admitted.append(ticket.member_id)
+            if not admitted:
+                return shelter, errors
+
+            if _is_map(shelter):
+                added = _victim_names(transaction, admitted)
+                member_fields = {_member_path(member_id): name for member_id, name in added.items()}
+                rescued = {**shelter["rescuedMembers"], **added}
+            else:
+                member_fields = {"rescuedMembers": firestore.ArrayUnion(admitted)}
+                rescued = members + admitted
+            # the counter is written from the members read in this transaction,
+            # which also corrects shelters whose counter was never maintained
+            fields = stamped({
+                "currentOccupancy": len(members) + len(admitted),
+                "lastUpdated": int(time.time() * 1000),
+            })
+            transaction.update(_shelter_ref(shelter_id), {**member_fields, **fields})
+            return {**shelter, **fields, "rescuedMembers": rescued}, errors
+
+        try:
+            with track_firestore(settings.FIREBASE_COLLECTION_SHELTERS, "transaction"):
+                shelter, errors = apply(db.transaction(max_attempts=self.TRANSACTION_ATTEMPTS))
+        except Exception as e:
+            for ticket in batch:
+                ticket.error, ticket.done = e, True
+            return
+
+        for ticket in batch:
+            if shelter is None:
+                ticket.error = ShelterNotFound(shelter_id)
+            else:
+                ticket.error = errors.get(ticket.member_id)
+                ticket.result = {**shelter, "id": shelter_id}
+            ticket.done = True
+
+    def discharge(self, shelter_id: str, member_id: str) -> dict:
+        """
+        Removes member_id from the shelter and returns its new state.
+        Raises ShelterNotFound or NotAdmitted.
+        """
+        @firestore.transactional
+        def apply(transaction):
+            snapshot = _shelter_ref(shelter_id).get(transaction=transaction)
+            if not snapshot.exists:
+                raise ShelterNotFound(shelter_id)
+            shelter = snapshot.to_dict()
+            members = _members(shelter)
+            if member_id not in members:
+                raise NotAdmitted(member_id)
+            if _is_map(shelter):
+                member_fields = {_member_path(member_id): firestore.DELETE_FIELD}
+                rescued = {m: name for m, name in shelter["rescuedMembers"].items() if m != member_id}
+            else:
+                member_fields = {"rescuedMembers": firestore.ArrayRemove([member_id])}
+                rescued = [m for m in members if m != member_id]
+            fields = stamped({
+                "currentOccupancy": len(rescued),
+                "lastUpdated": int(time.time() * 1000),
+            })
+            transaction.update(_shelter_ref(shelter_id), {**member_fields, **fields})
+            return {**shelter, **fields, "rescuedMembers": rescued, "id": shelter_id}
+
+        with track_firestore(settings.FIREBASE_COLLECTION_SHELTERS, "transaction"):
+            return apply(db.transaction(max_attempts=self.TRANSACTION_ATTEMPTS))
+
+
+shelter_admissions = ShelterAdmissions()
@@ -0,0 +1,48 @@
+# services/sos_dedup.py
+import time
+from typing import NamedTuple
+
+from config import settings
+from services.state_backend import state_backend
+
+
+class SosDecision(NamedTuple):
+    message_id: str  # Messages document the SOS folds into
+    is_new: bool     # first SOS of this storm; the document must be created
+    should_reply: bool
+
+
+class SosDeduplicator:
+    """
+    Sliding-window deduplication of SOS messages per sender.
+
+    An SOS arriving within `window` seconds of the previous one from the
+    same sender folds into the same Messages document, and a shelter reply
+    goes out at most once per window. Each sender's entry lives in a TTL map
+    whose expiry is pushed out by every SOS, so quiet senders drop out on
+    their own and all workers share the same view.
+    """
+
+    def __init__(self, ttl_map, window: float):
+        self.window = window
+        self._entries = ttl_map  # sender -> {"id", "last_seen", "replied_at"}
+
+    def register(self, sender: str, new_message_id, now: float | None = None) -> SosDecision:
+        """
+        Records an SOS from sender. new_message_id is called to allocate a
+        document id only when this SOS starts a new storm.
+        """
+        now = time.time() if now is None else now
+
+        def fold(entry):
+            if entry is None:
+                message_id = new_message_id()
+                return {"id": message_id, "last_seen": now, "replied_at": now}, SosDecision(message_id, True, True)
+            should_reply = now - entry["replied_at"] >= self.window
+            entry = {**entry, "last_seen": now, "replied_at": now if should_reply else entry["replied_at"]}
+            return entry, SosDecision(entry["id"], False, should_reply)
+
+        return self._entries.update(sender, fold, ttl=self.window)
+
+
+sos_dedup = SosDeduplicator(state_backend.ttl_map("sos_dedup"), window=settings.SOS_DEDUP_WINDOW_SECONDS)
@@ -0,0 +1,325 @@
+# services/state_backend.py
+"""
+Small shared state that has to outlive a single request: FIFO queues,
+TTL maps and counters.
+
+The in-process backend keeps everything in memory and is only correct with
+a single uvicorn worker. The SQLite backend keeps it in one local file, so
+every worker process on the host sees the same queues, maps and counters.
+settings.STATE_BACKEND picks one ("memory" or "sqlite").
+
+Both backends hand out objects with the same methods; `Queue.pop`,
+`TTLMap.update` and `Counter.incr` are atomic in each.
+"""
+import json
+import sqlite3
+import threading
+import time
+from collections import deque
+
+from config import settings
+from utils.timing_wheel import TimingWheel
+
+
+# ---------- in-process ----------
+
+class InProcessQueue:
+    def __init__(self):
+        self._items = deque()
+        self._lock = threading.Lock()
+
+    def push(self, item):
+        with self._lock:
+            self._items.append(item)
+
+    def pop(self):
+        """Removes and returns the oldest item, or None when the queue is empty."""
+        with self._lock:
+            return self._items.popleft() if self._items else None
+
+    def __len__(self):
+        return len(self._items)
+
+
+class InProcessTTLMap:
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._data = {}  # key -> (value, expires)
+        self._wheel = TimingWheel(clock())
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        for key in self._wheel.advance(now):
+            entry = self._data.get(key)
+            # the key may have been rescheduled since this deadline was set
+            if entry is not None and entry[1] <= now:
+                del self._data[key]
+
+    def set(self, key: str, value, ttl: float):
+        with self._lock:
+            now = self._clock()
+            self._expire(now)
+            self._data[key] = (value, now + ttl)
+            self._wheel.schedule(key, now + ttl)
+
+    def get(self, key: str):
+        with self._lock:
+            now = self._clock()
+            self._expire(now)
+            entry = self._data.get(key)
+            return entry[0] if entry and entry[1] > now else None
+
+    def delete(self, key: str):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def update(self, key: str, fn, ttl: float | None = None):
+        """
+        Atomically applies fn(current value or None) -> (new value, result).
+        A new value of None deletes the key. An existing entry keeps its
+        expiry unless ttl is given; a new key needs a ttl. Returns result.
+        """
+        with self._lock:
+            now = self._clock()
+            self._expire(now)
+            entry = self._data.get(key)
+            current = entry[0] if entry and entry[1] > now else None
+            new_value, result = fn(current)
+            if new_value is None:
+                self._data.pop(key, None)
+            elif ttl is not None or current is None:
+                expires = now + (ttl or 0)
+                self._data[key] = (new_value, expires)
+                self._wheel.schedule(key, expires)
+            else:
+                self._data[key] = (new_value, entry[1])
+            return result
+
+    def __len__(self):
+        with self._lock:
+            self._expire(self._clock())
+            return len(self._data)
+
+
+class InProcessCounter:
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def incr(self, key: str, amount: int = 1) -> int:
+        """Adds amount to key and returns the new value."""
+        with self._lock:
+            value = self._values.get(key, 0) + amount
+            self._values[key] = value
+            return value
+
+    def get(self, key: str) -> int:
+        return self._values.get(key, 0)
+
+    def items(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+
+class InProcessStateBackend:
+    name = "memory"
+    shared_across_processes = False
+
+    def queue(self, name: str) -> InProcessQueue:
+        return InProcessQueue()
+
+    def ttl_map(self, name: str) -> InProcessTTLMap:
+        return InProcessTTLMap()
+
+    def counter(self, name: str) -> InProcessCounter:
+        return InProcessCounter()
+
+
+# ---------- SQLite, shared by every worker process on the host ----------
+
+class _SqliteStructure:
+    def __init__(self, backend: "SqliteStateBackend", name: str):
+        self.name = name
+        self._backend = backend
+
+    def _conn(self) -> sqlite3.Connection:
+        return self._backend.connection()
+
+    def _transaction(self, fn):
+        """Runs fn(conn) under BEGIN IMMEDIATE, which serializes writers across processes."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = fn(conn)
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+
+class SqliteQueue(_SqliteStructure):
+    def push(self, item):
+        self._conn().execute(
+            "INSERT INTO queue_items (name, value) VALUES (?, ?)", (self.name, json.dumps(item))
+        )
+
+    def pop(self):
+        """Removes and returns the oldest item, or None when the queue is empty."""
+        def take(conn):
+            row = conn.execute(
+                "SELECT id, value FROM queue_items WHERE name = ? ORDER BY id LIMIT 1", (self.name,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute("DELETE FROM queue_items WHERE id = ?", (row[0],))
+            return json.loads(row[1])
+
+        return self._transaction(take)
+
+    def __len__(self):
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM queue_items WHERE name = ?", (self.name,)
+        ).fetchone()[0]
+
+
+class SqliteTTLMap(_SqliteStructure):
+    # expired rows are swept at most this often per process
+    PURGE_INTERVAL = 30.0
+
+    def __init__(self, backend: "SqliteStateBackend", name: str, clock=time.time):
+        super().__init__(backend, name)
+        self._clock = clock
+        self._last_purge = 0.0
+
+    def _purge(self, conn, now: float):
+        if now - self._last_purge < self.PURGE_INTERVAL:
+            return
+        self._last_purge = now
+        conn.execute("DELETE FROM ttl_map WHERE expires <= ?", (now,))
+
+    def set(self, key: str, value, ttl: float):
+        now = self._clock()
+        conn = self._conn()
+        self._purge(conn, now)
+        conn.execute(
+            "INSERT OR REPLACE INTO ttl_map (name, key, value, expires) VALUES (?, ?, ?, ?)",
+            (self.name, key, json.dumps(value), now + ttl),
+        )
+
+    def get(self, key: str):
+        row = self._conn().execute(
+            "SELECT value FROM ttl_map WHERE name = ? AND key = ? AND expires > ?",
+            (self.name, key, self._clock()),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def delete(self, key: str):
+        self._conn().execute("DELETE FROM ttl_map WHERE name = ? AND key = ?", (self.name, key))
+
+    def update(self, key: str, fn, ttl: float | None = None):
+        """Same contract as InProcessTTLMap.update, serialized across processes."""
+        now = self._clock()
+
+        def apply(conn):
+            self._purge(conn, now)
+            row = conn.execute(
+                "SELECT value, expires FROM ttl_map WHERE name = ? AND key = ? AND expires > ?",
+                (self.name, key, now),
+            ).fetchone()
+            new_value, result = fn(json.loads(row[0]) if row else None)
+            if new_value is None:
+                conn.execute("DELETE FROM ttl_map WHERE name = ? AND key = ?", (self.name, key))
+            else:
+                expires = now + (ttl or 0) if ttl is not None or row is None else row[1]
+                conn.execute(
+                    "INSERT OR REPLACE INTO ttl_map (name, key, value, expires) VALUES (?, ?, ?, ?)",
+                    (self.name, key, json.dumps(new_value), expires),
+                )
+            return result
+
+        return self._transaction(apply)
+
+    def __len__(self):
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM ttl_map WHERE name = ? AND expires > ?", (self.name, self._clock())
+        ).fetchone()[0]
+
+
+class SqliteCounter(_SqliteStructure):
+    def incr(self, key: str, amount: int = 1) -> int:
+        """Adds amount to key and returns the new value."""
+        def bump(conn):
+            conn.execute(
+                "INSERT INTO counters (name, key, value) VALUES (?, ?, ?)"
+                " ON CONFLICT (name, key) DO UPDATE SET value = value + excluded.value",
+                (self.name, key, amount),
+            )
+            return conn.execute(
+                "SELECT value FROM counters WHERE name = ? AND key = ?", (self.name, key)
+            ).fetchone()[0]
+
+        return self._transaction(bump)
+
+    def get(self, key: str) -> int:
+        row = self._conn().execute(
+            "SELECT value FROM counters WHERE name = ? AND key = ?", (self.name, key)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def items(self) -> dict:
+        return dict(self._conn().execute(
+            "SELECT key, value FROM counters WHERE name = ?", (self.name,)
+        ).fetchall())
+
+
+class SqliteStateBackend:
+    name = "sqlite"
+    shared_across_processes = True
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self.connection().executescript(
+            "CREATE TABLE IF NOT EXISTS queue_items ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, value TEXT NOT NULL);"
+            "CREATE INDEX IF NOT EXISTS queue_items_name ON queue_items (name, id);"
+            "CREATE TABLE IF NOT EXISTS ttl_map ("
+            " name TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires REAL NOT NULL,"
+            " PRIMARY KEY (name, key));"
+            "CREATE INDEX IF NOT EXISTS ttl_map_expires ON ttl_map (expires);"
+            "CREATE TABLE IF NOT EXISTS counters ("
+            " name TEXT NOT NULL, key TEXT NOT NULL, value INTEGER NOT NULL,"
+            " PRIMARY KEY (name, key));"
+        )
+
+    def connection(self) -> sqlite3.Connection:
+        # sqlite3 connections are per thread; WAL lets worker processes read while one writes
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def queue(self, name: str) -> SqliteQueue:
+        return SqliteQueue(self, name)
+
+    def ttl_map(self, name: str) -> SqliteTTLMap:
+        return SqliteTTLMap(self, name)
+
+    def counter(self, name: str) -> SqliteCounter:
+        return SqliteCounter(self, name)
+
+
+def get_state_backend():
+    """Builds the backend selected by settings.STATE_BACKEND."""
+    if settings.STATE_BACKEND == "sqlite":
+        return SqliteStateBackend(settings.STATE_SQLITE_PATH)
+    if settings.STATE_BACKEND != "memory":
+        raise ValueError(f"Unknown STATE_BACKEND {settings.STATE_BACKEND!r}, expected 'memory' or 'sqlite'")
+    return InProcessStateBackend()
+
+
+state_backend = get_state_backend()
@@ -0,0 +1,145 @@
+# services/team_membership.py
+"""
+Team membership writes.
+
+A team document and the rescuer documents that point at it change
+together: creating, re-staffing or deleting a team runs as one Firestore
+transaction, so a failure can no longer leave rescuers pointing at the
+wrong team. Rescuer existence is checked with a single batched read
+inside the transaction rather than one update attempt per rescuer.
+"""
+import time
+
+from firebase import db, firestore
+from config import settings
+from schemas.rescue import TeamStatus
+from utils.firestore_preconditions import merge_update
+from utils.change_stamp import stamped
+from services.metrics import track_firestore
+from services.tombstones import tombstone, tombstone_id
+
+# Firestore allows at most 500 writes per transaction: the team plus its rescuers
+MAX_TEAM_WRITES = 500
+
+# fields that decide which rescuers belong to a team and what they show
+_MEMBERSHIP_FIELDS = ("members", "leader", "teamName")
+
+
+class TeamNotFound(Exception):
+    pass
+
+
+def team_member_ids(team_data: dict) -> set:
+    """Everyone on the team: the members list plus the leader."""
+    ids = set(team_data.get("members") or [])
+    if team_data.get("leader"):
+        ids.add(team_data["leader"])
+    return ids
+
+
+def _team_ref(team_id: str):
+    return db.collection(settings.FIREBASE_COLLECTION_RESCUE_TEAMS).document(team_id)
+
+
+def _rescuer_ref(rescuer_id: str):
+    return db.collection(settings.FIREBASE_COLLECTION_RESCUERS).document(rescuer_id)
+
+
+def _existing_rescuers(transaction, rescuer_ids) -> set:
+    """One batched read of the affected rescuers; unknown ids are skipped as before."""
+    refs = [_rescuer_ref(rescuer_id) for rescuer_id in rescuer_ids]
+    if not refs:
+        return set()
+    return {snap.id for snap in db.get_all(refs, field_paths=["id"], transaction=transaction) if snap.exists}
+
+
+def _now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def _write_rescuers(transaction, rescuer_ids, fields: dict):
+    fields = stamped({**fields, "updatedAt": _now_ms()})
+    for rescuer_id in rescuer_ids:
+        transaction.update(_rescuer_ref(rescuer_id), fields)
+
+
+def _assigned_fields(team_id: str, team_name) -> dict:
+    return {"teamId": team_id, "teamName": team_name, "status": TeamStatus.ASSIGNED.value}
+
+
+_FREE_FIELDS = {"teamId": None, "teamName": None, "status": TeamStatus.FREE.value}
+
+
+def _check_size(rescuer_count: int):
+    if rescuer_count + 1 > MAX_TEAM_WRITES:
+        raise ValueError(f"A team change can touch at most {MAX_TEAM_WRITES - 1} rescuers")
+
+
+def create_team(team_data: dict) -> dict:
+    """Creates the team document and links every existing member to it, atomically."""
+    team_id = team_data["teamId"]
+    team_data.update(stamped({"updatedAt": _now_ms()}))
+    members = team_member_ids(team_data)
+    _check_size(len(members))
+
+    @firestore.transactional
+    def apply(transaction):
+        existing = _existing_rescuers(transaction, members)
+        transaction.create(_team_ref(team_id), team_data)
+        _write_rescuers(transaction, existing, _assigned_fields(team_id, team_data.get("teamName")))
+
+    with track_firestore(settings.FIREBASE_COLLECTION_RESCUE_TEAMS, "transaction"):
+        apply(db.transaction())
+    return team_data
+
+
+def update_team(team_id: str, update_data: dict) -> dict:
+    """
+    Applies update_data to the team. If it changes the roster or the team
+    name, removed rescuers are freed and current ones re-linked in the same
+    transaction. Returns the team's new state.
+    """
+    update_data = stamped({**update_data, "updatedAt": _now_ms()})
+
+    @firestore.transactional
+    def apply(transaction):
+        snapshot = _team_ref(team_id).get(transaction=transaction)
+        if not snapshot.exists:
+            raise TeamNotFound(team_id)
+        current = snapshot.to_dict()
+        updated = merge_update(current, update_data)
+
+        if any(field in update_data for field in _MEMBERSHIP_FIELDS):
+            old_members = team_member_ids(current)
+            new_members = team_member_ids(updated)
+            _check_size(len(old_members | new_members))
+            existing = _existing_rescuers(transaction, old_members | new_members)
+            _write_rescuers(transaction, (old_members - new_members) & existing, _FREE_FIELDS)
+            _write_rescuers(transaction, new_members & existing, _assigned_fields(team_id, updated.get("teamName")))
+
+        transaction.update(_team_ref(team_id), update_data)
+        return updated
+
+    with track_firestore(settings.FIREBASE_COLLECTION_RESCUE_TEAMS, "transaction"):
+        return apply(db.transaction())
+
+
+def delete_team(team_id: str):
+    """Deletes the team and frees every rescuer on it, atomically."""
+
+    @firestore.transactional
+    def apply(transaction):
+        snapshot = _team_ref(team_id).get(transaction=transaction)
+        if not snapshot.exists:
+            raise TeamNotFound(team_id)
+        members = team_member_ids(snapshot.to_dict())
+        _check_size(len(members))
+        existing = _existing_rescuers(transaction, members)
+        _write_rescuers(transaction, existing, _FREE_FIELDS)
+        transaction.delete(_team_ref(team_id))
+        tombstone_ref = db.collection(settings.FIREBASE_COLLECTION_TOMBSTONES).document(
+            tombstone_id(settings.FIREBASE_COLLECTION_RESCUE_TEAMS, team_id))
+        transaction.set(tombstone_ref, tombstone(settings.FIREBASE_COLLECTION_RESCUE_TEAMS, team_id))
+
+    with track_firestore(settings.FIREBASE_COLLECTION_RESCUE_TEAMS, "transaction"):
+        apply(db.transaction())
@@ -0,0 +1,32 @@
+# services/tombstones.py
+"""
+Records of deleted documents, for the change feed (GET /api/changes).
+
+A deleted document leaves nothing behind to carry an update time, so each
+delete path writes a tombstone to settings.FIREBASE_COLLECTION_TOMBSTONES
+in the same batch or transaction as the delete. `expireAt` is for a
+Firestore TTL policy on that collection; the feed turns away tokens older
+than settings.TOMBSTONE_RETENTION_SECONDS, so no client can miss a
+tombstone that has already expired.
+"""
+import time
+from datetime import datetime, timezone
+
+from config import settings
+
+
+def tombstone_id(collection: str, doc_id: str) -> str:
+    # one per document: deleting it again (after a re-create) just moves deletedAt
+    return f"{collection}:{doc_id}"
+
+
+def tombstone(collection: str, doc_id: str, deleted_at: int | None = None) -> dict:
+    """Fields of the tombstone for a document deleted at `deleted_at` (epoch ms, default now)."""
+    if deleted_at is None:
+        deleted_at = int(time.time() * 1000)
+    return {
+        "collection": collection,
+        "docId": doc_id,
+        "deletedAt": deleted_at,
+        "expireAt": datetime.fromtimestamp(deleted_at / 1000 + settings.TOMBSTONE_RETENTION_SECONDS, timezone.utc),
+    }
@@ -5,16 +5,25 @@ from schemas.user import UserCreate, UserResponse, Location
 from schemas.communication import StatusUpdate
 from fastapi import HTTPException
 from utils.common import calculate_age
-from routers.users import get_user_by_phone, update_user
+from utils.firestore_preconditions import update_if_unchanged, WriteConflict
+from routers.users import get_user_by_phone
 
 
 
 def update_user_status_and_location(user_id: str, status: str, location: Location) -> dict:
-    """Updates a user's status and location in Firestore using the router API."""
+    """Updates a user's status and location in Firestore."""
     payload = {
         "status": status,
         "location": location.model_dump()
     }
 
-    updated_user = update_user(user_id, payload)
+    # the update_user endpoint is async now; this helper serves the synchronous SMS path
+    doc_ref = db.collection(settings.FIREBASE_COLLECTION_USERS).document(user_id)
+    snapshot = doc_ref.get()
+    if not snapshot.exists:
+        raise HTTPException(status_code=404, detail="User not found")
+    try:
+        updated_user = update_if_unchanged(doc_ref, snapshot, payload)
+    except WriteConflict:
+        raise HTTPException(status_code=409, detail="User was modified concurrently, retry the update")
     return {"userId": user_id, "status": status, "message": "Status and location updated successfully", "user": updated_user}
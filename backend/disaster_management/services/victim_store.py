@@ -0,0 +1,100 @@
+# services/victim_store.py
+"""
+Compact columns for active victims, the victims layer of the location index.
+
+Alongside position and update time each victim keeps what the assignment
+and scoring paths read: status and gender as int8 codes, age as uint16 and
+name and phone as interned strings. No Firestore dict or datetime is kept
+per victim. Queries hand out `VictimRow`s: slotted copies of one row,
+safe to use after the index lock is released.
+"""
+import sys
+from datetime import date, datetime
+
+from services.columnar import Codes, Layer
+
+AGE_UNKNOWN = 0xFFFF
+
+statuses = Codes()
+genders = Codes()
+
+
+def age_from_dob(value, today: date | None = None) -> int | None:
+    """Age in whole years from a Firestore timestamp or an ISO 'YYYY-MM-DD...' string."""
+    if isinstance(value, datetime):
+        born = value.date()
+    elif isinstance(value, str):
+        try:
+            born = date.fromisoformat(value[:10])
+        except ValueError:
+            return None
+    else:
+        return None
+    today = today or date.today()
+    return today.year - born.year - ((today.month, today.day) < (born.month, born.day))
+
+
+class VictimRow:
+    __slots__ = ("id", "latitude", "longitude", "status", "gender", "age", "name", "phone", "updated_at", "distance_km")
+
+    def __init__(self, id, latitude, longitude, status, gender, age, name, phone, updated_at, distance_km=None):
+        self.id = id
+        self.latitude = latitude
+        self.longitude = longitude
+        self.status = status
+        self.gender = gender
+        self.age = age            # None when the date of birth is missing or unreadable
+        self.name = name
+        self.phone = phone
+        self.updated_at = updated_at  # epoch ms
+        self.distance_km = distance_km  # from the query point, when the row came from a spatial query
+
+    def __repr__(self):
+        return f"VictimRow({self.id!r}, {self.latitude}, {self.longitude}, status={self.status!r})"
+
+
+class VictimLayer(Layer):
+    columns = Layer.columns + (
+        ("status", "i1", 0),
+        ("gender", "i1", 0),
+        ("age", "<u2", AGE_UNKNOWN),
+    )
+    text_columns = ("name", "phone")
+    coded_columns = {"status": statuses, "gender": genders}
+    # "birthday" is what older app builds wrote instead of dateOfBirth
+    extra_fields = ("status", "gender", "dateOfBirth", "birthday", "name", "phoneNumber")
+
+    def write(self, row: int, data: dict):
+        if "status" in data:
+            self.status[row] = statuses.code(data["status"])
+        if "gender" in data:
+            self.gender[row] = genders.code(data["gender"])
+        if "dateOfBirth" in data or "birthday" in data:
+            age = age_from_dob(data.get("dateOfBirth") or data.get("birthday"))
+            self.age[row] = AGE_UNKNOWN if age is None or not 0 <= age < AGE_UNKNOWN else age
+        if "name" in data:
+            self.name[row] = sys.intern(data["name"]) if isinstance(data["name"], str) else None
+        if "phoneNumber" in data:
+            phone = data["phoneNumber"]
+            # some records hold the number as a Firestore integer; the snapshot column only takes text
+            if isinstance(phone, int) and not isinstance(phone, bool):
+                phone = str(phone)
+            self.phone[row] = sys.intern(phone) if isinstance(phone, str) else None
+
+    def view(self, row: int, distance_km: float | None = None) -> VictimRow:
+        age = int(self.age[row])
+        return VictimRow(
+            self.ids[row],
+            float(self.lat[row]),
+            float(self.lon[row]),
+            statuses.value(self.status[row]),
+            genders.value(self.gender[row]),
+            None if age == AGE_UNKNOWN else age,
+            self.name[row],
+            self.phone[row],
+            int(self.updated[row]),
+            distance_km,
+        )
+
+    def views(self, rows: list, distances: list) -> list:
+        return [self.view(row, distance) for row, distance in zip(rows, distances)]
@@ -0,0 +1,6 @@
+# tests/conftest.py
+import sys
+from pathlib import Path
+
+# the app imports its modules from the disaster_management directory (config, services, utils, ...)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
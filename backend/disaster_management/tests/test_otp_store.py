@@ -0,0 +1,81 @@
+# tests/test_otp_store.py
+import types
+
+import pytest
+
+from services import otp_store as otp_module
+from services.otp_store import OTP_INVALID, OTP_LOCKED, OTP_MISSING, OTP_OK, OtpStore, OtpThrottled
+from services.state_backend import InProcessTTLMap
+
+PHONE = "+919876543210"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = types.SimpleNamespace(now=1_000.0)
+    monkeypatch.setattr(otp_module, "time", types.SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+@pytest.fixture
+def store(clock):
+    return OtpStore(InProcessTTLMap(clock=lambda: clock.now), ttl=300, max_attempts=3, resend_interval=60)
+
+
+def test_issued_otp_verifies_once(store):
+    otp = store.issue(PHONE)
+    assert len(otp) == 6 and otp.isdigit()
+    assert store.verify(PHONE, otp) == OTP_OK
+    assert store.verify(PHONE, otp) == OTP_MISSING
+
+
+def test_otp_is_bound_to_its_phone(store):
+    otp = store.issue(PHONE)
+    assert store.verify("+919876543211", otp) == OTP_MISSING
+    assert store.verify(PHONE, otp) == OTP_OK
+
+
+def test_only_the_hash_is_stored(store):
+    otp = store.issue(PHONE)
+    assert otp not in repr(store._records.get(PHONE))
+
+
+def test_wrong_guesses_lock_the_otp(store):
+    otp = store.issue(PHONE)
+    wrong = "000000" if otp != "000000" else "111111"
+    assert [store.verify(PHONE, wrong) for _ in range(3)] == [OTP_INVALID] * 3
+    assert store.verify(PHONE, otp) == OTP_LOCKED
+
+
+def test_otp_expires(store, clock):
+    otp = store.issue(PHONE)
+    clock.now += 301
+    assert store.verify(PHONE, otp) == OTP_MISSING
+
+
+def test_resend_is_throttled(store, clock):
+    first = store.issue(PHONE)
+    clock.now += 45
+    with pytest.raises(OtpThrottled) as throttled:
+        store.issue(PHONE)
+    assert throttled.value.retry_after == pytest.approx(15)
+    # the throttled request leaves the outstanding OTP usable
+    assert store.verify(PHONE, first) == OTP_OK
+
+
+def test_new_otp_replaces_the_old_one(store, clock):
+    first = store.issue(PHONE)
+    clock.now += 61
+    second = store.issue(PHONE)
+    if first != second:
+        assert store.verify(PHONE, first) == OTP_INVALID
+    assert store.verify(PHONE, second) == OTP_OK
+
+
+def test_new_otp_resets_the_attempt_count(store, clock):
+    store.issue(PHONE)
+    for _ in range(3):
+        store.verify(PHONE, "not-an-otp")
+    clock.now += 61
+    otp = store.issue(PHONE)
+    assert store.verify(PHONE, otp) == OTP_OK
@@ -0,0 +1,65 @@
+# tests/test_pagination.py
+import base64
+import json
+from datetime import datetime, timezone
+
+import pytest
+from fastapi import HTTPException
+
+from utils.pagination import decode_cursor, encode_cursor, project
+
+
+def _raw_cursor(values) -> str:
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+
+@pytest.mark.parametrize("values", [
+    [1_700_000_000_123, "victim-1"],
+    ["Critical", 19.07, None, True, "+919876543210"],
+    [],
+])
+def test_cursor_round_trip(values):
+    cursor = encode_cursor(values)
+    assert "=" not in cursor
+    assert decode_cursor(cursor, len(values)) == values
+
+
+def test_cursor_keeps_timestamps_as_datetimes():
+    updated = datetime(2024, 7, 1, 9, 30, 15, 123456, tzinfo=timezone.utc)
+    (decoded_ts, doc_id) = decode_cursor(encode_cursor([updated, "victim-1"]), 2)
+    assert decoded_ts == updated
+    assert doc_id == "victim-1"
+
+
+def test_cursor_treats_naive_datetimes_as_utc():
+    (decoded,) = decode_cursor(encode_cursor([datetime(2024, 7, 1, 9, 30)]), 1)
+    assert decoded == datetime(2024, 7, 1, 9, 30, tzinfo=timezone.utc)
+
+
+def test_cursor_rejects_values_json_cannot_carry():
+    with pytest.raises(TypeError):
+        encode_cursor([object()])
+
+
+def test_cursor_only_decodes_exact_timestamp_tags():
+    values = [{"$ts": "1"}, {"$ts": 1, "other": 2}]
+    assert decode_cursor(_raw_cursor(values), 2) == values
+
+
+@pytest.mark.parametrize("cursor, expected_len", [
+    ("not base64!", 1),
+    (_raw_cursor(["a", "b"]), 1),
+    (_raw_cursor({"a": 1}), 1),
+    (base64.urlsafe_b64encode(b"{not json").decode(), 1),
+    (_raw_cursor([{"$ts": 10 ** 30}]), 1),
+])
+def test_invalid_cursor_is_a_400(cursor, expected_len):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor, expected_len)
+    assert error.value.status_code == 400
+
+
+def test_project():
+    item = {"id": "1", "name": "A", "status": "Active"}
+    assert project(item, None) is item
+    assert project(item, ["name", "missing"]) == {"name": "A"}
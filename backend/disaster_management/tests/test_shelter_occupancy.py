@@ -0,0 +1,223 @@
+# tests/test_shelter_occupancy.py
+import threading
+import time
+import types
+
+import pytest
+
+from services import shelter_occupancy
+from services.shelter_occupancy import AlreadyAdmitted, NotAdmitted, ShelterAdmissions, ShelterFull, ShelterNotFound
+
+DELETE_FIELD = object()
+
+
+class ArrayUnion(list):
+    pass
+
+
+class ArrayRemove(list):
+    pass
+
+
+class FakeSnapshot:
+    def __init__(self, doc_id, data):
+        self.id = doc_id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeRef:
+    def __init__(self, db, path):
+        self._db = db
+        self.path = path
+        self.id = path.rsplit("/", 1)[1]
+
+    def get(self, transaction=None):
+        self._db.before_read()
+        return FakeSnapshot(self.id, self._db.docs.get(self.path))
+
+
+class FakeCollection:
+    def __init__(self, db, name):
+        self._db = db
+        self._name = name
+
+    def document(self, doc_id):
+        return FakeRef(self._db, f"{self._name}/{doc_id}")
+
+
+def _field_path(path: str) -> list:
+    # only what the admissions code writes: plain names and backtick-quoted segments
+    parts, current, quoted = [], "", False
+    for c in path:
+        if c == "`":
+            quoted = not quoted
+        elif c == "." and not quoted:
+            parts.append(current)
+            current = ""
+        else:
+            current += c
+    return parts + [current]
+
+
+class FakeTransaction:
+    def __init__(self, db):
+        self._db = db
+
+    def update(self, ref, fields):
+        doc = self._db.docs[ref.path]
+        for path, value in fields.items():
+            *parents, leaf = _field_path(path)
+            target = doc
+            for name in parents:
+                target = target.setdefault(name, {})
+            if value is DELETE_FIELD:
+                target.pop(leaf, None)
+            elif isinstance(value, ArrayUnion):
+                target[leaf] = list(target.get(leaf) or []) + [v for v in value if v not in (target.get(leaf) or [])]
+            elif isinstance(value, ArrayRemove):
+                target[leaf] = [v for v in target.get(leaf) or [] if v not in value]
+            else:
+                target[leaf] = value
+        self._db.updates.append((ref.path, fields))
+
+
+class FakeDb:
+    """The slice of the Firestore client that services/shelter_occupancy.py uses."""
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.updates = []
+        self.transactions = 0
+        self.before_read = lambda: None
+
+    def collection(self, name):
+        return FakeCollection(self, name)
+
+    def transaction(self, **kwargs):
+        self.transactions += 1
+        return FakeTransaction(self)
+
+    def get_all(self, refs, field_paths=None, transaction=None):
+        return [FakeSnapshot(ref.id, self.docs.get(ref.path)) for ref in refs]
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    db = FakeDb({
+        "shelters/list": {"name": "School", "capacity": 3, "rescuedMembers": ["u1"], "currentOccupancy": 1},
+        "shelters/map": {"name": "Hall", "capacity": 3, "rescuedMembers": {"+911": "Ann"}},
+        "victims/+912": {"name": "Bob"},
+    })
+    firestore = types.SimpleNamespace(
+        transactional=lambda fn: fn, ArrayUnion=ArrayUnion, ArrayRemove=ArrayRemove, DELETE_FIELD=DELETE_FIELD,
+    )
+    monkeypatch.setattr(shelter_occupancy, "db", db)
+    monkeypatch.setattr(shelter_occupancy, "firestore", firestore)
+    return db
+
+
+@pytest.fixture
+def admissions():
+    return ShelterAdmissions()
+
+
+def test_admit_to_list_shelter(fake_db, admissions):
+    shelter = admissions.admit("list", "u2")
+    assert shelter["id"] == "list"
+    assert shelter["rescuedMembers"] == ["u1", "u2"]
+    assert shelter["currentOccupancy"] == 2
+    stored = fake_db.docs["shelters/list"]
+    assert stored["rescuedMembers"] == ["u1", "u2"]
+    assert stored["currentOccupancy"] == 2
+    assert stored["lastUpdated"] == stored["syncedAt"]
+
+
+def test_admit_keeps_the_map_shape(fake_db, admissions):
+    shelter = admissions.admit("map", "+912")
+    assert shelter["rescuedMembers"] == {"+911": "Ann", "+912": "Bob"}
+    assert fake_db.docs["shelters/map"]["rescuedMembers"] == {"+911": "Ann", "+912": "Bob"}
+    assert fake_db.docs["shelters/map"]["currentOccupancy"] == 2
+    # the member is written on its own, not by rewriting the whole map
+    (_, fields), = fake_db.updates
+    assert "rescuedMembers" not in fields
+
+
+def test_admit_unknown_victim_to_map_shelter(fake_db, admissions):
+    admissions.admit("map", "+913")
+    assert fake_db.docs["shelters/map"]["rescuedMembers"]["+913"] == "Unknown"
+
+
+def test_admit_errors(fake_db, admissions):
+    with pytest.raises(ShelterNotFound):
+        admissions.admit("missing", "u2")
+    with pytest.raises(AlreadyAdmitted):
+        admissions.admit("list", "u1")
+    with pytest.raises(AlreadyAdmitted):
+        admissions.admit("map", "+911")
+    admissions.admit("list", "u2")
+    admissions.admit("list", "u3")
+    with pytest.raises(ShelterFull):
+        admissions.admit("list", "u4")
+    assert fake_db.docs["shelters/list"]["currentOccupancy"] == 3
+
+
+def test_discharge(fake_db, admissions):
+    shelter = admissions.discharge("list", "u1")
+    assert shelter["rescuedMembers"] == []
+    assert shelter["currentOccupancy"] == 0
+    assert fake_db.docs["shelters/list"]["rescuedMembers"] == []
+
+    shelter = admissions.discharge("map", "+911")
+    assert shelter["rescuedMembers"] == {}
+    assert fake_db.docs["shelters/map"]["rescuedMembers"] == {}
+    assert fake_db.docs["shelters/map"]["currentOccupancy"] == 0
+
+
+def test_discharge_errors(fake_db, admissions):
+    with pytest.raises(ShelterNotFound):
+        admissions.discharge("missing", "u1")
+    with pytest.raises(NotAdmitted):
+        admissions.discharge("list", "u9")
+    with pytest.raises(NotAdmitted):
+        admissions.discharge("map", "+919")
+
+
+def test_concurrent_admissions_share_transactions_and_respect_capacity(fake_db, admissions):
+    # hold the first transaction's read until every other arrival is queued behind it
+    release = threading.Event()
+    first_read = threading.Event()
+
+    def before_read():
+        if not first_read.is_set():
+            first_read.set()
+            assert release.wait(5)
+
+    fake_db.before_read = before_read
+    results = {}
+
+    def arrive(member_id):
+        try:
+            admissions.admit("list", member_id)
+            results[member_id] = "admitted"
+        except ShelterFull:
+            results[member_id] = "full"
+
+    first = threading.Thread(target=arrive, args=("m0",))
+    first.start()
+    assert first_read.wait(5)
+    others = [threading.Thread(target=arrive, args=(f"m{i}",)) for i in range(1, 6)]
+    for thread in others:
+        thread.start()
+    while len(admissions._pending.get("list", [])) < len(others):
+        time.sleep(0.001)
+    release.set()
+    for thread in [first, *others]:
+        thread.join(5)
+
+    assert sorted(results.values()) == ["admitted", "admitted", "full", "full", "full", "full"]
+    assert len(fake_db.docs["shelters/list"]["rescuedMembers"]) == 3
+    assert fake_db.transactions == 2
@@ -0,0 +1,188 @@
+# tests/test_sms_codec.py
+import pytest
+
+from utils.sms_codec import (
+    COMPACT_PREFIX,
+    MAX_FRAME_SPAN_SECONDS,
+    OP_RESCUER_LOCATION,
+    OP_VICTIM_LOCATION,
+    LocationFix,
+    b64decode_compact,
+    b64encode_compact,
+    decode_location_frame,
+    decode_victim_list,
+    decode_victim_list_sms,
+    encode_location_frame,
+    encode_victim_list,
+    encode_victim_list_sms,
+    find_compact_frame,
+    join_sms,
+    sms_segment_count,
+    split_into_sms,
+)
+
+FIXES = [
+    LocationFix(19.07283, 72.88261, 80, 1_700_000_000),
+    LocationFix(19.07301, 72.88199, None, 1_700_000_030),
+    LocationFix(-33.86785, 151.20732, 5, 1_700_000_090),
+]
+
+VICTIMS = [
+    {"phone": "+919876543210", "name": "Asha", "age": 34, "status": "Critical", "latitude": 19.0728, "longitude": 72.8826},
+    {"phone": "+919876543211", "name": "Ravi", "age": 0, "status": "Needs Help", "latitude": 19.0731, "longitude": 72.8801},
+    {"phone": "+919876543212", "name": "Asha", "age": 71, "status": "Active", "latitude": 19.0698, "longitude": 72.8855},
+]
+
+
+# ---------- DL1 location frames ----------
+
+def test_location_frame_round_trip():
+    frame = encode_location_frame(OP_VICTIM_LOCATION, FIXES)
+    assert frame.startswith(COMPACT_PREFIX)
+    opcode, fixes = decode_location_frame(find_compact_frame(frame))
+    assert opcode == OP_VICTIM_LOCATION
+    assert fixes == FIXES
+
+
+def test_location_frame_clamps_battery():
+    frame = encode_location_frame(OP_RESCUER_LOCATION, [LocationFix(0.0, 0.0, 300, 1_700_000_000)])
+    _, (fix,) = decode_location_frame(find_compact_frame(frame))
+    assert fix.battery == 254
+
+
+def test_ten_fixes_fit_one_sms():
+    fixes = [LocationFix(19.0 + i / 1000, 72.8, 50, 1_700_000_000 + i * 60) for i in range(10)]
+    assert sms_segment_count(encode_location_frame(OP_VICTIM_LOCATION, fixes)) == 1
+
+
+@pytest.mark.parametrize("fixes", [
+    [],
+    [LocationFix(0.0, 0.0, 1, 1_700_000_000), LocationFix(0.0, 0.0, 1, 1_700_000_000 + MAX_FRAME_SPAN_SECONDS + 1)],
+    [LocationFix(0.0, 0.0, 1, -1)],
+    [LocationFix(30_000.0, 0.0, 1, 1_700_000_000)],
+])
+def test_encode_location_frame_rejects_what_does_not_fit(fixes):
+    with pytest.raises(ValueError):
+        encode_location_frame(OP_VICTIM_LOCATION, fixes)
+
+
+def test_encode_location_frame_rejects_large_opcode():
+    with pytest.raises(ValueError):
+        encode_location_frame(0x100, FIXES)
+
+
+@pytest.mark.parametrize("msg, expected", [
+    ("DL1:AQID", "AQID"),
+    ("  DL1:AQID \n", "AQID"),
+    ("DL1:AQID trailing words", "AQID"),
+    ("DL1:", ""),
+    ('{"lat": 19.07, "lon": 72.88}', None),
+    ("help, my code is DL1:AQID", None),
+])
+def test_find_compact_frame_only_at_the_start(msg, expected):
+    assert find_compact_frame(msg) == expected
+
+
+def test_decode_location_frame_rejects_truncated_fix():
+    body = find_compact_frame(encode_location_frame(OP_VICTIM_LOCATION, FIXES))
+    raw = b64decode_compact(body)
+    with pytest.raises(ValueError, match="truncated fix"):
+        decode_location_frame(b64encode_compact(raw[:-3]))
+
+
+@pytest.mark.parametrize("body", ["AQ", "not base64!"])
+def test_decode_location_frame_rejects_garbage(body):
+    with pytest.raises(ValueError):
+        decode_location_frame(body)
+
+
+# ---------- DL2 victim lists ----------
+
+def test_victim_list_round_trip():
+    decoded = decode_victim_list(encode_victim_list(VICTIMS, 19.07, 72.88))
+    assert [v["phone"] for v in decoded] == [v["phone"] for v in VICTIMS]
+    assert [v["name"] for v in decoded] == [v["name"] for v in VICTIMS]
+    assert [v["status"] for v in decoded] == [v["status"] for v in VICTIMS]
+    assert [v["age"] for v in decoded] == [v["age"] for v in VICTIMS]
+    for got, sent in zip(decoded, VICTIMS):
+        assert got["latitude"] == pytest.approx(sent["latitude"], abs=1e-5)
+        assert got["longitude"] == pytest.approx(sent["longitude"], abs=1e-5)
+
+
+def test_victim_list_defaults_missing_fields():
+    (victim,) = decode_victim_list(encode_victim_list([{"status": "Sleeping"}], 19.07, 72.88))
+    assert victim == {
+        "phone": None, "name": "", "age": 0, "status": "Unknown", "latitude": 19.07, "longitude": 72.88,
+    }
+
+
+def test_victim_list_sms_reassembles_in_any_order():
+    victims = [dict(VICTIMS[i % 3], phone=f"+9198765{i:05d}") for i in range(40)]
+    messages = encode_victim_list_sms(victims, 19.07, 72.88, prefix="T1 ")
+    assert len(messages) > 1
+    assert all(sms_segment_count(m) == 1 and len(m) <= 160 for m in messages)
+    decoded = decode_victim_list_sms(list(reversed(messages)))
+    assert [v["phone"] for v in decoded] == [v["phone"] for v in victims]
+
+
+def test_split_into_sms_fills_each_message():
+    payload = "A" * 400
+    messages = split_into_sms(payload)
+    assert [len(m) for m in messages] == [160, 160, 95]
+    assert join_sms(messages[::-1]) == payload
+
+
+def test_split_into_sms_rejects_oversized_prefix():
+    with pytest.raises(ValueError):
+        split_into_sms("AAAA", prefix="x" * 160)
+
+
+@pytest.mark.parametrize("messages", [
+    [],
+    ["hello"],
+    ["DL2A"],
+    ["DL2ABpayload"],  # one of two segments
+])
+def test_join_sms_rejects_incomplete_input(messages):
+    with pytest.raises(ValueError):
+        join_sms(messages)
+
+
+def _corrupt_list(**changes) -> bytes:
+    """A one-victim list with the record's name index or status code overwritten."""
+    raw = bytearray(encode_victim_list([{"phone": "+91", "name": "A", "status": "Active"}], 0.0, 0.0))
+    # header: version, count, lat, lon, name count, len("A"), "A"; record: phone, name index, age, status, ...
+    record = 7
+    if "name_idx" in changes:
+        raw[record + 1] = changes["name_idx"]
+    if "status" in changes:
+        raw[record + 3] = changes["status"]
+    return bytes(raw)
+
+
+@pytest.mark.parametrize("raw", [
+    b"",
+    b"\x02\x00",                 # unknown version
+    b"\x01\x01\x00\x00",         # ends inside the header
+    b"\x01\x00\x00\x00\x01\x05A",  # name longer than the buffer
+    _corrupt_list(name_idx=3),
+    _corrupt_list(status=9),
+])
+def test_decode_victim_list_rejects_corrupt_input(raw):
+    with pytest.raises(ValueError):
+        decode_victim_list(raw)
+
+
+# ---------- segment accounting ----------
+
+@pytest.mark.parametrize("text, segments", [
+    ("", 1),
+    ("a" * 160, 1),
+    ("a" * 161, 2),
+    ("[" * 80, 1),    # extension characters cost two septets
+    ("[" * 81, 2),
+    ("नमस्ते", 1),     # UCS-2
+    ("न" * 71, 2),
+])
+def test_sms_segment_count(text, segments):
+    assert sms_segment_count(text) == segments
@@ -0,0 +1,112 @@
+# tests/test_state_backend.py
+import pytest
+
+from services.state_backend import InProcessTTLMap, SqliteStateBackend, SqliteTTLMap
+from utils.timing_wheel import TimingWheel
+
+
+class FakeClock:
+    def __init__(self, now: float = 1_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+# ---------- timing wheel ----------
+
+def test_wheel_reports_keys_once_their_deadline_passes():
+    wheel = TimingWheel(0.0)
+    wheel.schedule("a", 3.0)
+    wheel.schedule("b", 5.5)
+    assert wheel.advance(2.9) == []
+    assert wheel.advance(3.0) == ["a"]
+    assert wheel.advance(5.0) == []
+    assert wheel.advance(6.0) == ["b"]
+
+
+def test_wheel_deadline_in_the_past_expires_on_the_next_tick():
+    wheel = TimingWheel(100.0)
+    wheel.schedule("late", 50.0)
+    assert wheel.advance(100.5) == []
+    assert wheel.advance(101.0) == ["late"]
+
+
+@pytest.mark.parametrize("delay", [63, 64, 65, 4095, 4096, 64 ** 3 - 1, 64 ** 3 + 10])
+def test_wheel_cascades_across_levels(delay):
+    wheel = TimingWheel(7.0)
+    wheel.schedule("k", 7.0 + delay)
+    assert wheel.advance(7.0 + delay - 1) == []
+    assert wheel.advance(7.0 + delay) == ["k"]
+
+
+def test_wheel_clock_jump_past_the_whole_wheel():
+    wheel = TimingWheel(0.0)
+    wheel.schedule("soon", 10.0)
+    wheel.schedule("far", 64 ** 3 * 3)
+    assert wheel.advance(64 ** 3 + 1) == ["soon"]
+    assert wheel.advance(64 ** 3 * 3) == ["far"]
+
+
+def test_wheel_reports_a_rescheduled_key_twice():
+    wheel = TimingWheel(0.0)
+    wheel.schedule("k", 2.0)
+    wheel.schedule("k", 4.0)
+    assert wheel.advance(2.0) == ["k"]
+    assert wheel.advance(4.0) == ["k"]
+
+
+# ---------- TTL maps ----------
+
+@pytest.fixture(params=["memory", "sqlite"])
+def ttl_map_and_clock(request, tmp_path):
+    clock = FakeClock()
+    if request.param == "memory":
+        return InProcessTTLMap(clock=clock), clock
+    return SqliteTTLMap(SqliteStateBackend(str(tmp_path / "state.db")), "test", clock=clock), clock
+
+
+def test_ttl_map_expires_entries(ttl_map_and_clock):
+    ttl_map, clock = ttl_map_and_clock
+    ttl_map.set("a", {"n": 1}, ttl=10)
+    ttl_map.set("b", {"n": 2}, ttl=30)
+    clock.now += 9.5
+    assert ttl_map.get("a") == {"n": 1}
+    assert len(ttl_map) == 2
+    clock.now += 1
+    assert ttl_map.get("a") is None
+    assert ttl_map.get("b") == {"n": 2}
+    assert len(ttl_map) == 1
+
+
+def test_ttl_map_set_pushes_out_the_expiry(ttl_map_and_clock):
+    ttl_map, clock = ttl_map_and_clock
+    ttl_map.set("a", 1, ttl=10)
+    clock.now += 8
+    ttl_map.set("a", 2, ttl=10)
+    clock.now += 8
+    assert ttl_map.get("a") == 2
+
+
+def test_ttl_map_delete(ttl_map_and_clock):
+    ttl_map, _ = ttl_map_and_clock
+    ttl_map.set("a", 1, ttl=10)
+    ttl_map.delete("a")
+    ttl_map.delete("missing")
+    assert ttl_map.get("a") is None
+
+
+def test_ttl_map_update_keeps_the_expiry_without_a_ttl(ttl_map_and_clock):
+    ttl_map, clock = ttl_map_and_clock
+    assert ttl_map.update("a", lambda current: (1 if current is None else current + 1, current), ttl=10) is None
+    clock.now += 5
+    assert ttl_map.update("a", lambda current: (current + 1, current)) == 1
+    clock.now += 6
+    assert ttl_map.get("a") is None
+
+
+def test_ttl_map_update_to_none_deletes(ttl_map_and_clock):
+    ttl_map, _ = ttl_map_and_clock
+    ttl_map.set("a", 1, ttl=10)
+    assert ttl_map.update("a", lambda current: (None, "gone")) == "gone"
+    assert ttl_map.get("a") is None
@@ -0,0 +1,16 @@
+import hmac
+
+from fastapi import Header, HTTPException
+
+from config import settings
+
+
+def require_admin(x_admin_token: str | None = Header(None)):
+    """
+    Guards operator endpoints with the shared settings.ADMIN_TOKEN, sent as
+    X-Admin-Token. With no token configured the endpoints do not exist.
+    """
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Admin token required")
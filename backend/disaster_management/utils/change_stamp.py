@@ -0,0 +1,22 @@
+# utils/change_stamp.py
+"""
+This server's clock on every document it writes, for incremental readers.
+
+`updatedAt` is the time of the change as the writer saw it: SMS location
+fixes carry the phone's clock and the apps write their own. Readers that
+resume from a watermark (the location index catch-up, GET /api/changes)
+compare against `syncedAt` instead, which is stamped here, in epoch ms,
+when the write is sent.
+"""
+import time
+
+SYNCED_AT = "syncedAt"
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def stamped(fields: dict) -> dict:
+    """A copy of fields with syncedAt set to now."""
+    return {**fields, SYNCED_AT: now_ms()}
@@ -0,0 +1,56 @@
+import logging
+
+from firebase import db
+from services.metrics import track_firestore
+
+logger = logging.getLogger(__name__)
+
+# Firestore rejects a WriteBatch with more than 500 operations
+MAX_BATCH_WRITES = 500
+
+
+def commit_updates(updates: list, chunk_size: int = MAX_BATCH_WRITES, transient: list | None = None) -> tuple:
+    """
+    Applies a list of (doc_ref, fields) updates using batched writes.
+
+    A batch is atomic, so one missing document fails its whole chunk. When
+    that happens the chunk is replayed one update at a time so every other
+    document still gets written.
+
+    With a `transient` list, updates that fail for any reason other than a
+    missing document are appended to it as (doc_ref, fields) for the caller
+    to retry, instead of being reported as failed.
+
+    Returns:
+        tuple: (number of documents written, list of doc ids that failed)
+    """
+    from google.api_core.exceptions import NotFound
+
+    written = 0
+    failed = []
+    for i in range(0, len(updates), chunk_size):
+        chunk = updates[i:i + chunk_size]
+        batch = db.batch()
+        for doc_ref, fields in chunk:
+            batch.update(doc_ref, fields)
+        try:
+            with track_firestore("batch", "commit"):
+                batch.commit()
+            written += len(chunk)
+            continue
+        except Exception as e:
+            logger.warning("Batch commit failed, retrying updates one by one: %s", e, extra={"fields": {"updates": len(chunk)}})
+
+        for doc_ref, fields in chunk:
+            try:
+                with track_firestore(doc_ref.parent.id, "update"):
+                    doc_ref.update(fields)
+                written += 1
+            except NotFound:
+                failed.append(doc_ref.id)
+            except Exception:
+                if transient is None:
+                    failed.append(doc_ref.id)
+                else:
+                    transient.append((doc_ref, fields))
+    return written, failed
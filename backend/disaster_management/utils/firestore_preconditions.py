@@ -0,0 +1,41 @@
+from firebase import db
+
+
+class WriteConflict(Exception):
+    """The document changed between the read and the conditional write."""
+
+
+def merge_update(data: dict, fields: dict) -> dict:
+    """
+    Applies an update() field map to a local copy of the document, the way
+    Firestore applies it on the server, including dotted field paths.
+    """
+    merged = dict(data)
+    for path, value in fields.items():
+        target = merged
+        *parents, leaf = path.split(".")
+        for part in parents:
+            child = target.get(part)
+            child = dict(child) if isinstance(child, dict) else {}
+            target[part] = child
+            target = child
+        target[leaf] = value
+    return merged
+
+
+def update_if_unchanged(doc_ref, snapshot, fields: dict) -> dict:
+    """
+    Updates a document only if it still matches a snapshot read earlier,
+    and returns the merged state without reading it back.
+
+    Raises WriteConflict if someone else wrote the document in between.
+    """
+    # imported here so loading this module does not pull in google-api-core
+    from google.api_core.exceptions import FailedPrecondition, NotFound
+
+    option = db.write_option(last_update_time=snapshot.update_time)
+    try:
+        doc_ref.update(fields, option=option)
+    except (FailedPrecondition, NotFound) as e:
+        raise WriteConflict(str(e)) from e
+    return merge_update(snapshot.to_dict(), fields)
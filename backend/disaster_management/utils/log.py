@@ -0,0 +1,126 @@
+"""
+Structured, non-blocking logging.
+
+Handlers never write on the calling thread: records go onto a queue and a
+listener thread formats and writes them, so a slow stdout or log collector
+cannot stall a request or the event loop. Levels are set per module with
+settings.LOG_LEVELS (e.g. "routers.sms=DEBUG,services=WARNING"), and
+per-record debug output goes through `log_sampled`, which is rate-limited
+per call site so its cost stays constant however many records a request
+touches.
+
+Extra fields passed as `extra={"fields": {...}}` are rendered as key=value
+pairs, or as JSON keys with LOG_FORMAT="json".
+"""
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+
+from config import settings
+
+_listener = None
+
+
+class StructuredFormatter(logging.Formatter):
+    def __init__(self, as_json: bool):
+        super().__init__()
+        self.as_json = as_json
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = getattr(record, "fields", None) or {}
+        if self.as_json:
+            entry = {
+                "ts": round(record.created, 3),
+                "level": record.levelname,
+                "logger": record.name,
+                "msg": record.getMessage(),
+                **fields,
+            }
+            if record.exc_info:
+                entry["exc"] = self.formatException(record.exc_info)
+            return json.dumps(entry, default=str)
+        line = f"{self.formatTime(record)} {record.levelname:<7} {record.name}: {record.getMessage()}"
+        if fields:
+            line += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+def _parse_levels(spec: str) -> dict:
+    levels = {}
+    for item in spec.split(","):
+        if "=" in item:
+            name, level = item.split("=", 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging():
+    """Routes every logger through one queue to a background writer. Safe to call twice."""
+    global _listener
+    if _listener is not None:
+        return
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(StructuredFormatter(settings.LOG_FORMAT == "json"))
+    records = queue.SimpleQueue()
+    _listener = logging.handlers.QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+
+    root = logging.getLogger()
+    root.handlers[:] = [logging.handlers.QueueHandler(records)]
+    root.setLevel(settings.LOG_LEVEL.upper())
+    for name, level in _parse_levels(settings.LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+
+def stop_logging():
+    """Flushes queued records; called on shutdown."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated", "suppressed")
+
+    def __init__(self, burst: float, now: float):
+        self.tokens = burst
+        self.updated = now
+        self.suppressed = 0
+
+
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+
+def log_sampled(logger: logging.Logger, level: int, key: str, msg: str, *args, fields: dict | None = None):
+    """
+    Logs at most settings.LOG_SAMPLE_PER_SECOND records per second for `key`
+    (with a burst of the same size). Dropped records are counted and reported
+    as `suppressed=` on the next one that goes out. Costs one level check when
+    the level is disabled.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    rate = settings.LOG_SAMPLE_PER_SECOND
+    now = time.monotonic()
+    with _buckets_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            bucket = _buckets[key] = _Bucket(rate, now)
+        bucket.tokens = min(rate, bucket.tokens + (now - bucket.updated) * rate)
+        bucket.updated = now
+        if bucket.tokens < 1:
+            bucket.suppressed += 1
+            return
+        bucket.tokens -= 1
+        suppressed, bucket.suppressed = bucket.suppressed, 0
+    if suppressed:
+        fields = {**(fields or {}), "suppressed": suppressed}
+    logger.log(level, msg, *args, extra={"fields": fields} if fields else None)
@@ -0,0 +1,89 @@
+import base64
+import json
+from datetime import datetime, timedelta, timezone
+from typing import NamedTuple
+
+from fastapi import HTTPException, Query
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from config import settings
+from utils.serialization import model_list_response
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+# Firestore Timestamps come back as datetimes, which JSON has no type for: in a cursor
+# they are {"$ts": epoch µs}, so start_after gets a datetime back and not its text
+_TIMESTAMP_TAG = "$ts"
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return {_TIMESTAMP_TAG: (value - _EPOCH) // timedelta(microseconds=1)}
+    raise TypeError(f"{type(value).__name__} cannot be a cursor value")
+
+
+def _decode_value(value):
+    if isinstance(value, dict) and len(value) == 1 and isinstance(value.get(_TIMESTAMP_TAG), int):
+        return _EPOCH + timedelta(microseconds=value[_TIMESTAMP_TAG])
+    return value
+
+
+def encode_cursor(values: list) -> str:
+    """Opaque page cursor: the last document's order-by values and id."""
+    raw = json.dumps(values, separators=(",", ":"), default=_encode_value).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, expected_len: int) -> list:
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, OverflowError):
+        raise HTTPException(status_code=400, detail="Invalid page cursor")
+    if not isinstance(values, list) or len(values) != expected_len:
+        raise HTTPException(status_code=400, detail="Invalid page cursor")
+    try:
+        return [_decode_value(value) for value in values]
+    except OverflowError:
+        raise HTTPException(status_code=400, detail="Invalid page cursor")
+
+
+class PageParams(NamedTuple):
+    limit: int
+    after: str | None
+    fields: list | None
+
+
+def page_params(
+    limit: int = Query(settings.DEFAULT_PAGE_SIZE, ge=1, le=settings.MAX_PAGE_SIZE,
+                       description="Maximum number of items to return"),
+    after: str | None = Query(None, description=f"Cursor from the previous page's {NEXT_CURSOR_HEADER} header"),
+    fields: str | None = Query(None, description="Comma-separated fields to return for each item"),
+) -> PageParams:
+    selected = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    return PageParams(limit, after, selected or None)
+
+
+def project(item: dict, fields: list | None) -> dict:
+    """Trims an item to the requested fields (no-op without a projection)."""
+    return {field: item[field] for field in fields if field in item} if fields else item
+
+
+def page_response(response, items: list, next_cursor: str | None, params: PageParams, model=None):
+    """
+    Returns a page of items. The body stays a plain list; the next cursor
+    goes in the X-Next-Cursor header. Projected pages bypass the endpoint's
+    response model, since they deliberately omit required fields; with a
+    `model`, full pages are encoded in one pass by model_list_response.
+    """
+    if params.fields:
+        response = JSONResponse(jsonable_encoder(items))
+    elif model is not None:
+        response = model_list_response(model, items)
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return response if params.fields or model is not None else items
@@ -0,0 +1,52 @@
+import re
+
+from config import settings
+
+_SEPARATORS = re.compile(r"[\s\-().]")
+
+
+def normalize_phone(raw, default_country_code: str | None = None) -> str | None:
+    """
+    Normalizes a phone number to E.164 ("+<country code><number>").
+
+    Handles the shapes we see from gateways and forms: "+91 98765-43210",
+    "0091...", "919876543210", "09876543210" and bare 10-digit national
+    numbers (which get the default country code). Returns None when the
+    input cannot be a valid E.164 number.
+    """
+    if raw is None:
+        return None
+    country = default_country_code or settings.DEFAULT_COUNTRY_CODE
+    text = _SEPARATORS.sub("", str(raw))
+
+    if text.startswith("+"):
+        digits = text[1:]
+    elif text.startswith("00"):
+        digits = text[2:]
+    elif len(text) == 11 and text.startswith("0"):
+        # trunk prefix + national number
+        digits = country + text[1:]
+    elif len(text) == 10:
+        digits = country + text
+    else:
+        digits = text
+
+    if not digits.isdigit() or digits.startswith("0") or not 8 <= len(digits) <= 15:
+        return None
+    return "+" + digits
+
+
+def phone_spellings(raw, default_country_code: str | None = None) -> list:
+    """
+    The ways the same number is commonly stored: as received, E.164, E.164
+    without '+', and the national number. For equality queries on phone
+    fields written before numbers were normalized.
+    """
+    country = default_country_code or settings.DEFAULT_COUNTRY_CODE
+    spellings = [str(raw)] if raw is not None else []
+    normalized = normalize_phone(raw, country)
+    if normalized:
+        spellings += [normalized, normalized[1:]]
+        if normalized[1:].startswith(country):
+            spellings.append(normalized[1 + len(country):])
+    return list(dict.fromkeys(spellings))
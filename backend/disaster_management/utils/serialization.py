@@ -0,0 +1,104 @@
+"""
+Response serialization.
+
+Responses are encoded with orjson when it is installed. List endpoints
+build their JSON with `model_list_response`, which validates and encodes
+a whole list in one pass through a cached TypeAdapter instead of building
+a model per record and letting `response_model` validate it again. With
+settings.TRUST_FIRESTORE_DATA the validation is skipped: each document is
+only reshaped to the model's output keys before encoding.
+"""
+import json
+from datetime import date, datetime
+from functools import lru_cache
+
+from fastapi import Response
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import TypeAdapter
+
+from config import settings
+
+try:
+    import orjson
+except ImportError:  # the stdlib encoder is used instead
+    orjson = None
+
+DefaultResponse = ORJSONResponse if orjson else JSONResponse
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    # Firestore GeoPoint
+    if hasattr(value, "latitude") and hasattr(value, "longitude"):
+        return {"latitude": value.latitude, "longitude": value.longitude}
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json", by_alias=True)
+    return str(value)
+
+
+def dumps(value) -> bytes:
+    if orjson:
+        return orjson.dumps(value, default=_default)
+    return json.dumps(value, default=_default, separators=(",", ":")).encode()
+
+
+@lru_cache(maxsize=None)
+def list_adapter(model) -> TypeAdapter:
+    return TypeAdapter(list[model])
+
+
+@lru_cache(maxsize=None)
+def _output_fields(model) -> tuple:
+    """(output key, field name, default) for each field, in declaration order."""
+    return tuple(
+        (field.alias or name, name, field.get_default(call_default_factory=True))
+        for name, field in model.model_fields.items()
+    )
+
+
+def shape(model, row: dict) -> dict:
+    """
+    Reshapes a trusted document to the model's output keys without
+    validating it. Missing fields take their defaults; nested values are
+    passed through as stored.
+    """
+    out = {}
+    for key, name, default in _output_fields(model):
+        if key in row:
+            out[key] = row[key]
+        else:
+            out[key] = row.get(name, default)
+    return out
+
+
+@lru_cache(maxsize=None)
+def item_adapter(model) -> TypeAdapter:
+    return TypeAdapter(model)
+
+
+def _trusted(trusted: bool | None) -> bool:
+    return settings.TRUST_FIRESTORE_DATA if trusted is None else trusted
+
+
+def encode_list(model, items: list, trusted: bool | None = None) -> bytes:
+    if _trusted(trusted):
+        return dumps([shape(model, item) for item in items])
+    adapter = list_adapter(model)
+    return adapter.dump_json(adapter.validate_python(items), by_alias=True)
+
+
+def encode_item(model, item, trusted: bool | None = None) -> bytes:
+    if _trusted(trusted):
+        return dumps(shape(model, item))
+    adapter = item_adapter(model)
+    return adapter.dump_json(adapter.validate_python(item), by_alias=True)
+
+
+def model_list_response(model, items: list, trusted: bool | None = None) -> Response:
+    """
+    JSON response for a list of documents (dicts or `model` instances).
+    The endpoint's response_model is bypassed, so the items are validated
+    once here (or not at all for trusted data).
+    """
+    return Response(encode_list(model, items, trusted), media_type="application/json")
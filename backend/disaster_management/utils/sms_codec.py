@@ -0,0 +1,424 @@
+# utils/sms_codec.py
+"""
+Compact binary frames carried inside SMS text.
+
+Inbound location frame (victim/rescuer apps -> gateway -> /api/receive_sms):
+
+    "DL1:" + base64( header | fix | fix | ... )
+
+    header  >BI   opcode (1 byte), base timestamp in epoch seconds (4 bytes)
+    fix     >iiBH latitude and longitude in 1e-5 degrees (4 + 4 bytes),
+                  battery percent, 255 = unknown (1 byte),
+                  seconds after the base timestamp (2 bytes)
+
+A fix costs 11 bytes, so one 160-character SMS carries up to 10 buffered
+fixes instead of a single verbose JSON update.
+
+Outbound victim list (server -> rescuer phone), see encode_victim_list:
+
+    header  version, victim count, origin lat/lon, name table
+    record  phone, name index, age, status code, lat/lon delta
+
+All integers are varints (coordinates zigzag-encoded deltas in 1e-5
+degrees). The base64 text is split into numbered SMS that each fit a single
+160-character GSM-7 segment.
+"""
+import base64
+import logging
+import math
+import struct
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+COMPACT_PREFIX = "DL1:"
+
+# opcodes
+OP_VICTIM_LOCATION = 0x01
+OP_RESCUER_LOCATION = 0x02
+OP_SOS = 0x03
+
+COORD_SCALE = 100_000  # 1e-5 degrees, about 1.1 m at the equator
+BATTERY_UNKNOWN = 255
+MAX_FRAME_SPAN_SECONDS = 0xFFFF  # the 2-byte offset from the base timestamp
+
+_HEADER = struct.Struct(">BI")
+_FIX = struct.Struct(">iiBH")
+
+
+class LocationFix(NamedTuple):
+    latitude: float
+    longitude: float
+    battery: int | None
+    timestamp: int  # epoch seconds
+
+
+def b64encode_compact(raw: bytes) -> str:
+    """Base64 without '=' padding; every character is in the GSM-7 basic set."""
+    return base64.b64encode(raw).decode("ascii").rstrip("=")
+
+
+def b64decode_compact(text: str) -> bytes:
+    return base64.b64decode(text + "=" * (-len(text) % 4), validate=True)
+
+
+def encode_location_frame(opcode: int, fixes: list) -> str:
+    """
+    Encodes LocationFix records into SMS text. Timestamps are stored as
+    deltas from the earliest fix, so fixes must span less than 18 hours.
+
+    Raises:
+        ValueError: with no fixes, or when they do not fit the frame's fields.
+    """
+    if not fixes:
+        raise ValueError("A location frame needs at least one fix")
+    base_ts = min(f.timestamp for f in fixes)
+    span = max(f.timestamp for f in fixes) - base_ts
+    if span > MAX_FRAME_SPAN_SECONDS:
+        raise ValueError(f"Fixes span {span} s, more than the {MAX_FRAME_SPAN_SECONDS} s one frame can carry")
+    if not 0 <= base_ts <= 0xFFFFFFFF:
+        raise ValueError(f"Timestamp {base_ts} does not fit a location frame")
+    if not 0 <= opcode <= 0xFF:
+        raise ValueError(f"Opcode {opcode} does not fit a location frame")
+    parts = [_HEADER.pack(opcode, base_ts)]
+    for fix in fixes:
+        battery = BATTERY_UNKNOWN if fix.battery is None else max(0, min(int(fix.battery), 254))
+        try:
+            parts.append(_FIX.pack(
+                round(fix.latitude * COORD_SCALE),
+                round(fix.longitude * COORD_SCALE),
+                battery,
+                fix.timestamp - base_ts,
+            ))
+        except struct.error as e:
+            raise ValueError(f"Fix does not fit a location frame: {e}")
+    return COMPACT_PREFIX + b64encode_compact(b"".join(parts))
+
+
+def find_compact_frame(msg: str) -> str | None:
+    """
+    Returns the base64 body of a compact frame in an SMS, or None for legacy
+    JSON and free-text messages. A frame is the whole message, so the prefix
+    only counts at its start.
+    """
+    text = msg.strip()
+    if not text.startswith(COMPACT_PREFIX):
+        return None
+    body = text[len(COMPACT_PREFIX):].split(None, 1)
+    return body[0] if body else ""
+
+
+def iter_fixes(raw: bytes, base_ts: int):
+    """
+    Yields LocationFix records straight out of the decoded buffer without slicing copies.
+
+    Raises:
+        ValueError: if the buffer ends part-way through a fix.
+    """
+    view = memoryview(raw)[_HEADER.size:]
+    if len(view) % _FIX.size:
+        raise ValueError(f"Compact frame ends with a truncated fix ({len(view) % _FIX.size} of {_FIX.size} bytes)")
+    for lat, lon, battery, dt in _FIX.iter_unpack(view):
+        yield LocationFix(
+            lat / COORD_SCALE,
+            lon / COORD_SCALE,
+            None if battery == BATTERY_UNKNOWN else battery,
+            base_ts + dt,
+        )
+
+
+def decode_location_frame(body: str) -> tuple:
+    """
+    Decodes the base64 body of a compact frame.
+
+    Returns:
+        tuple: (opcode, list of LocationFix)
+
+    Raises:
+        ValueError: if the body is not valid base64, is too short or ends
+        part-way through a fix.
+    """
+    try:
+        raw = b64decode_compact(body)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid compact frame encoding: {e}")
+    if len(raw) < _HEADER.size:
+        raise ValueError("Compact frame is shorter than its header")
+    opcode, base_ts = _HEADER.unpack_from(raw)
+    return opcode, list(iter_fixes(raw, base_ts))
+
+
+# ---------- SMS segment accounting ----------
+
+GSM7_BASIC = set(
+    "@£$¥èéùìòÇ\nØø\rÅåΔ_ΦΓΛΩΠΨΣΘΞÆæßÉ !\"#¤%&'()*+,-./0123456789:;<=>?"
+    "¡ABCDEFGHIJKLMNOPQRSTUVWXYZÄÖÑÜ§¿abcdefghijklmnopqrstuvwxyzäöñüà"
+)
+GSM7_EXTENSION = set("^{}\\[~]|€\f")  # each costs two septets
+
+SMS_SINGLE_GSM7 = 160
+SMS_SEGMENT_GSM7 = 153  # per part once a message is concatenated
+SMS_SINGLE_UCS2 = 70
+SMS_SEGMENT_UCS2 = 67
+
+
+def sms_segment_count(text: str) -> int:
+    """Number of SMS segments a carrier bills for this text."""
+    if all(c in GSM7_BASIC or c in GSM7_EXTENSION for c in text):
+        length = len(text) + sum(1 for c in text if c in GSM7_EXTENSION)
+        single, segment = SMS_SINGLE_GSM7, SMS_SEGMENT_GSM7
+    else:
+        length = len(text.encode("utf-16-le")) // 2
+        single, segment = SMS_SINGLE_UCS2, SMS_SEGMENT_UCS2
+    if length <= single:
+        return 1
+    return math.ceil(length / segment)
+
+
+# ---------- varints ----------
+
+def zigzag(n: int) -> int:
+    return (n << 1) ^ (n >> 63)
+
+
+def unzigzag(n: int) -> int:
+    return (n >> 1) ^ -(n & 1)
+
+
+def write_varint(out: bytearray, n: int):
+    """Appends an unsigned LEB128 varint."""
+    if n < 0:
+        raise ValueError("varint must be non-negative")
+    while n >= 0x80:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def read_varint(buf, pos: int) -> tuple:
+    """Reads a varint at pos. Returns (value, next position)."""
+    result = 0
+    shift = 0
+    while True:
+        if pos >= len(buf):
+            raise ValueError("Truncated varint")
+        b = buf[pos]
+        pos += 1
+        result |= (b & 0x7F) << shift
+        if not b & 0x80:
+            return result, pos
+        shift += 7
+
+
+# ---------- victim list ----------
+
+VICTIM_LIST_VERSION = 1
+VICTIM_LIST_TAG = "DL2"
+STATUS_CODES = ("Unknown", "Active", "Needs Help", "Critical")
+_STATUS_INDEX = {status: i for i, status in enumerate(STATUS_CODES)}
+
+# base64 alphabet doubles as the digit set for segment numbers
+_SEGMENT_DIGITS = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+
+
+def _phone_to_int(phone) -> int:
+    digits = "".join(c for c in str(phone or "") if c.isdigit())
+    return int(digits) if digits else 0
+
+
+def encode_victim_list(victims: list, origin_lat: float, origin_lon: float) -> bytes:
+    """
+    Packs victims into the compact binary list format.
+
+    Expected keys for each victim dict (all optional):
+        phone, name, age, status, latitude, longitude
+    Coordinates are stored as deltas from the previous victim, the first
+    one from the origin (usually the team's assigned location).
+    """
+    names = {}
+    records = bytearray()
+    prev_lat = round(origin_lat * COORD_SCALE)
+    prev_lon = round(origin_lon * COORD_SCALE)
+    for victim in victims:
+        name = victim.get("name") or ""
+        name_idx = names.setdefault(name, len(names))
+        lat = victim.get("latitude")
+        lon = victim.get("longitude")
+        q_lat = prev_lat if lat is None else round(lat * COORD_SCALE)
+        q_lon = prev_lon if lon is None else round(lon * COORD_SCALE)
+
+        write_varint(records, _phone_to_int(victim.get("phone")))
+        write_varint(records, name_idx)
+        write_varint(records, max(0, int(victim.get("age") or 0)))
+        write_varint(records, _STATUS_INDEX.get(victim.get("status"), 0))
+        write_varint(records, zigzag(q_lat - prev_lat))
+        write_varint(records, zigzag(q_lon - prev_lon))
+        prev_lat, prev_lon = q_lat, q_lon
+
+    out = bytearray([VICTIM_LIST_VERSION])
+    write_varint(out, len(victims))
+    write_varint(out, zigzag(round(origin_lat * COORD_SCALE)))
+    write_varint(out, zigzag(round(origin_lon * COORD_SCALE)))
+    write_varint(out, len(names))
+    for name in names:  # dicts keep insertion order, matching the indexes
+        encoded = name.encode("utf-8")
+        write_varint(out, len(encoded))
+        out += encoded
+    out += records
+    return bytes(out)
+
+
+def decode_victim_list(raw: bytes) -> list:
+    """
+    Inverse of encode_victim_list. Phones come back as '+<digits>'.
+
+    Raises:
+        ValueError: for an unknown version or a truncated or corrupt list.
+    """
+    buf = memoryview(raw)
+    if not buf or buf[0] != VICTIM_LIST_VERSION:
+        raise ValueError("Unsupported victim list version")
+    pos = 1
+    count, pos = read_varint(buf, pos)
+    lat, pos = read_varint(buf, pos)
+    lon, pos = read_varint(buf, pos)
+    lat, lon = unzigzag(lat), unzigzag(lon)
+
+    name_count, pos = read_varint(buf, pos)
+    names = []
+    for _ in range(name_count):
+        length, pos = read_varint(buf, pos)
+        if pos + length > len(buf):
+            raise ValueError("Truncated victim list name")
+        names.append(bytes(buf[pos:pos + length]).decode("utf-8"))
+        pos += length
+
+    victims = []
+    for _ in range(count):
+        phone, pos = read_varint(buf, pos)
+        name_idx, pos = read_varint(buf, pos)
+        age, pos = read_varint(buf, pos)
+        status, pos = read_varint(buf, pos)
+        d_lat, pos = read_varint(buf, pos)
+        d_lon, pos = read_varint(buf, pos)
+        if name_idx >= len(names):
+            raise ValueError(f"Victim list name index {name_idx} is out of range")
+        if status >= len(STATUS_CODES):
+            raise ValueError(f"Unknown victim list status code {status}")
+        lat += unzigzag(d_lat)
+        lon += unzigzag(d_lon)
+        victims.append({
+            "phone": f"+{phone}" if phone else None,
+            "name": names[name_idx],
+            "age": age,
+            "status": STATUS_CODES[status],
+            "latitude": lat / COORD_SCALE,
+            "longitude": lon / COORD_SCALE,
+        })
+    return victims
+
+
+def split_into_sms(payload: str, prefix: str = "") -> list:
+    """
+    Splits base64 text into the fewest numbered messages that each fit one
+    160-character GSM-7 segment: prefix + "DL2" + seq digit + total digit + chunk.
+
+    Standalone numbered messages carry more payload than carrier
+    concatenation (153 characters per part) and reassemble in any order.
+    """
+    header_len = len(prefix) + len(VICTIM_LIST_TAG) + 2
+    room = SMS_SINGLE_GSM7 - header_len
+    if room <= 0:
+        raise ValueError("Prefix leaves no room for payload")
+    total = max(1, math.ceil(len(payload) / room))
+    if total > len(_SEGMENT_DIGITS):
+        raise ValueError(f"Payload needs {total} messages, more than the {len(_SEGMENT_DIGITS)} supported")
+    return [
+        f"{prefix}{VICTIM_LIST_TAG}{_SEGMENT_DIGITS[i]}{_SEGMENT_DIGITS[total - 1]}{payload[i * room:(i + 1) * room]}"
+        for i in range(total)
+    ]
+
+
+def join_sms(messages: list) -> str:
+    """Reassembles split_into_sms output received in any order (prefixes may differ)."""
+    parts = {}
+    total = None
+    for msg in messages:
+        start = msg.find(VICTIM_LIST_TAG)
+        if start == -1:
+            raise ValueError("Message is not a victim list segment")
+        head = start + len(VICTIM_LIST_TAG)
+        if len(msg) < head + 2:
+            raise ValueError("Victim list segment is missing its sequence number")
+        seq = _SEGMENT_DIGITS.index(msg[head])
+        total = _SEGMENT_DIGITS.index(msg[head + 1]) + 1
+        parts[seq] = msg[head + 2:]
+    if total is None or len(parts) != total:
+        raise ValueError("Missing victim list segments")
+    return "".join(parts[i] for i in range(total))
+
+
+def encode_victim_list_sms(victims: list, origin_lat: float, origin_lon: float, prefix: str = "") -> list:
+    """Encodes a victim list into ready-to-send SMS texts."""
+    return split_into_sms(b64encode_compact(encode_victim_list(victims, origin_lat, origin_lon)), prefix)
+
+
+def decode_victim_list_sms(messages: list) -> list:
+    return decode_victim_list(b64decode_compact(join_sms(messages)))
+
+
+# ---------- legacy outbound format ----------
+
+def pack_victims_to_binary_base64(victim_list: list) -> str:
+    """
+    Packs a list of victim dictionaries into a compact binary format and
+    encodes it as a Base64 string for sending via SMS.
+    
+    Expected format for each victim dict:
+    {
+        "phone": "123456789012",  # String of 12 digits
+        "name": "JaneDoe",
+        "age": 30
+    }
+    """
+    all_packed_records = []
+
+    for victim in victim_list:
+        # --- 1. Safely extract and sanitize data ---
+        # Convert the phone string to an integer. Default to 0 if missing/invalid.
+        try:
+            phone_int = int(victim.get("phone", 0))
+        except (ValueError, TypeError):
+            phone_int = 0
+            
+        # Get the name. Default to an empty string if missing.
+        name_str = victim.get("name", "")
+        
+        # Get the age. Default to 0 if missing.
+        age_int = victim.get("age", 0)
+
+        # --- 2. Encode the name and get its length ---
+        name_bytes = name_str.encode('utf-8')
+        name_length = len(name_bytes)
+        
+        # --- 3. Define the binary format for this record ---
+        # > = Big-Endian (network standard)
+        # Q = Unsigned long long (8 bytes) for the phone number
+        # B = Unsigned char (1 byte) for the name length
+        # {name_length}s = The variable-length name string itself
+        # B = Unsigned char (1 byte) for the age
+        format_string = f'> Q B {name_length}s B'
+
+        # --- 4. Pack the data into a binary chunk ---
+        try:
+            packed_record = struct.pack(format_string, phone_int, name_length, name_bytes, age_int)
+            all_packed_records.append(packed_record)
+        except struct.error as e:
+            logger.warning("Skipping victim record due to packing error: %s", e, extra={"fields": {"phone": victim.get("phone")}})
+            continue
+
+    # --- 5. Join all chunks and encode to Base64 ---
+    final_payload_bytes = b"".join(all_packed_records)
+    final_payload_base64 = base64.b64encode(final_payload_bytes).decode('utf-8')
+    
+    return final_payload_base64
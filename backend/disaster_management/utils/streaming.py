@@ -0,0 +1,64 @@
+from fastapi import Query, Request
+from fastapi.responses import StreamingResponse
+
+from utils.serialization import dumps, encode_item
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+# rows are written out in chunks of about this size rather than one send per row
+CHUNK_BYTES = 64 * 1024
+
+
+def stream_format(
+    request: Request,
+    stream: bool = Query(False, description="Stream the full result set as a chunked JSON array"),
+) -> str | None:
+    """
+    "ndjson" when the client accepts application/x-ndjson, "json" for
+    ?stream=true, otherwise None (a normal paginated response).
+    """
+    if NDJSON_MEDIA_TYPE in request.headers.get("accept", ""):
+        return "ndjson"
+    return "json" if stream else None
+
+
+def encode_row(row) -> bytes:
+    """Encodes one row; pydantic models keep their aliases, as the response models do."""
+    if hasattr(row, "model_dump_json"):
+        return row.model_dump_json(by_alias=True).encode()
+    return dumps(row)
+
+
+async def _chunks(rows, fmt: str, model):
+    opened = fmt != "json"
+    buffer = []
+    size = 0
+    async for row in rows:
+        encoded = encode_item(model, row) if model is not None else encode_row(row)
+        if fmt == "ndjson":
+            encoded += b"\n"
+        elif not opened:
+            encoded = b"[" + encoded
+            opened = True
+        else:
+            encoded = b"," + encoded
+        buffer.append(encoded)
+        size += len(encoded)
+        if size >= CHUNK_BYTES:
+            yield b"".join(buffer)
+            buffer, size = [], 0
+    if fmt == "json":
+        buffer.append(b"]" if opened else b"[]")
+    if buffer:
+        yield b"".join(buffer)
+
+
+def streaming_response(rows, fmt: str, model=None) -> StreamingResponse:
+    """
+    Streams an async iterable of dicts (or pydantic models) as NDJSON or a
+    JSON array. Each row is encoded as it arrives, so memory stays flat and
+    the first bytes go out before the whole collection has been read.
+    With a `model`, rows are encoded through it like a list response.
+    """
+    media_type = NDJSON_MEDIA_TYPE if fmt == "ndjson" else "application/json"
+    return StreamingResponse(_chunks(rows, fmt, model), media_type=media_type)
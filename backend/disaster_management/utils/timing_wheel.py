@@ -0,0 +1,88 @@
+import math
+
+
+class TimingWheel:
+    """
+    Hierarchical timing wheel.
+
+    Level 0 has `slots` buckets of one tick each, level 1 buckets span
+    `slots` ticks, and so on. Scheduling is O(1); advancing the clock costs
+    O(1) per elapsed tick plus the keys that expire or cascade down a level.
+    With the defaults (1 s ticks, 64 slots, 3 levels) deadlines up to ~3
+    days out are tracked exactly; later ones wait in an overflow bucket.
+
+    The wheel only reports keys whose deadline passed. A key scheduled
+    twice is reported twice, so callers should check their own record
+    before acting on it.
+    """
+
+    def __init__(self, now: float, tick: float = 1.0, slots: int = 64, levels: int = 3):
+        self.tick = tick
+        self.slots = slots
+        self.levels = levels
+        self._spans = [slots ** level for level in range(levels + 1)]
+        self._wheels = [[{} for _ in range(slots)] for _ in range(levels)]
+        self._overflow = {}  # key -> deadline tick, beyond the top level's range
+        self._current = int(now // tick)
+
+    def _place(self, key, deadline: int):
+        for level in range(self.levels):
+            # a level can hold the key once it shares every higher digit with the current tick
+            if deadline // self._spans[level + 1] == self._current // self._spans[level + 1]:
+                index = (deadline // self._spans[level]) % self.slots
+                self._wheels[level][index][key] = deadline
+                return
+        self._overflow[key] = deadline
+
+    def schedule(self, key, when: float):
+        """Schedules key to expire at time `when` (same clock as `advance`)."""
+        deadline = max(math.ceil(when / self.tick), self._current + 1)
+        self._place(key, deadline)
+
+    def advance(self, now: float) -> list:
+        """Moves the clock to `now` and returns the keys that expired."""
+        target = int(now // self.tick)
+        expired = []
+        if target - self._current >= self._spans[self.levels]:
+            # clock jumped past the whole wheel; re-bucket everything in one pass
+            return self._rebuild(target)
+
+        while self._current < target:
+            self._current += 1
+            # cascade from the highest level whose boundary we just crossed
+            for level in range(self.levels - 1, 0, -1):
+                if self._current % self._spans[level]:
+                    continue
+                if level == self.levels - 1 and self._overflow:
+                    pending, self._overflow = self._overflow, {}
+                    for key, deadline in pending.items():
+                        self._place(key, deadline)
+                index = (self._current // self._spans[level]) % self.slots
+                bucket, self._wheels[level][index] = self._wheels[level][index], {}
+                for key, deadline in bucket.items():
+                    self._place(key, deadline)
+
+            index = self._current % self.slots
+            bucket, self._wheels[0][index] = self._wheels[0][index], {}
+            for key, deadline in bucket.items():
+                if deadline <= self._current:
+                    expired.append(key)
+                else:
+                    self._place(key, deadline)
+        return expired
+
+    def _rebuild(self, target: int) -> list:
+        entries = list(self._overflow.items())
+        self._overflow = {}
+        for level in self._wheels:
+            for bucket in level:
+                entries.extend(bucket.items())
+                bucket.clear()
+        self._current = target
+        expired = []
+        for key, deadline in entries:
+            if deadline <= target:
+                expired.append(key)
+            else:
+                self._place(key, deadline)
+        return expired